@@ -6,6 +6,6 @@ cd /usr/src/app
 exec 200>/run/lock/update-global-articles.cron.lock
 flock -n 200 || exit 1
 
-supervisorctl -c supervisord.conf stop wp1-update:*
+# The rebuild runs alongside the project updates, which write their changes to
+# the rebuilt table too.
 python update-global-articles.py
-supervisorctl -c supervisord.conf start wp1-update:*
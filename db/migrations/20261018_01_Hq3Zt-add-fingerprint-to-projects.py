@@ -0,0 +1,12 @@
+"""
+Add fingerprint to projects
+"""
+
+from yoyo import step
+
+__depends__ = {'20210813_02_g8XdS-fix-selections-timestamp-columns'}
+
+steps = [
+    step("ALTER TABLE projects ADD COLUMN (p_fingerprint VARBINARY(40))",
+         "ALTER TABLE projects DROP COLUMN p_fingerprint")
+]
@@ -0,0 +1,12 @@
+"""
+Add full update timestamp to projects
+"""
+
+from yoyo import step
+
+__depends__ = {'20261018_01_Hq3Zt-add-fingerprint-to-projects'}
+
+steps = [
+    step("ALTER TABLE projects ADD COLUMN (p_full_timestamp BINARY(14))",
+         "ALTER TABLE projects DROP COLUMN p_full_timestamp")
+]
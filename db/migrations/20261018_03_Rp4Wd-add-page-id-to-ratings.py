@@ -0,0 +1,12 @@
+"""
+Add talk page id to ratings
+"""
+
+from yoyo import step
+
+__depends__ = {'20261018_02_Vb8Lm-add-full-timestamp-to-projects'}
+
+steps = [
+    step("ALTER TABLE ratings ADD COLUMN (r_page_id INT(8) UNSIGNED)",
+         "ALTER TABLE ratings DROP COLUMN r_page_id")
+]
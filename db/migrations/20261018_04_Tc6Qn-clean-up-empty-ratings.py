@@ -0,0 +1,19 @@
+"""
+Clean up the empty and NULL ratings written by older project updates
+"""
+
+from yoyo import step
+
+__depends__ = {'20261018_03_Rp4Wd-add-page-id-to-ratings'}
+
+steps = [
+    step("DELETE FROM ratings "
+         "WHERE (r_quality IS NULL OR r_quality = 'NotA-Class') AND "
+         "(r_importance IS NULL OR r_importance = 'NotA-Class')"),
+    step("UPDATE ratings SET r_quality = 'NotA-Class', "
+         "r_quality_timestamp = r_importance_timestamp "
+         "WHERE r_quality IS NULL"),
+    step("UPDATE ratings SET r_importance = 'NotA-Class', "
+         "r_importance_timestamp = r_quality_timestamp "
+         "WHERE r_importance IS NULL"),
+]
@@ -0,0 +1,22 @@
+"""
+Add the project_stats table, with the counts of the existing ratings
+"""
+
+from yoyo import step
+
+__depends__ = {'20261018_04_Tc6Qn-clean-up-empty-ratings'}
+
+steps = [
+    step(
+        "CREATE TABLE project_stats ("
+        "  ps_project VARBINARY(63) NOT NULL,"
+        "  ps_quality VARBINARY(63) NOT NULL,"
+        "  ps_importance VARBINARY(63) NOT NULL,"
+        "  ps_count INT(10) NOT NULL DEFAULT 0,"
+        "  PRIMARY KEY (ps_project, ps_quality, ps_importance)"
+        ")", "DROP TABLE project_stats"),
+    step("INSERT INTO project_stats "
+         "  (ps_project, ps_quality, ps_importance, ps_count) "
+         "SELECT r_project, r_quality, r_importance, COUNT(*) FROM ratings "
+         "GROUP BY r_project, r_quality, r_importance"),
+]
@@ -0,0 +1,20 @@
+"""
+Add the global_stats table, with the counts of the existing global articles
+"""
+
+from yoyo import step
+
+__depends__ = {'20261018_05_Wm2Jd-add-project-stats-table'}
+
+steps = [
+    step(
+        "CREATE TABLE global_stats ("
+        "  gs_quality VARBINARY(63) NOT NULL,"
+        "  gs_importance VARBINARY(63) NOT NULL,"
+        "  gs_count INT(10) NOT NULL DEFAULT 0,"
+        "  PRIMARY KEY (gs_quality, gs_importance)"
+        ")", "DROP TABLE global_stats"),
+    step("INSERT INTO global_stats (gs_quality, gs_importance, gs_count) "
+         "SELECT a_quality, a_importance, COUNT(*) FROM global_articles "
+         "GROUP BY a_quality, a_importance"),
+]
@@ -1,10 +1,19 @@
-import time
 from rq import Queue
 
+from wp1.constants import MATERIALIZE_BURST, MATERIALIZE_RATE_PER_SEC
+from wp1.rate_limit import TokenBucket
+
 
 class RateLimitQueue(Queue):
-  last_dequeue_time = None
-  wait_time_secs = 1
+  """A queue whose jobs are started at a limited rate across all workers.
+
+  Every dequeued job takes a token from a TokenBucket in Redis, named after
+  its queue, so the rate holds however many workers use the queue. Wiki edits
+  are limited where they are made instead, see wp1.api.save_page, so the
+  upload queues don't need this.
+  """
+  rate = MATERIALIZE_RATE_PER_SEC
+  burst = MATERIALIZE_BURST
 
   @classmethod
   def dequeue_any(cls, queues, timeout, connection=None, job_class=None):
@@ -13,12 +22,7 @@ class RateLimitQueue(Queue):
                                      connection=connection,
                                      job_class=job_class)
     if job and queue:
-      cur_time = int(time.time())
-      time_diff = 0
-      if cls.last_dequeue_time is not None:
-        time_diff = cur_time - cls.last_dequeue_time
-      if time_diff <= cls.wait_time_secs:
-        time.sleep(cls.wait_time_secs - time_diff)
-      cls.last_dequeue_time = int(time.time())
-      return job, queue
+      bucket = TokenBucket(queue.connection, 'queue:%s' % queue.name, cls.rate,
+                           cls.burst)
+      bucket.acquire()
     return job, queue
@@ -0,0 +1,24 @@
+import logging
+
+from wp1 import scheduler
+from wp1.redis_db import connect as redis_connect
+
+logger = logging.getLogger(__name__)
+
+try:
+  from wp1.credentials import ENV, CREDENTIALS
+except ImportError:
+  logger.exception('The file credentials.py must be populated manually in '
+                   'order to connect to Redis')
+  raise
+
+
+def main():
+  logging.basicConfig(level=logging.INFO)
+
+  redis = redis_connect()
+  scheduler.run(redis)
+
+
+if __name__ == '__main__':
+  main()
@@ -25,6 +25,13 @@ CREATE TABLE `global_rankings` (
   KEY `gr_type` (`gr_type`,`gr_ranking`)
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1;
 
+CREATE TABLE `global_stats` (
+  `gs_quality` varbinary(63) NOT NULL,
+  `gs_importance` varbinary(63) NOT NULL,
+  `gs_count` int(10) NOT NULL DEFAULT '0',
+  PRIMARY KEY (`gs_quality`,`gs_importance`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1;
+
 CREATE TABLE `logging` (
   `l_project` varbinary(63) NOT NULL,
   `l_namespace` int(10) unsigned NOT NULL,
@@ -71,9 +78,19 @@ CREATE TABLE `projects` (
   `p_icount` int(10) unsigned DEFAULT '0',
   `p_scope` int(10) unsigned NOT NULL DEFAULT '0',
   `p_upload_timestamp` binary(14) DEFAULT NULL,
+  `p_fingerprint` varbinary(40) DEFAULT NULL,
+  `p_full_timestamp` binary(14) DEFAULT NULL,
   PRIMARY KEY (`p_project`)
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1;
 
+CREATE TABLE `project_stats` (
+  `ps_project` varbinary(63) NOT NULL,
+  `ps_quality` varbinary(63) NOT NULL,
+  `ps_importance` varbinary(63) NOT NULL,
+  `ps_count` int(10) NOT NULL DEFAULT '0',
+  PRIMARY KEY (`ps_project`,`ps_quality`,`ps_importance`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1;
+
 CREATE TABLE `ratings` (
   `r_project` varbinary(63) NOT NULL,
   `r_namespace` int(10) unsigned NOT NULL,
@@ -83,6 +100,7 @@ CREATE TABLE `ratings` (
   `r_importance` varbinary(63) DEFAULT NULL,
   `r_importance_timestamp` binary(20) DEFAULT NULL,
   `r_score` int(8) unsigned NOT NULL DEFAULT '0',
+  `r_page_id` int(8) unsigned DEFAULT NULL,
   PRIMARY KEY (`r_project`,`r_namespace`,`r_article`),
   KEY `nstitle` (`r_namespace`,`r_article`(50))
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1;
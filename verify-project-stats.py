@@ -0,0 +1,60 @@
+import argparse
+import logging
+import sys
+
+from wp1.logic import project as logic_project, project_stats as logic_project_stats
+from wp1.wp10_db import connect as wp10_connect
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Compares the stored project_stats of projects with a count '
+      'of their ratings.')
+  parser.add_argument('projects',
+                      nargs='*',
+                      help='The projects to verify, all of them by default')
+  parser.add_argument('--fix',
+                      action='store_true',
+                      help='Rebuild the stats of the projects that differ')
+  args = parser.parse_args()
+
+  logging.basicConfig(level=logging.INFO)
+
+  wp10db = wp10_connect()
+  try:
+    # Project names are stored as bytes.
+    project_names = [n.encode('utf-8') for n in args.projects]
+    if not project_names:
+      project_names = [
+          project.p_project
+          for project in logic_project.list_all_projects(wp10db)
+      ]
+
+    mismatched = 0
+    for project_name in project_names:
+      diff = logic_project_stats.diff_project_stats(wp10db, project_name)
+      if not diff:
+        continue
+
+      mismatched += 1
+      for (quality, importance), (stored, counted) in sorted(diff.items()):
+        logger.warning('%s: %s/%s is stored as %s, counted %s',
+                       project_name.decode('utf-8'), quality.decode('utf-8'),
+                       importance.decode('utf-8'), stored, counted)
+      if args.fix:
+        logic_project_stats.rebuild_project_stats(wp10db, project_name)
+        wp10db.commit()
+
+    logger.info('Verified %s projects, %s had stats that differ',
+                len(project_names), mismatched)
+  finally:
+    wp10db.close()
+
+  if mismatched and not args.fix:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
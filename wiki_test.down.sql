@@ -2,3 +2,4 @@ DROP TABLE IF EXISTS `page`;
 DROP TABLE IF EXISTS `categorylinks`;
 DROP TABLE IF EXISTS `redirect`;
 DROP TABLE IF EXISTS `revision`;
+DROP TABLE IF EXISTS `logging`;
@@ -35,3 +35,13 @@ CREATE TABLE `revision` (
   `rev_content_model`  varbinary(32) DEFAULT NULL,
   `rev_content_format` varbinary(64) DEFAULT NULL
 );
+
+CREATE TABLE `logging` (
+  `log_id` int(10) unsigned NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  `log_type` varbinary(32) NOT NULL DEFAULT '',
+  `log_action` varbinary(32) NOT NULL DEFAULT '',
+  `log_timestamp` binary(14) NOT NULL DEFAULT '19700101000000',
+  `log_namespace` int(11) NOT NULL DEFAULT 0,
+  `log_title` varbinary(255) NOT NULL DEFAULT '',
+  `log_params` blob NOT NULL
+);
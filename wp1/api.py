@@ -1,10 +1,21 @@
 from http.cookiejar import MozillaCookieJar
+import hashlib
 import logging
 import os
+import time
+from urllib.parse import parse_qs
 
 import mwclient
 import requests
 
+from wp1 import redis_db
+from wp1.constants import (EDIT_BURST, EDIT_MAX_ATTEMPTS, EDIT_MAX_LAG_SECS,
+                           EDIT_MAX_RATE_PER_SEC, EDIT_MIN_RATE_PER_SEC,
+                           EDIT_RATE_DECREASE_FACTOR, EDIT_RATE_INCREASE,
+                           EDIT_HASH_TTL_SECS, EDIT_RATE_PER_SEC,
+                           EDIT_RATELIMITED_WAIT_SECS, EDIT_STATS_TTL_SECS)
+from wp1.rate_limit import TokenBucket
+
 logger = logging.getLogger(__name__)
 MW_USER_AGENT = 'WP1.0Bot/3.0. Run by User:Audiodude. Using mwclient/0.9.1'
 
@@ -19,6 +30,190 @@ def get_credentials():
 
 
 site = None
+edit_throttle = None
+edit_hashes = None
+
+# Adds ARGV[3] to the rate in the hash KEYS[1], or multiplies it by ARGV[3] if
+# ARGV[2] is 'decrease', then bounds it to [ARGV[4], ARGV[5]]. The rate is
+# ARGV[1] if it wasn't set. A decrease also extends retry_until to ARGV[7],
+# and is skipped if the previous retry_until is after ARGV[6], the current
+# time, so that the rate is lowered once per backoff. Returns the new rate, as
+# a string.
+_ADAPT_RATE_SCRIPT = '''
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate')) or tonumber(ARGV[1])
+if ARGV[2] == 'decrease' then
+  local retry_until = tonumber(redis.call('HGET', KEYS[1], 'retry_until')) or 0
+  if retry_until <= tonumber(ARGV[6]) then
+    rate = rate * tonumber(ARGV[3])
+  end
+  redis.call('HSET', KEYS[1], 'retry_until',
+             tostring(math.max(retry_until, tonumber(ARGV[7]))))
+else
+  rate = rate + tonumber(ARGV[3])
+end
+rate = math.max(tonumber(ARGV[4]), math.min(tonumber(ARGV[5]), rate))
+redis.call('HSET', KEYS[1], 'rate', tostring(rate))
+return tostring(rate)
+'''
+
+
+class EditThrottle:
+  """Adapts the rate of the wiki edits of all processes to the wiki's load.
+
+  The rate grows additively with every successful edit and shrinks
+  multiplicatively when the wiki answers an edit with replication lag above
+  maxlag, with a Retry-After, or rate limits it. All edits then also wait
+  until the Retry-After has passed, and the rate only shrinks once until
+  then, however many edits were refused. The edits take their tokens from a
+  shared TokenBucket at the current rate.
+
+  The state is shared through the 'edit_throttle' hash in Redis, which also
+  publishes the current rate, the last lag reported by the wiki and the time
+  until which edits wait, see get_status().
+  """
+
+  key = 'edit_throttle'
+
+  def __init__(self, redis):
+    self.redis = redis
+    self.bucket = TokenBucket(redis, 'edits', EDIT_RATE_PER_SEC, EDIT_BURST)
+    self._adapt_rate = redis.register_script(_ADAPT_RATE_SCRIPT)
+
+  @property
+  def rate(self):
+    rate = self.redis.hget(self.key, 'rate')
+    return EDIT_RATE_PER_SEC if rate is None else float(rate)
+
+  def get_status(self):
+    """Returns a dict with the current rate, lag and retry_until."""
+    status = self.redis.hgetall(self.key)
+    return {
+        'rate': float(status.get(b'rate', EDIT_RATE_PER_SEC)),
+        'lag': float(status.get(b'lag', 0)),
+        'retry_until': float(status.get(b'retry_until', 0)),
+    }
+
+  def wait(self):
+    """Waits until an edit can be made, at the current rate."""
+    retry_until = self.get_status()['retry_until']
+    now = time.time()
+    if retry_until > now:
+      logger.info('Waiting %.1fs before editing, as asked by the wiki',
+                  retry_until - now)
+      time.sleep(retry_until - now)
+
+    self.bucket.rate = self.rate
+    self.bucket.acquire()
+
+  def on_success(self):
+    self._adapt('increase', EDIT_RATE_INCREASE)
+
+  def on_backoff(self, retry_after=None, lag=None):
+    """Slows the edits down after the wiki asked to.
+
+    retry_after is the number of seconds to wait, lag the replication lag
+    that the wiki reported, if any.
+    """
+    if retry_after is None:
+      retry_after = EDIT_RATELIMITED_WAIT_SECS
+    if lag is not None:
+      self.redis.hset(self.key, 'lag', lag)
+
+    now = time.time()
+    rate = self._adapt('decrease', EDIT_RATE_DECREASE_FACTOR, now,
+                       now + retry_after)
+    logger.warning(
+        'Wiki asked to back off (lag=%s), waiting %ss and editing at %.2f '
+        'edits/sec', lag, retry_after, rate)
+
+  def observe_response(self, response, *args, **kwargs):
+    """A requests response hook that backs off when an edit reports lag.
+
+    mwclient retries the request itself after the Retry-After, this makes
+    the other edits wait too and lowers the rate. The responses of other
+    requests, like the queries of the project updates that share the
+    session, are ignored.
+    """
+    lag = response.headers.get('X-Database-Lag')
+    if lag is None or not _is_edit(response.request):
+      return
+    retry_after = response.headers.get('Retry-After')
+    self.on_backoff(
+        retry_after=None if retry_after is None else float(retry_after),
+        lag=float(lag))
+
+  def _adapt(self, mode, amount, now=0, retry_until=0):
+    return float(
+        self._adapt_rate(keys=[self.key],
+                         args=[
+                             EDIT_RATE_PER_SEC, mode, amount,
+                             EDIT_MIN_RATE_PER_SEC, EDIT_MAX_RATE_PER_SEC, now,
+                             retry_until
+                         ]))
+
+
+def _is_edit(request):
+  """Returns True if the request is a call of the edit API."""
+  body = request.body
+  if not body:
+    return False
+  if isinstance(body, bytes):
+    body = body.decode('utf-8', errors='replace')
+  return 'edit' in parse_qs(body).get('action', [])
+
+
+class EditHashes:
+  """Remembers the hash of the text last saved to each wiki page.
+
+  The hashes are stored in Redis under 'edit_hash:<page name>', so that
+  uploads of a page whose text didn't change can skip the edit. They expire
+  after EDIT_HASH_TTL_SECS, so that every page is saved again once in a while,
+  which restores the pages that were changed on the wiki in the meantime.
+
+  The number of saved and skipped edits of each day (UTC) is counted in the
+  'edit_stats:<date>' hashes, see get_stats().
+  """
+
+  def __init__(self, redis):
+    self.redis = redis
+
+  @staticmethod
+  def digest(wikicode):
+    return hashlib.sha1(wikicode.encode('utf-8')).hexdigest()
+
+  def _key(self, page_name):
+    return 'edit_hash:%s' % page_name
+
+  def is_unchanged(self, page_name, wikicode):
+    stored = self.redis.get(self._key(page_name))
+    return stored is not None and stored.decode('utf-8') == self.digest(
+        wikicode)
+
+  def set(self, page_name, wikicode):
+    self.redis.set(self._key(page_name),
+                   self.digest(wikicode),
+                   ex=EDIT_HASH_TTL_SECS)
+
+  def count(self, result):
+    """Counts a 'saved' or 'skipped' edit in the stats of today."""
+    key = 'edit_stats:%s' % time.strftime('%Y-%m-%d', time.gmtime())
+    with self.redis.pipeline() as pipe:
+      pipe.hincrby(key, result, 1)
+      pipe.expire(key, EDIT_STATS_TTL_SECS)
+      pipe.execute()
+
+  def get_stats(self, date=None):
+    """Returns a dict with the saved and skipped edits of the date.
+
+    date is a 'YYYY-MM-DD' string in UTC, today if it's None.
+    """
+    if date is None:
+      date = time.strftime('%Y-%m-%d', time.gmtime())
+    stats = self.redis.hgetall('edit_stats:%s' % date)
+    return {
+        'saved': int(stats.get(b'saved', 0)),
+        'skipped': int(stats.get(b'skipped', 0)),
+    }
 
 
 def login():
@@ -42,9 +237,14 @@ def login():
   connection = requests.Session()
   connection.cookies = cookie_jar
 
+  throttle = get_edit_throttle()
+  if throttle is not None:
+    connection.hooks['response'].append(throttle.observe_response)
+
   site = mwclient.Site('en.wikipedia.org',
                        clients_useragent=MW_USER_AGENT,
-                       pool=connection)
+                       pool=connection,
+                       max_lag=EDIT_MAX_LAG_SECS)
   if not site.logged_in:
     try:
       logger.info('Logging into API site')
@@ -66,7 +266,62 @@ def get_page(name):
   return site.pages[name]
 
 
+def get_edit_throttle():
+  """Returns the EditThrottle that all of the processes share.
+
+  None if there are no credentials for Redis, in which case edits are not
+  throttled.
+  """
+  global edit_throttle
+  if edit_throttle is None and redis_db.CREDENTIALS is not None:
+    edit_throttle = EditThrottle(redis_db.connect())
+  return edit_throttle
+
+
+def get_edit_hashes():
+  """Returns the EditHashes that all of the processes share.
+
+  None if there are no credentials for Redis, in which case every upload is
+  saved.
+  """
+  global edit_hashes
+  if edit_hashes is None and redis_db.CREDENTIALS is not None:
+    edit_hashes = EditHashes(redis_db.connect())
+  return edit_hashes
+
+
+def save_page_if_changed(page_name, wikicode, msg):
+  """Saves wikicode to the named page, unless it's what was last saved.
+
+  Unchanged pages are neither fetched nor saved, so they don't take an edit
+  from the rate limit. Returns True if the page has the wikicode, False if
+  there is no site to save it to. Errors of the save are raised, see
+  save_page.
+  """
+  hashes = get_edit_hashes()
+  if hashes is not None and hashes.is_unchanged(page_name, wikicode):
+    logger.info('Skipping edit of %s, its text did not change', page_name)
+    hashes.count('skipped')
+    return True
+
+  page = get_page(page_name)
+  if page is None or not save_page(page, wikicode, msg):
+    return False
+
+  if hashes is not None:
+    hashes.set(page_name, wikicode)
+    hashes.count('saved')
+  return True
+
+
 def save_page(page, wikicode, msg):
+  """Saves wikicode to the page, at the rate of the edit throttle.
+
+  Edits that the wiki rate limits or refuses because of its lag are retried,
+  up to EDIT_MAX_ATTEMPTS times, after which the error is raised, so that
+  the job making the edit fails. Returns False if there is no site to save
+  to.
+  """
   if not site or not site.logged_in:
     logger.info('Reloading site login')
     if not login():
@@ -79,10 +334,32 @@ def save_page(page, wikicode, msg):
     # https://github.com/mwclient/mwclient/issues/231
     page = get_page(page.name)
 
-  logger.info('Saving API page %s', page.name)
-  page.save(wikicode, msg)
+  throttle = get_edit_throttle()
+  for attempt in range(1, EDIT_MAX_ATTEMPTS + 1):
+    if throttle is not None:
+      throttle.wait()
 
-  return True
+    logger.info('Saving API page %s', page.name)
+    try:
+      page.save(wikicode, msg)
+    except (mwclient.errors.APIError,
+            mwclient.errors.MaximumRetriesExceeded) as e:
+      # MaximumRetriesExceeded means that mwclient gave up retrying while the
+      # wiki was lagged.
+      if (throttle is None or attempt == EDIT_MAX_ATTEMPTS or
+          (isinstance(e, mwclient.errors.APIError) and
+           e.code not in ('ratelimited', 'maxlag'))):
+        if attempt == EDIT_MAX_ATTEMPTS:
+          logger.warning(
+              'Could not save page %s after %s attempts, the wiki kept '
+              'asking to back off', page.name, EDIT_MAX_ATTEMPTS)
+        raise
+      throttle.on_backoff()
+      continue
+
+    if throttle is not None:
+      throttle.on_success()
+    return True
 
 
 def get_revision_id_by_timestamp(page, timestamp):
@@ -1,10 +1,13 @@
 import importlib
+import time
 import unittest
 from unittest.mock import MagicMock, patch
 
 import mwclient
 
 import wp1.api
+from wp1.base_redis_test import BaseRedisTest
+from wp1.constants import EDIT_HASH_TTL_SECS, EDIT_MAX_ATTEMPTS, EDIT_MAX_RATE_PER_SEC, EDIT_MIN_RATE_PER_SEC, EDIT_RATE_PER_SEC
 
 
 class ApiWithCredsTest(unittest.TestCase):
@@ -59,6 +62,72 @@ class ApiTest(unittest.TestCase):
     self.assertEqual(1, self.page.save.call_count)
     self.assertEqual(('<code>', 'edit summary'), self.page.save.call_args[0])
 
+  @patch('wp1.api.get_edit_throttle')
+  @patch('wp1.api.site')
+  def test_save_page_throttled(self, patched_site, patched_throttle):
+    throttle = patched_throttle.return_value
+    calls = []
+    throttle.wait.side_effect = lambda: calls.append('wait')
+    throttle.on_success.side_effect = lambda: calls.append('success')
+    self.page.save.side_effect = lambda *args: calls.append('save')
+
+    actual = wp1.api.save_page(self.page, '<code>', 'edit summary')
+
+    self.assertTrue(actual)
+    self.assertEqual(['wait', 'save', 'success'], calls)
+
+  @patch('wp1.api.get_edit_throttle')
+  @patch('wp1.api.site')
+  def test_save_page_ratelimited(self, patched_site, patched_throttle):
+    throttle = patched_throttle.return_value
+    self.page.save.side_effect = [
+        mwclient.errors.APIError('ratelimited', 'Slow down', {}), None
+    ]
+
+    actual = wp1.api.save_page(self.page, '<code>', 'edit summary')
+
+    self.assertTrue(actual)
+    self.assertEqual(2, self.page.save.call_count)
+    self.assertEqual(1, throttle.on_backoff.call_count)
+    self.assertEqual(1, throttle.on_success.call_count)
+
+  @patch('wp1.api.get_edit_throttle')
+  @patch('wp1.api.site')
+  def test_save_page_gives_up(self, patched_site, patched_throttle):
+    self.page.save.side_effect = mwclient.errors.MaximumRetriesExceeded()
+
+    with self.assertRaises(mwclient.errors.MaximumRetriesExceeded):
+      wp1.api.save_page(self.page, '<code>', 'edit summary')
+
+    self.assertEqual(EDIT_MAX_ATTEMPTS, self.page.save.call_count)
+
+  @patch('wp1.api.get_edit_throttle')
+  @patch('wp1.api.site')
+  def test_save_page_ratelimited_gives_up(self, patched_site, patched_throttle):
+    self.page.save.side_effect = mwclient.errors.APIError(
+        'ratelimited', 'Slow down', {})
+
+    with self.assertRaises(mwclient.errors.APIError):
+      wp1.api.save_page(self.page, '<code>', 'edit summary')
+
+    self.assertEqual(EDIT_MAX_ATTEMPTS, self.page.save.call_count)
+    self.assertEqual(EDIT_MAX_ATTEMPTS - 1,
+                     patched_throttle.return_value.on_backoff.call_count)
+
+  @patch('wp1.api.get_edit_throttle')
+  @patch('wp1.api.site')
+  def test_save_page_other_error(self, patched_site, patched_throttle):
+    self.page.save.side_effect = mwclient.errors.APIError(
+        'protectedpage', 'Protected', {})
+
+    with self.assertRaises(mwclient.errors.APIError):
+      wp1.api.save_page(self.page, '<code>', 'edit summary')
+
+  @patch('wp1.api.redis_db.CREDENTIALS', None)
+  @patch('wp1.api.edit_throttle', None)
+  def test_get_edit_throttle_no_credentials(self):
+    self.assertIsNone(wp1.api.get_edit_throttle())
+
   @patch('wp1.api.site', None)
   @patch('wp1.api.get_credentials')
   @patch('wp1.api.login')
@@ -78,6 +147,67 @@ class ApiTest(unittest.TestCase):
     actual = wp1.api.save_page(self.page, '<code>', 'edit summary')
     self.assertFalse(actual)
 
+  @patch('wp1.api.get_edit_hashes')
+  @patch('wp1.api.save_page')
+  @patch('wp1.api.get_page')
+  def test_save_page_if_changed_saves(self, patched_get_page, patched_save_page,
+                                      patched_hashes):
+    hashes = patched_hashes.return_value
+    hashes.is_unchanged.return_value = False
+    patched_save_page.return_value = True
+
+    actual = wp1.api.save_page_if_changed('Foo', '<code>', 'edit summary')
+
+    self.assertTrue(actual)
+    patched_get_page.assert_called_once_with('Foo')
+    patched_save_page.assert_called_once_with(patched_get_page.return_value,
+                                              '<code>', 'edit summary')
+    hashes.set.assert_called_once_with('Foo', '<code>')
+    hashes.count.assert_called_once_with('saved')
+
+  @patch('wp1.api.get_edit_hashes')
+  @patch('wp1.api.save_page')
+  @patch('wp1.api.get_page')
+  def test_save_page_if_changed_skips(self, patched_get_page, patched_save_page,
+                                      patched_hashes):
+    hashes = patched_hashes.return_value
+    hashes.is_unchanged.return_value = True
+
+    actual = wp1.api.save_page_if_changed('Foo', '<code>', 'edit summary')
+
+    self.assertTrue(actual)
+    self.assertEqual(0, patched_get_page.call_count)
+    self.assertEqual(0, patched_save_page.call_count)
+    self.assertEqual(0, hashes.set.call_count)
+    hashes.count.assert_called_once_with('skipped')
+
+  @patch('wp1.api.get_edit_hashes')
+  @patch('wp1.api.save_page')
+  @patch('wp1.api.get_page')
+  def test_save_page_if_changed_save_fails(self, patched_get_page,
+                                           patched_save_page, patched_hashes):
+    hashes = patched_hashes.return_value
+    hashes.is_unchanged.return_value = False
+    patched_save_page.side_effect = mwclient.errors.MaximumRetriesExceeded()
+
+    with self.assertRaises(mwclient.errors.MaximumRetriesExceeded):
+      wp1.api.save_page_if_changed('Foo', '<code>', 'edit summary')
+
+    self.assertEqual(0, hashes.set.call_count)
+    self.assertEqual(0, hashes.count.call_count)
+
+  @patch('wp1.api.get_edit_hashes', return_value=None)
+  @patch('wp1.api.save_page')
+  @patch('wp1.api.get_page')
+  def test_save_page_if_changed_no_redis(self, patched_get_page,
+                                         patched_save_page, patched_hashes):
+    patched_save_page.return_value = True
+
+    actual = wp1.api.save_page_if_changed('Foo', '<code>', 'edit summary')
+
+    self.assertTrue(actual)
+    self.assertEqual(1, patched_save_page.call_count)
+
   def test_get_revision_id_present(self):
     self.page.revisions.return_value = iter(({'revid': 10},))
     actual = wp1.api.get_revision_id_by_timestamp(self.page,
@@ -89,3 +219,147 @@ class ApiTest(unittest.TestCase):
     actual = wp1.api.get_revision_id_by_timestamp(self.page,
                                                   '2015-05-05T15:55:55Z')
     self.assertIsNone(actual)
+
+
+@patch('wp1.api.time.time')
+class EditThrottleTest(BaseRedisTest):
+
+  def setUp(self):
+    super().setUp()
+    self.throttle = wp1.api.EditThrottle(self.redis)
+
+  def test_initial_rate(self, patched_time):
+    self.assertEqual(EDIT_RATE_PER_SEC, self.throttle.rate)
+
+  def test_success_increases_rate(self, patched_time):
+    self.throttle.on_success()
+    self.throttle.on_success()
+
+    self.assertAlmostEqual(EDIT_RATE_PER_SEC + 0.1, self.throttle.rate)
+
+  def test_backoff_decreases_rate(self, patched_time):
+    patched_time.return_value = 1000
+    self.throttle.on_backoff(retry_after=5, lag=7.5)
+
+    self.assertEqual(
+        {
+            'rate': EDIT_RATE_PER_SEC / 2,
+            'lag': 7.5,
+            'retry_until': 1005,
+        }, self.throttle.get_status())
+
+  def test_rate_bounds(self, patched_time):
+    patched_time.return_value = 1000
+    for _ in range(100):
+      self.throttle.on_success()
+    self.assertEqual(EDIT_MAX_RATE_PER_SEC, self.throttle.rate)
+
+    for i in range(100):
+      patched_time.return_value = 1000 + i * 100
+      self.throttle.on_backoff(retry_after=5)
+    self.assertEqual(EDIT_MIN_RATE_PER_SEC, self.throttle.rate)
+
+  def test_backoff_decreases_rate_once(self, patched_time):
+    patched_time.return_value = 1000
+    self.throttle.on_backoff(retry_after=5)
+    patched_time.return_value = 1002
+    self.throttle.on_backoff(retry_after=5)
+
+    self.assertEqual(
+        {
+            'rate': EDIT_RATE_PER_SEC / 2,
+            'lag': 0,
+            'retry_until': 1007,
+        }, self.throttle.get_status())
+
+    patched_time.return_value = 1008
+    self.throttle.on_backoff(retry_after=5)
+
+    self.assertEqual(EDIT_RATE_PER_SEC / 4, self.throttle.rate)
+
+  def test_observe_response_lag(self, patched_time):
+    patched_time.return_value = 1000
+    response = MagicMock()
+    response.headers = {'X-Database-Lag': '12', 'Retry-After': '5'}
+    response.request.body = 'title=Foo&action=edit&format=json'
+
+    self.throttle.observe_response(response)
+
+    self.assertEqual(
+        {
+            'rate': EDIT_RATE_PER_SEC / 2,
+            'lag': 12,
+            'retry_until': 1005,
+        }, self.throttle.get_status())
+
+  def test_observe_response_query_lag(self, patched_time):
+    patched_time.return_value = 1000
+    response = MagicMock()
+    response.headers = {'X-Database-Lag': '12', 'Retry-After': '5'}
+    response.request.body = b'titles=Foo&action=query&format=json'
+
+    self.throttle.observe_response(response)
+
+    self.assertEqual({}, self.redis.hgetall('edit_throttle'))
+
+  def test_observe_response_no_lag(self, patched_time):
+    response = MagicMock()
+    response.headers = {}
+
+    self.throttle.observe_response(response)
+
+    self.assertEqual({}, self.redis.hgetall('edit_throttle'))
+
+  @patch('wp1.api.time.sleep')
+  def test_wait_retry_after(self, patched_sleep, patched_time):
+    patched_time.return_value = 1000
+    self.throttle.on_backoff(retry_after=5)
+    self.throttle.bucket.acquire = MagicMock()
+
+    patched_time.return_value = 1002
+    self.throttle.wait()
+
+    patched_sleep.assert_called_once_with(3)
+    self.assertEqual(EDIT_RATE_PER_SEC / 2, self.throttle.bucket.rate)
+    self.throttle.bucket.acquire.assert_called_once()
+
+
+class EditHashesTest(BaseRedisTest):
+
+  def setUp(self):
+    super().setUp()
+    self.hashes = wp1.api.EditHashes(self.redis)
+
+  def test_unknown_page_is_changed(self):
+    self.assertFalse(self.hashes.is_unchanged('Foo', '<code>'))
+
+  def test_same_text_is_unchanged(self):
+    self.hashes.set('Foo', '<code>')
+    self.assertTrue(self.hashes.is_unchanged('Foo', '<code>'))
+
+  def test_other_text_is_changed(self):
+    self.hashes.set('Foo', '<code>')
+    self.assertFalse(self.hashes.is_unchanged('Foo', '<other code>'))
+    self.assertFalse(self.hashes.is_unchanged('Bar', '<code>'))
+
+  def test_hash_expires(self):
+    self.hashes.set('Foo', '<code>')
+    self.assertAlmostEqual(EDIT_HASH_TTL_SECS,
+                           self.redis.ttl('edit_hash:Foo'),
+                           delta=5)
+
+  @patch('wp1.api.time.gmtime', return_value=time.gmtime(1600000000))
+  def test_stats(self, patched_gmtime):
+    self.hashes.count('saved')
+    self.hashes.count('skipped')
+    self.hashes.count('skipped')
+
+    self.assertEqual({
+        'saved': 1,
+        'skipped': 2
+    }, self.hashes.get_stats('2020-09-13'))
+    self.assertEqual({'saved': 1, 'skipped': 2}, self.hashes.get_stats())
+    self.assertEqual({
+        'saved': 0,
+        'skipped': 0
+    }, self.hashes.get_stats('2020-09-12'))
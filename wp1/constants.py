@@ -8,7 +8,18 @@ class AssessmentKind(enum.Enum):
   BOTH = 'both'
 
 
-MAX_ARTICLES_BEFORE_COMMIT = 200
+# A project update commits its transaction after this many articles have been
+# processed, or after MAX_SECS_BEFORE_COMMIT seconds, whichever comes first.
+MAX_ARTICLES_BEFORE_COMMIT = 1000
+MAX_SECS_BEFORE_COMMIT = 30
+
+# Number of ratings buffered per assessment kind before they are written to the
+# database as a single multi-row upsert.
+RATINGS_WRITE_BATCH_SIZE = 500
+
+# Number of log entries buffered before they are written to the logging table as
+# a single multi-row insert.
+LOGS_WRITE_BATCH_SIZE = 500
 
 CATEGORY_NS_INT = 14
 TALK_NS_INT = 1
@@ -42,3 +53,131 @@ CONTENT_TYPE_TO_EXT = {
     'application/vnd.ms-excel': 'xls',
     b'application/vnd.ms-excel': 'xls',
 }
+
+# Projects with at least this many articles are updated with the merge join
+# engine, which streams the ratings and the category members in article order
+# instead of indexing the ratings in memory.
+MERGE_UPDATE_MIN_ARTICLES = 100000
+
+# Number of ratings read per query by the merge join engine.
+MERGE_UPDATE_CHUNK_SIZE = 5000
+
+# Project updates only fetch the category memberships added since the last
+# update, except once every FULL_UPDATE_INTERVAL_DAYS days, when the whole
+# project is reconciled.
+FULL_UPDATE_INTERVAL_DAYS = 7
+
+# Memberships up to this many seconds older than the last update are fetched
+# again by a delta update, to cover replication lag.
+DELTA_UPDATE_OVERLAP_SECS = 60 * 60
+
+# Number of articles looked up per query by a delta update.
+DELTA_UPDATE_CHUNK_SIZE = 1000
+
+# Number of threads used to look up the moves and redirects of the articles
+# that are no longer in any category of a project.
+MOVE_RESOLVER_WORKERS = 8
+
+# Maximum number of move and redirect API requests in flight at once, across
+# all of the lookups of the process.
+MOVE_API_MAX_CONCURRENCY = 8
+
+# Number of articles whose moves are looked up per query of the replica
+# logging table.
+MOVE_LOG_CHUNK_SIZE = 500
+
+# Number of articles whose redirects are looked up per query of the replica.
+MOVE_REDIRECT_CHUNK_SIZE = 500
+
+# Maximum number of titles in a single MediaWiki API query.
+API_MAX_TITLES_PER_QUERY = 50
+
+# The move data of articles is cached by the day of the update timestamp that
+# it was looked up for. Moves are cached for a week, and articles that were not
+# moved for a day, since a later move would be missed until they expire.
+MOVE_CACHE_BUCKET_SECS = 24 * 60 * 60
+MOVE_CACHE_TTL_SECS = 7 * 24 * 60 * 60
+MOVE_CACHE_NEGATIVE_TTL_SECS = 24 * 60 * 60
+
+# Number of entries of the in-process move cache.
+MOVE_CACHE_LOCAL_SIZE = 10000
+
+# Number of talk page ids of unseen articles that are looked up per query of
+# the replica.
+MOVE_RESOLVER_BATCH_SIZE = 1000
+
+# Progress increments of manual updates are written to Redis once this many
+# are pending, or this many seconds have passed since the last write.
+PROGRESS_FLUSH_ITEMS = 500
+PROGRESS_FLUSH_SECS = 0.25
+
+# The articles of global_articles are split into this many partitions by the
+# hash of their title when the table is rebuilt, which are filled by this many
+# processes at once.
+GLOBAL_REBUILD_PARTITIONS = 16
+GLOBAL_REBUILD_PROCESSES = 4
+# Updates of global_articles that deadlock with the update of another project
+# are retried this many times, after waiting this many seconds times the
+# number of the attempt.
+GLOBAL_UPDATE_MAX_ATTEMPTS = 5
+GLOBAL_UPDATE_RETRY_SECS = 0.5
+
+# Wiki edits, by any process, are limited to this many per second, with bursts
+# of up to this many edits. The rate is then adapted to the wiki's load, see
+# below.
+EDIT_RATE_PER_SEC = 1.0
+EDIT_BURST = 1
+
+# Materializer jobs, across all of the materializer workers, are started at
+# this many per second, with bursts of up to this many jobs.
+MATERIALIZE_RATE_PER_SEC = 1.0
+MATERIALIZE_BURST = 1
+
+# Edits are sent with this maxlag, so the wiki refuses them while its
+# replication lag is higher. The edit rate, which starts at EDIT_RATE_PER_SEC,
+# is then adapted: it grows by EDIT_RATE_INCREASE per successful edit and is
+# multiplied by EDIT_RATE_DECREASE_FACTOR, at most once per Retry-After, when
+# the wiki refuses an edit for its lag or rate limits us, within the given
+# bounds.
+EDIT_MAX_LAG_SECS = 5
+EDIT_MIN_RATE_PER_SEC = 0.05
+EDIT_MAX_RATE_PER_SEC = 2.0
+EDIT_RATE_INCREASE = 0.05
+EDIT_RATE_DECREASE_FACTOR = 0.5
+# How long all edits wait after being rate limited without a Retry-After, and
+# how many times an edit is tried before giving up.
+EDIT_RATELIMITED_WAIT_SECS = 60
+EDIT_MAX_ATTEMPTS = 5
+
+# Uploads skip the edit when the text is the same as the last saved one, but
+# only for this long, after which the page is saved again in case it was
+# changed on the wiki. The daily counts of saved and skipped edits are kept
+# for EDIT_STATS_TTL_SECS.
+EDIT_HASH_TTL_SECS = 7 * 24 * 60 * 60
+EDIT_STATS_TTL_SECS = 30 * 24 * 60 * 60
+
+# The scheduler keeps this many project updates waiting in the update queue,
+# topping it up every SCHEDULER_INTERVAL_SECS, and re-reads the list of
+# projects from the wiki every SCHEDULER_REFRESH_SECS.
+SCHEDULER_QUEUE_TARGET = 16
+SCHEDULER_INTERVAL_SECS = 30
+SCHEDULER_REFRESH_SECS = 60 * 60
+# Projects are updated again once their last update is this old, and go
+# before all others once it is older than the sum of these.
+SCHEDULER_MIN_STALENESS_SECS = 20 * 60 * 60
+SCHEDULER_MAX_OVERDUE_SECS = 6 * 60 * 60
+# Projects without a recorded update duration are estimated to take this long
+# per article, and at least the minimum.
+SCHEDULER_SECS_PER_ARTICLE = 0.01
+SCHEDULER_MIN_ESTIMATE_SECS = 10
+# Projects with this many articles, or whose updates take this long, are mega
+# projects, of which at most this many are in flight at once.
+SCHEDULER_MEGA_PROJECT_ARTICLES = 100000
+SCHEDULER_MEGA_PROJECT_SECS = 30 * 60
+SCHEDULER_MAX_MEGA_PROJECTS = 2
+# The weight of the latest update in the average duration of a project.
+UPDATE_DURATION_WEIGHT = 0.3
+# The scheduler backs off from projects whose update failed for this long,
+# doubled for each consecutive failure, up to the maximum.
+UPDATE_FAILURE_BACKOFF_SECS = 60 * 60
+UPDATE_FAILURE_MAX_BACKOFF_SECS = 24 * 60 * 60
@@ -3,13 +3,22 @@ import logging
 import re
 import time
 
+import mwclient
+import requests
+
 from wp1.api import site
-from wp1.constants import TS_FORMAT
+from wp1.constants import API_MAX_TITLES_PER_QUERY, TS_FORMAT
 import wp1.logic.util as logic_util
 
 logger = logging.getLogger(__name__)
 RE_NAMESPACE = re.compile(r'^([^:]+:)')
 
+# The errors of API queries that failed, as opposed to queries whose answer
+# is an empty result.
+QUERY_ERRORS = (requests.exceptions.RequestException, mwclient.errors.APIError,
+                mwclient.errors.MaximumRetriesExceeded,
+                mwclient.errors.InvalidResponse)
+
 
 def get_redirect(title_with_ns):
   logger.debug('Querying api for redirects for %s', title_with_ns)
@@ -47,6 +56,73 @@ def get_redirect(title_with_ns):
   }
 
 
+def _query_with_retries(**kwargs):
+  """Queries the API, raising the last error if all 3 attempts fail."""
+  retries = 3
+  while True:
+    try:
+      return site.api('query', **kwargs)
+    except QUERY_ERRORS:
+      retries -= 1
+      if not retries:
+        raise
+
+
+def get_redirects(titles_with_ns):
+  """Returns a dict of each of the titles to its redirect target, or None.
+
+  The targets are the same as returned by get_redirect. The titles are sent
+  API_MAX_TITLES_PER_QUERY at a time, and the normalized and redirected
+  titles in the response are mapped back to the titles that were asked for.
+  Raises one of QUERY_ERRORS if the API can't be queried, so that the titles
+  are not mistaken for titles that are not redirects.
+  """
+  ans = dict((title, None) for title in titles_with_ns)
+  titles = list(ans)
+  for i in range(0, len(titles), API_MAX_TITLES_PER_QUERY):
+    chunk = titles[i:i + API_MAX_TITLES_PER_QUERY]
+    logger.debug('Querying api for redirects for %s titles', len(chunk))
+
+    normalized = {}
+    redirects = {}
+    pages = {}
+    params = {}
+    while True:
+      res = _query_with_retries(titles='|'.join(chunk),
+                                redirects=1,
+                                prop='revisions',
+                                rvprop='timestamp',
+                                **params)
+      query = res.get('query', {})
+      normalized.update(
+          (n['from'], n['to']) for n in query.get('normalized', []))
+      redirects.update((r['from'], r['to']) for r in query.get('redirects', []))
+      for page in query.get('pages', {}).values():
+        # With continuation, the revisions of a page can come in a later
+        # response than the page itself.
+        if page.get('revisions') or page['title'] not in pages:
+          pages[page['title']] = page
+
+      if 'continue' not in res:
+        break
+      params = res['continue']
+
+    for title in chunk:
+      target = redirects.get(normalized.get(title, title))
+      page = pages.get(target)
+      if not target or page is None or not page.get('revisions'):
+        continue
+      ans[title] = {
+          'ns':
+              page['ns'],
+          'title':
+              page['title'].replace(' ', '_'),
+          'timestamp_dt':
+              datetime.strptime(page['revisions'][0]['timestamp'], TS_FORMAT),
+      }
+  return ans
+
+
 def get_moves(title_with_ns):
   logger.debug('Querying api for moves of page %s', title_with_ns)
 
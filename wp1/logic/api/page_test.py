@@ -3,6 +3,9 @@ import time
 import unittest
 from unittest.mock import MagicMock, patch
 
+import mwclient
+import requests
+
 import wp1.logic.api.page as api_page
 
 
@@ -64,3 +67,134 @@ class TestApiPage(unittest.TestCase):
     self.assertEqual(14, actual[0]['ns'])
     self.assertEqual('Foo_Bar_Baz', actual[0]['title'])
     self.assertEqual(datetime(2018, 12, 25, 1, 2, 3), actual[0]['timestamp_dt'])
+
+  @patch('wp1.logic.api.page.site')
+  def test_get_redirects(self, patched_site):
+    patched_site.api.return_value = {
+        'query': {
+            'normalized': [{
+                'from': 'Foo_Bar',
+                'to': 'Foo Bar',
+            }],
+            'redirects': [{
+                'from': 'Foo Bar',
+                'to': 'Foo Bar Baz',
+            }],
+            'pages': {
+                '123': {
+                    'ns': 0,
+                    'title': 'Foo Bar Baz',
+                    'revisions': [{
+                        'timestamp': '2018-12-25T01:02:03Z',
+                    }]
+                },
+                '456': {
+                    'ns': 0,
+                    'title': 'Not A Redirect',
+                    'revisions': [{
+                        'timestamp': '2018-12-25T01:02:03Z',
+                    }]
+                },
+                '-1': {
+                    'ns': 0,
+                    'title': 'Missing',
+                    'missing': '',
+                },
+            }
+        }
+    }
+
+    actual = api_page.get_redirects(['Foo_Bar', 'Not A Redirect', 'Missing'])
+    self.assertEqual(
+        {
+            'Foo_Bar': {
+                'ns': 0,
+                'title': 'Foo_Bar_Baz',
+                'timestamp_dt': datetime(2018, 12, 25, 1, 2, 3),
+            },
+            'Not A Redirect': None,
+            'Missing': None,
+        }, actual)
+    patched_site.api.assert_called_once_with(
+        'query',
+        titles='Foo_Bar|Not A Redirect|Missing',
+        redirects=1,
+        prop='revisions',
+        rvprop='timestamp')
+
+  @patch('wp1.logic.api.page.site')
+  @patch('wp1.logic.api.page.API_MAX_TITLES_PER_QUERY', 2)
+  def test_get_redirects_chunks(self, patched_site):
+    patched_site.api.return_value = {}
+
+    actual = api_page.get_redirects(['A', 'B', 'C', 'D', 'E'])
+    self.assertEqual(dict((title, None) for title in 'ABCDE'), actual)
+    self.assertEqual(
+        ['A|B', 'C|D', 'E'],
+        [call[1]['titles'] for call in patched_site.api.call_args_list])
+
+  @patch('wp1.logic.api.page.site')
+  def test_get_redirects_continue(self, patched_site):
+    patched_site.api.side_effect = [{
+        'continue': {
+            'rvcontinue': '123|456',
+            'continue': '||',
+        },
+        'query': {
+            'redirects': [{
+                'from': 'Foo',
+                'to': 'Foo Bar',
+            }],
+            'pages': {
+                '123': {
+                    'ns': 0,
+                    'title': 'Foo Bar',
+                },
+            }
+        }
+    }, {
+        'query': {
+            'pages': {
+                '123': {
+                    'ns': 0,
+                    'title': 'Foo Bar',
+                    'revisions': [{
+                        'timestamp': '2018-12-25T01:02:03Z',
+                    }]
+                },
+            }
+        }
+    }]
+
+    actual = api_page.get_redirects(['Foo'])
+    self.assertEqual('Foo_Bar', actual['Foo']['title'])
+    self.assertEqual('123|456',
+                     patched_site.api.call_args_list[1][1]['rvcontinue'])
+
+  @patch('wp1.logic.api.page.site')
+  def test_get_redirects_error(self, patched_site):
+    patched_site.api.side_effect = requests.exceptions.ConnectionError(
+        'API error')
+
+    with self.assertRaises(requests.exceptions.ConnectionError):
+      api_page.get_redirects(['Foo', 'Bar'])
+    self.assertEqual(3, len(patched_site.api.call_args_list))
+
+  @patch('wp1.logic.api.page.site')
+  def test_get_redirects_error_recovers(self, patched_site):
+    patched_site.api.side_effect = [
+        mwclient.errors.APIError('maxlag', 'Lagged', None), {
+            'query': {}
+        }
+    ]
+
+    actual = api_page.get_redirects(['Foo'])
+    self.assertEqual({'Foo': None}, actual)
+
+  @patch('wp1.logic.api.page.site')
+  def test_get_redirects_other_error(self, patched_site):
+    patched_site.api.side_effect = KeyError('query')
+
+    with self.assertRaises(KeyError):
+      api_page.get_redirects(['Foo'])
+    self.assertEqual(1, len(patched_site.api.call_args_list))
@@ -16,3 +16,13 @@ def insert_or_update(wp10db, category):
           c_category = %(c_category)s, c_ranking = %(c_ranking)s
     ''', attr.asdict(category))
   wp10db.commit()
+
+
+def get_category_names_for_project(wp10db, project_name):
+  with wp10db.cursor() as cursor:
+    cursor.execute(
+        '''
+        SELECT c_category FROM categories
+        WHERE c_project = %(c_project)s AND c_category != ''
+    ''', {'c_project': project_name})
+    return [db_category['c_category'] for db_category in cursor.fetchall()]
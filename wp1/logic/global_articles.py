@@ -0,0 +1,359 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import time
+
+import pymysql.err
+
+from wp1.constants import (GLOBAL_REBUILD_PARTITIONS, GLOBAL_REBUILD_PROCESSES,
+                           GLOBAL_UPDATE_MAX_ATTEMPTS, GLOBAL_UPDATE_RETRY_SECS,
+                           RATINGS_WRITE_BATCH_SIZE)
+from wp1.wp10_db import connect as wp10_connect
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'global_articles'
+# The table that a rebuild fills, before it is swapped in for TABLE.
+SHADOW_TABLE = 'global_articles_new'
+_OLD_TABLE = 'global_articles_old'
+# The number of global_articles rows with each quality and importance ranking,
+# which the overall assessment table is generated from.
+STATS_TABLE = 'global_stats'
+
+# MySQL error code of a query on a table that doesn't exist.
+_ER_NO_SUCH_TABLE = 1146
+# MySQL error code of a transaction that was rolled back to resolve a deadlock.
+_ER_LOCK_DEADLOCK = 1213
+
+# The ratings of articles, in every project, that have a global ranking for
+# both their quality and their importance. Followed by the condition that
+# selects the articles.
+_RANKED_RATINGS = '''
+    FROM ratings
+    JOIN categories AS ci
+      ON r_project = ci.c_project AND ci.c_type = 'importance' AND
+         r_importance = ci.c_rating
+    JOIN categories AS cq
+      ON r_project = cq.c_project AND cq.c_type = 'quality' AND
+         r_quality = cq.c_rating
+    JOIN global_rankings AS qual
+      ON qual.gr_type = 'quality' AND qual.gr_rating = cq.c_replacement
+    JOIN global_rankings AS imp
+      ON imp.gr_type = 'importance' AND imp.gr_rating = ci.c_replacement
+    WHERE r_namespace = 0 AND
+'''
+
+_UPSERT = '''
+    INSERT INTO %s (a_article, a_quality, a_importance, a_score)
+    SELECT r_article, MAX(qual.gr_ranking), MAX(imp.gr_ranking), MAX(r_score)
+'''
+
+_ON_DUPLICATE = '''
+    GROUP BY r_article
+    ON DUPLICATE KEY UPDATE a_quality = VALUES(a_quality),
+                            a_importance = VALUES(a_importance),
+                            a_score = VALUES(a_score)
+'''
+
+
+def update_global_articles(wp10db, articles, table=TABLE):
+  """Recomputes the global_articles rows of the given articles.
+
+  Each article gets the highest quality, importance and score of its ratings
+  across all projects. Articles that no longer have any ranked rating are
+  removed, and the changes are counted in global_stats. Only the rows of the
+  given articles are written, and the ratings are read by the upsert itself,
+  so a concurrent writer of the same ratings is waited on instead of being
+  overwritten with stale values.
+
+  This locks the global_articles and global_stats rows of the articles and
+  the ratings of the articles in every project, so it can deadlock with the
+  update of another project that shares articles. It should run in its own
+  short transaction, after the ratings are committed, see
+  GlobalArticleWriter.
+  """
+  articles = tuple(sorted(set(articles)))
+  if not articles:
+    return
+
+  # Only the changes to TABLE are counted in global_stats, the shadow table
+  # is counted once it is swapped in.
+  count_stats = table == TABLE
+  if count_stats:
+    before = _get_rankings(wp10db, articles, table, for_update=True)
+
+  params = {'articles': articles}
+  with wp10db.cursor() as cursor:
+    cursor.execute(
+        _UPSERT % table + _RANKED_RATINGS + 'r_article IN %(articles)s' +
+        _ON_DUPLICATE, params)
+    cursor.execute(
+        'DELETE FROM ' + table + '''
+        WHERE a_article IN %(articles)s AND a_article NOT IN (
+          SELECT r_article
+    ''' + _RANKED_RATINGS + 'r_article IN %(articles)s)', params)
+
+  if count_stats:
+    deltas = defaultdict(int)
+    for rankings in before:
+      deltas[rankings] -= 1
+    for rankings in _get_rankings(wp10db, articles, table):
+      deltas[rankings] += 1
+    update_global_stats(wp10db, deltas)
+
+
+def _get_rankings(wp10db, articles, table, for_update=False):
+  """Returns the list of (a_quality, a_importance) of the given articles."""
+  with wp10db.cursor() as cursor:
+    cursor.execute(
+        'SELECT a_quality, a_importance FROM ' + table +
+        ' WHERE a_article IN %(articles)s' +
+        (' FOR UPDATE' if for_update else ''), {'articles': articles})
+    return [
+        (row['a_quality'], row['a_importance']) for row in cursor.fetchall()
+    ]
+
+
+def update_global_stats(wp10db, deltas):
+  """Adds the given deltas to global_stats.
+
+  deltas is a dict of (a_quality, a_importance) to the change in the number
+  of global articles with those rankings.
+  """
+  values = [{
+      'gs_quality': quality,
+      'gs_importance': importance,
+      'gs_count': delta,
+  } for (quality, importance), delta in sorted(deltas.items()) if delta]
+  if not values:
+    return
+
+  with wp10db.cursor() as cursor:
+    cursor.executemany(
+        'INSERT INTO ' + STATS_TABLE + '''
+          (gs_quality, gs_importance, gs_count)
+        VALUES (%(gs_quality)s, %(gs_importance)s, %(gs_count)s)
+        ON DUPLICATE KEY UPDATE gs_count = gs_count + VALUES(gs_count)
+    ''', values)
+
+
+def refresh_global_stats(wp10db):
+  """Replaces global_stats with a count of the global_articles rows.
+
+  The rows are counted with a consistent read, which doesn't lock them,
+  because updates lock their global_articles rows before their global_stats
+  rows. The changes of an update that commits between the count and the
+  replace are lost, until the next refresh.
+  """
+  start = time.monotonic()
+  with wp10db.cursor() as cursor:
+    cursor.execute('''
+        SELECT a_quality, a_importance, COUNT(*) AS n
+        FROM ''' + TABLE + '''
+        GROUP BY a_quality, a_importance
+    ''')
+    counts = dict(((row['a_quality'], row['a_importance']), row['n'])
+                  for row in cursor.fetchall())
+  with wp10db.cursor() as cursor:
+    cursor.execute('DELETE FROM ' + STATS_TABLE)
+  update_global_stats(wp10db, counts)
+  wp10db.commit()
+  logger.info('Refreshed %s in %.2fs', STATS_TABLE, time.monotonic() - start)
+
+
+# The global articles by the name of their quality and importance, in the
+# format of the tables. An article whose ranking is shared by more than one
+# rating is counted under each of them.
+_STATS_BY_RATING = '''
+    JOIN global_rankings AS grq
+      ON grq.gr_type = 'quality' AND grq.gr_ranking = %s
+    JOIN global_rankings AS gri
+      ON gri.gr_type = 'importance' AND gri.gr_ranking = %s
+    GROUP BY grq.gr_rating, gri.gr_rating
+'''
+
+
+def get_global_stats(wp10db):
+  """Returns the counts stored in global_stats, in the format of the tables.
+
+  That is a list of dicts with the count n of the global articles with
+  quality q and importance i.
+  """
+  with wp10db.cursor() as cursor:
+    cursor.execute('''
+        SELECT CAST(SUM(gs_count) AS SIGNED) AS n,
+               grq.gr_rating AS q, gri.gr_rating AS i
+        FROM ''' + STATS_TABLE + (_STATS_BY_RATING %
+                                  ('gs_quality', 'gs_importance')) +
+                   'HAVING n > 0')
+    return cursor.fetchall()
+
+
+def count_global_stats(wp10db):
+  """Counts the global articles, in the same format as get_global_stats.
+
+  This aggregates the whole global_articles table.
+  """
+  with wp10db.cursor() as cursor:
+    cursor.execute('''
+        SELECT count(distinct a_article) AS n,
+               grq.gr_rating AS q, gri.gr_rating AS i
+        FROM ''' + TABLE + _STATS_BY_RATING % ('a_quality', 'a_importance'))
+    return cursor.fetchall()
+
+
+def _shadow_table_exists(wp10db):
+  with wp10db.cursor() as cursor:
+    cursor.execute('SHOW TABLES LIKE %s', (SHADOW_TABLE,))
+    return bool(cursor.fetchall())
+
+
+def fill_partition(wp10db, partition, partitions, table=SHADOW_TABLE):
+  """Computes the global_articles rows of one partition of the articles.
+
+  The articles are partitioned by the CRC32 hash of their title. Returns the
+  number of seconds that the partition took.
+  """
+  start = time.monotonic()
+  wp10db.ping()
+  with wp10db.cursor() as cursor:
+    cursor.execute(
+        _UPSERT % table + _RANKED_RATINGS +
+        'CRC32(r_article) %% %(partitions)s = %(partition)s' + _ON_DUPLICATE, {
+            'partition': partition,
+            'partitions': partitions
+        })
+  wp10db.commit()
+  return time.monotonic() - start
+
+
+def _fill_partition_in_process(partition, partitions):
+  # Connections can't be shared with the parent process.
+  wp10db = wp10_connect()
+  try:
+    return fill_partition(wp10db, partition, partitions)
+  finally:
+    wp10db.close()
+
+
+def rebuild_global_articles(wp10db,
+                            partitions=GLOBAL_REBUILD_PARTITIONS,
+                            processes=GLOBAL_REBUILD_PROCESSES):
+  """Rebuilds global_articles from scratch, without blocking its users.
+
+  The rows are computed into SHADOW_TABLE, partitions partitions at a time on
+  a pool of processes, each with its own connection, or in this process if
+  processes is 1. Meanwhile, readers and project updates keep using the
+  current table, and the updates also write their changes to the shadow
+  table, so none are lost. The shadow table is then swapped in with a single
+  RENAME TABLE, and global_stats is refreshed from it. Returns the list of
+  seconds that each partition took.
+  """
+  with wp10db.cursor() as cursor:
+    cursor.execute('DROP TABLE IF EXISTS ' + SHADOW_TABLE)
+    cursor.execute('DROP TABLE IF EXISTS ' + _OLD_TABLE)
+    cursor.execute('CREATE TABLE ' + SHADOW_TABLE + ' LIKE ' + TABLE)
+  wp10db.commit()
+
+  start = time.monotonic()
+  if processes <= 1:
+    partition_secs = [
+        fill_partition(wp10db, partition, partitions)
+        for partition in range(partitions)
+    ]
+  else:
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+      partition_secs = list(
+          executor.map(_fill_partition_in_process, range(partitions),
+                       [partitions] * partitions))
+  for partition, secs in enumerate(partition_secs):
+    logger.info('Filled partition %s/%s of %s in %.2fs', partition + 1,
+                partitions, SHADOW_TABLE, secs)
+  logger.info('Filled %s partitions in %.2fs with %s processes', partitions,
+              time.monotonic() - start, processes)
+
+  wp10db.ping()
+  with wp10db.cursor() as cursor:
+    cursor.execute('RENAME TABLE ' + TABLE + ' TO ' + _OLD_TABLE + ', ' +
+                   SHADOW_TABLE + ' TO ' + TABLE)
+    cursor.execute('DROP TABLE ' + _OLD_TABLE)
+  wp10db.commit()
+  logger.info('Swapped %s in for %s', SHADOW_TABLE, TABLE)
+
+  # The updates that ran while the shadow table was filled only counted their
+  # changes to the old table.
+  refresh_global_stats(wp10db)
+  return partition_secs
+
+
+class GlobalArticleWriter:
+  """Buffers the articles whose ratings changed and updates their global rows.
+
+  Only articles in the main namespace have a global_articles row. The rows are
+  recomputed from the ratings in the database, so flush() must be called after
+  the changed ratings are committed. Each batch of articles is updated and
+  committed in its own transaction, which is retried if it deadlocks with the
+  update of another project.
+  """
+
+  def __init__(self, wp10db, batch_size=RATINGS_WRITE_BATCH_SIZE):
+    self.wp10db = wp10db
+    self.batch_size = batch_size
+    self.rows_written = 0
+    self.secs_writing = 0.0
+    self._pending = set()
+
+  def add(self, namespace, article):
+    if namespace != 0:
+      return
+    self._pending.add(article)
+
+  def flush(self):
+    if not self._pending:
+      return
+
+    # Sorted, so that concurrent updates lock the rows in the same order.
+    pending = sorted(self._pending)
+    self._pending = set()
+    start = time.monotonic()
+    # While global_articles is rebuilt, the changes are also written to the
+    # shadow table, which must not miss them once it is swapped in. The shadow
+    # table is written first, so that the changes end up in the table that is
+    # live after the swap, whenever it happens: the writes to the shadow table
+    # before it went to the new global_articles, and the ones after it fail,
+    # while the writes to global_articles go to the new one.
+    tables = [TABLE]
+    if _shadow_table_exists(self.wp10db):
+      tables.insert(0, SHADOW_TABLE)
+    for table in tables:
+      for i in range(0, len(pending), self.batch_size):
+        try:
+          self._update(pending[i:i + self.batch_size], table)
+        except pymysql.err.ProgrammingError as e:
+          # The shadow table was swapped in, the rest of the changes go to it
+          # under its new name.
+          self.wp10db.rollback()
+          if table != SHADOW_TABLE or e.args[0] != _ER_NO_SUCH_TABLE:
+            raise
+          break
+    self.rows_written += len(pending)
+    self.secs_writing += time.monotonic() - start
+
+  def _update(self, articles, table):
+    for attempt in range(1, GLOBAL_UPDATE_MAX_ATTEMPTS + 1):
+      try:
+        update_global_articles(self.wp10db, articles, table=table)
+        self.wp10db.commit()
+        return
+      except pymysql.err.OperationalError as e:
+        self.wp10db.rollback()
+        if (e.args[0] != _ER_LOCK_DEADLOCK or
+            attempt == GLOBAL_UPDATE_MAX_ATTEMPTS):
+          raise
+        logger.warning('Deadlock updating %s articles of %s, retrying',
+                       len(articles), table)
+        time.sleep(GLOBAL_UPDATE_RETRY_SECS * attempt)
+
+  def log_stats(self, project_name):
+    logger.info('Updated %s global articles for %s in %.2fs', self.rows_written,
+                project_name.decode('utf-8'), self.secs_writing)
@@ -0,0 +1,332 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import attr
+import pymysql.err
+
+from wp1.base_db_test import BaseWpOneDbTest
+from wp1.constants import GLOBAL_UPDATE_MAX_ATTEMPTS
+from wp1.logic import global_articles as logic_global_articles
+from wp1.models.wp10.rating import Rating
+
+
+class BaseGlobalArticlesTest(BaseWpOneDbTest):
+
+  def setUp(self):
+    super().setUp()
+    with self.wp10db.cursor() as cursor:
+      for project in (b'Project A', b'Project B'):
+        for c_type, rating in ((b'quality', b'B-Class'), (b'quality',
+                                                          b'FA-Class'),
+                               (b'importance', b'Low-Class'), (b'importance',
+                                                               b'Top-Class')):
+          cursor.execute(
+              '''
+              INSERT INTO categories
+                (c_project, c_type, c_rating, c_replacement, c_category,
+                 c_ranking)
+              VALUES (%s, %s, %s, %s, %s, 0)
+          ''', (project, c_type, rating, rating, rating))
+    self.wp10db.commit()
+
+  def _insert_rating(self, project, article, quality, importance, score=0):
+    rating = Rating(r_project=project,
+                    r_namespace=0,
+                    r_article=article,
+                    r_score=score,
+                    r_quality=quality,
+                    r_importance=importance)
+    with self.wp10db.cursor() as cursor:
+      cursor.execute(
+          '''
+          INSERT INTO ratings
+            (r_project, r_namespace, r_article, r_score, r_quality,
+             r_importance)
+          VALUES
+            (%(r_project)s, %(r_namespace)s, %(r_article)s, %(r_score)s,
+             %(r_quality)s, %(r_importance)s)
+          ON DUPLICATE KEY UPDATE r_quality = %(r_quality)s,
+                                  r_importance = %(r_importance)s
+      ''', attr.asdict(rating))
+    self.wp10db.commit()
+
+  def _global_articles(self):
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('SELECT * FROM global_articles ORDER BY a_article')
+      return [(a['a_article'], a['a_quality'], a['a_importance'], a['a_score'])
+              for a in cursor.fetchall()]
+
+  def _global_stats(self):
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('SELECT * FROM global_stats WHERE gs_count != 0 '
+                     'ORDER BY gs_quality, gs_importance')
+      return [(s['gs_quality'], s['gs_importance'], s['gs_count'])
+              for s in cursor.fetchall()]
+
+
+class UpdateGlobalArticlesTest(BaseGlobalArticlesTest):
+
+  def test_max_across_projects(self):
+    self._insert_rating(b'Project A', b'Foo', b'FA-Class', b'Low-Class', 10)
+    self._insert_rating(b'Project B', b'Foo', b'B-Class', b'Top-Class', 20)
+    self._insert_rating(b'Project A', b'Bar', b'B-Class', b'Low-Class', 5)
+
+    logic_global_articles.update_global_articles(self.wp10db, [b'Foo', b'Bar'])
+
+    self.assertEqual([(b'Bar', b'300', b'100', 5),
+                      (b'Foo', b'500', b'400', 20)], self._global_articles())
+    self.assertEqual([(b'300', b'100', 1), (b'500', b'400', 1)],
+                     self._global_stats())
+
+  def test_lowers_rating(self):
+    self._insert_rating(b'Project A', b'Foo', b'FA-Class', b'Top-Class')
+    logic_global_articles.update_global_articles(self.wp10db, [b'Foo'])
+    self._insert_rating(b'Project A', b'Foo', b'B-Class', b'Low-Class')
+
+    logic_global_articles.update_global_articles(self.wp10db, [b'Foo'])
+
+    self.assertEqual([(b'Foo', b'300', b'100', 0)], self._global_articles())
+    self.assertEqual([(b'300', b'100', 1)], self._global_stats())
+
+  def test_removes_unranked(self):
+    self._insert_rating(b'Project A', b'Foo', b'FA-Class', b'Top-Class')
+    logic_global_articles.update_global_articles(self.wp10db, [b'Foo'])
+    self._insert_rating(b'Project A', b'Foo', b'NotA-Class', b'NotA-Class')
+
+    logic_global_articles.update_global_articles(self.wp10db, [b'Foo'])
+
+    self.assertEqual([], self._global_articles())
+    self.assertEqual([], self._global_stats())
+
+  def test_other_table_not_counted(self):
+    self._insert_rating(b'Project A', b'Foo', b'FA-Class', b'Top-Class')
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('CREATE TABLE global_articles_new LIKE global_articles')
+    self.wp10db.commit()
+
+    logic_global_articles.update_global_articles(self.wp10db, [b'Foo'],
+                                                 table='global_articles_new')
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('DROP TABLE global_articles_new')
+
+    self.assertEqual([], self._global_stats())
+
+  def test_only_given_articles(self):
+    self._insert_rating(b'Project A', b'Foo', b'FA-Class', b'Top-Class')
+    self._insert_rating(b'Project A', b'Bar', b'FA-Class', b'Top-Class')
+
+    logic_global_articles.update_global_articles(self.wp10db, [b'Foo'])
+
+    self.assertEqual([(b'Foo', b'500', b'400', 0)], self._global_articles())
+
+
+class RebuildGlobalArticlesTest(BaseGlobalArticlesTest):
+
+  def test_rebuild(self):
+    self._insert_rating(b'Project A', b'Foo', b'FA-Class', b'Low-Class', 10)
+    self._insert_rating(b'Project B', b'Foo', b'B-Class', b'Top-Class', 20)
+    self._insert_rating(b'Project A', b'Bar', b'B-Class', b'Low-Class', 5)
+    self._insert_rating(b'Project A', b'Baz', b'NotA-Class', b'NotA-Class')
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('''
+          INSERT INTO global_articles
+            (a_article, a_quality, a_importance, a_score)
+          VALUES ('Stale', '500', '400', 0)
+      ''')
+    self.wp10db.commit()
+
+    partition_secs = logic_global_articles.rebuild_global_articles(self.wp10db,
+                                                                   partitions=3,
+                                                                   processes=1)
+
+    self.assertEqual(3, len(partition_secs))
+    self.assertEqual([(b'Bar', b'300', b'100', 5),
+                      (b'Foo', b'500', b'400', 20)], self._global_articles())
+    self.assertEqual([(b'300', b'100', 1), (b'500', b'400', 1)],
+                     self._global_stats())
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('SHOW TABLES LIKE %s', ('global_articles_%',))
+      self.assertEqual(0, len(cursor.fetchall()))
+
+  def test_writer_updates_shadow_table(self):
+    self._insert_rating(b'Project A', b'Foo', b'FA-Class', b'Low-Class')
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('CREATE TABLE global_articles_new LIKE global_articles')
+    self.wp10db.commit()
+
+    writer = logic_global_articles.GlobalArticleWriter(self.wp10db)
+    writer.add(0, b'Foo')
+    writer.flush()
+
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('SELECT a_article FROM global_articles_new')
+      shadow = [a['a_article'] for a in cursor.fetchall()]
+      cursor.execute('DROP TABLE global_articles_new')
+    self.assertEqual([b'Foo'], shadow)
+    self.assertEqual([(b'Foo', b'500', b'100', 0)], self._global_articles())
+
+
+class GlobalStatsTest(BaseGlobalArticlesTest):
+
+  def setUp(self):
+    super().setUp()
+    self._insert_rating(b'Project A', b'Foo', b'FA-Class', b'Low-Class')
+    self._insert_rating(b'Project A', b'Bar', b'FA-Class', b'Low-Class')
+    self._insert_rating(b'Project A', b'Baz', b'B-Class', b'Top-Class')
+    logic_global_articles.update_global_articles(self.wp10db,
+                                                 [b'Foo', b'Bar', b'Baz'])
+    self.wp10db.commit()
+
+  def _by_rating(self, stats):
+    return sorted((row['q'], row['i'], row['n']) for row in stats)
+
+  def test_get_global_stats(self):
+    expected = [(b'B-Class', b'Top-Class', 1), (b'FA-Class', b'Low-Class', 2)]
+    self.assertEqual(
+        expected,
+        self._by_rating(logic_global_articles.get_global_stats(self.wp10db)))
+    self.assertEqual(
+        expected,
+        self._by_rating(logic_global_articles.count_global_stats(self.wp10db)))
+
+  def test_refresh_global_stats(self):
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('UPDATE global_stats SET gs_count = 7')
+      cursor.execute("INSERT INTO global_stats VALUES ('100', '100', 3)")
+    self.wp10db.commit()
+
+    logic_global_articles.refresh_global_stats(self.wp10db)
+
+    self.assertEqual([(b'300', b'400', 1), (b'500', b'100', 2)],
+                     self._global_stats())
+
+
+class GlobalArticleWriterTest(unittest.TestCase):
+
+  @patch('wp1.logic.global_articles._shadow_table_exists')
+  @patch('wp1.logic.global_articles.update_global_articles')
+  def test_flush_in_batches(self, patched_update, patched_exists):
+    patched_exists.return_value = False
+    wp10db = MagicMock()
+    writer = logic_global_articles.GlobalArticleWriter(wp10db, batch_size=2)
+    for article in (b'C', b'A', b'B', b'A'):
+      writer.add(0, article)
+    writer.add(4, b'Project page')
+
+    writer.flush()
+
+    self.assertEqual([
+        ((wp10db, [b'A', b'B']), {
+            'table': 'global_articles'
+        }),
+        ((wp10db, [b'C']), {
+            'table': 'global_articles'
+        }),
+    ], patched_update.call_args_list)
+    self.assertEqual(3, writer.rows_written)
+
+  @patch('wp1.logic.global_articles._shadow_table_exists')
+  @patch('wp1.logic.global_articles.update_global_articles')
+  def test_flush_shadow_table_swapped(self, patched_update, patched_exists):
+    patched_exists.return_value = True
+
+    def fake_update(wp10db, articles, table):
+      if table == 'global_articles_new':
+        raise pymysql.err.ProgrammingError(1146, "Table doesn't exist")
+
+    patched_update.side_effect = fake_update
+    writer = logic_global_articles.GlobalArticleWriter(MagicMock())
+    writer.add(0, b'A')
+
+    writer.flush()
+
+    self.assertEqual(2, patched_update.call_count)
+
+  @patch('wp1.logic.global_articles._shadow_table_exists')
+  @patch('wp1.logic.global_articles.update_global_articles')
+  def test_flush_shadow_table_swapped_between_writes(self, patched_update,
+                                                     patched_exists):
+    patched_exists.return_value = True
+    tables = {'global_articles': set(), 'global_articles_new': set()}
+
+    def fake_update(wp10db, articles, table):
+      if table not in tables:
+        raise pymysql.err.ProgrammingError(1146, "Table doesn't exist")
+      tables[table].update(articles)
+      # The rebuild swaps the shadow table in after the first write.
+      if 'global_articles_new' in tables:
+        tables['global_articles'] = tables.pop('global_articles_new')
+
+    patched_update.side_effect = fake_update
+    writer = logic_global_articles.GlobalArticleWriter(MagicMock())
+    writer.add(0, b'A')
+
+    writer.flush()
+
+    self.assertEqual({'global_articles': {b'A'}}, tables)
+
+  @patch('wp1.logic.global_articles.time.sleep')
+  @patch('wp1.logic.global_articles._shadow_table_exists', return_value=False)
+  @patch('wp1.logic.global_articles.update_global_articles')
+  def test_flush_commits_each_batch(self, patched_update, patched_exists,
+                                    patched_sleep):
+    wp10db = MagicMock()
+    writer = logic_global_articles.GlobalArticleWriter(wp10db, batch_size=2)
+    for article in (b'A', b'B', b'C'):
+      writer.add(0, article)
+
+    writer.flush()
+
+    self.assertEqual(2, wp10db.commit.call_count)
+
+  @patch('wp1.logic.global_articles.time.sleep')
+  @patch('wp1.logic.global_articles._shadow_table_exists', return_value=False)
+  @patch('wp1.logic.global_articles.update_global_articles')
+  def test_flush_retries_deadlock(self, patched_update, patched_exists,
+                                  patched_sleep):
+    patched_update.side_effect = [
+        pymysql.err.OperationalError(1213, 'Deadlock found'), None
+    ]
+    wp10db = MagicMock()
+    writer = logic_global_articles.GlobalArticleWriter(wp10db)
+    writer.add(0, b'A')
+
+    writer.flush()
+
+    self.assertEqual(2, patched_update.call_count)
+    self.assertEqual(1, wp10db.rollback.call_count)
+    self.assertEqual(1, wp10db.commit.call_count)
+
+  @patch('wp1.logic.global_articles.time.sleep')
+  @patch('wp1.logic.global_articles._shadow_table_exists', return_value=False)
+  @patch('wp1.logic.global_articles.update_global_articles')
+  def test_flush_gives_up_on_deadlocks(self, patched_update, patched_exists,
+                                       patched_sleep):
+    patched_update.side_effect = pymysql.err.OperationalError(
+        1213, 'Deadlock found')
+    writer = logic_global_articles.GlobalArticleWriter(MagicMock())
+    writer.add(0, b'A')
+
+    with self.assertRaises(pymysql.err.OperationalError):
+      writer.flush()
+    self.assertEqual(GLOBAL_UPDATE_MAX_ATTEMPTS, patched_update.call_count)
+
+  @patch('wp1.logic.global_articles._shadow_table_exists', return_value=False)
+  @patch('wp1.logic.global_articles.update_global_articles')
+  def test_flush_other_error(self, patched_update, patched_exists):
+    patched_update.side_effect = pymysql.err.OperationalError(
+        1205, 'Lock wait timeout exceeded')
+    writer = logic_global_articles.GlobalArticleWriter(MagicMock())
+    writer.add(0, b'A')
+
+    with self.assertRaises(pymysql.err.OperationalError):
+      writer.flush()
+    self.assertEqual(1, patched_update.call_count)
+
+  @patch('wp1.logic.global_articles.update_global_articles')
+  def test_flush_empty(self, patched_update):
+    writer = logic_global_articles.GlobalArticleWriter(MagicMock())
+    writer.flush()
+    writer.flush()
+
+    patched_update.assert_not_called()
@@ -1,5 +1,6 @@
 import attr
 
+from wp1.constants import LOGS_WRITE_BATCH_SIZE
 from wp1.models.wp10.log import Log
 
 
@@ -15,3 +16,61 @@ def insert_or_update(wp10db, log):
            %(l_timestamp)s, %(l_old)s, %(l_new)s, %(l_revision_timestamp)s)
         ON DUPLICATE KEY UPDATE l_article = l_article
     ''', attr.asdict(log))
+
+
+def insert_or_update_many(wp10db, logs):
+  """Inserts a list of logs in a single multi-row statement.
+
+  As with insert_or_update, a log whose primary key already exists is left
+  untouched.
+  """
+  if not logs:
+    return 0
+
+  values = [l if isinstance(l, dict) else attr.asdict(l) for l in logs]
+  with wp10db.cursor() as cursor:
+    cursor.executemany(
+        '''
+        INSERT INTO logging
+          (l_project, l_namespace, l_article, l_action, l_timestamp, l_old,
+           l_new, l_revision_timestamp)
+        VALUES
+          (%(l_project)s, %(l_namespace)s, %(l_article)s, %(l_action)s,
+           %(l_timestamp)s, %(l_old)s, %(l_new)s, %(l_revision_timestamp)s)
+        ON DUPLICATE KEY UPDATE l_article = l_article
+    ''', values)
+  return len(values)
+
+
+def _primary_key(log):
+  return (log['l_project'], log['l_namespace'], log['l_article'],
+          log['l_action'], log['l_timestamp'])
+
+
+class LogWriter:
+  """Buffers log entries and writes them in multi-row batches.
+
+  Entries are deduplicated on the primary key of the logging table, keeping
+  the first one added, which matches what insert_or_update does one row at a
+  time. flush() must be called before the transaction is committed.
+  """
+
+  def __init__(self, wp10db, batch_size=LOGS_WRITE_BATCH_SIZE):
+    self.wp10db = wp10db
+    self.batch_size = batch_size
+    self.rows_written = 0
+    self._pending = {}
+
+  def add(self, log):
+    values = attr.asdict(log)
+    self._pending.setdefault(_primary_key(values), values)
+    if len(self._pending) >= self.batch_size:
+      self.flush()
+
+  def flush(self):
+    if not self._pending:
+      return
+
+    pending = list(self._pending.values())
+    self._pending = {}
+    self.rows_written += insert_or_update_many(self.wp10db, pending)
@@ -0,0 +1,79 @@
+from wp1.base_db_test import BaseWpOneDbTest
+from wp1.logic import log as logic_log
+from wp1.models.wp10.log import Log
+
+
+def _get_all_logs(wp10db):
+  with wp10db.cursor() as cursor:
+    cursor.execute('SELECT * FROM ' + Log.table_name)  # nosec
+    return [Log(**db_log) for db_log in cursor.fetchall()]
+
+
+def _make_log(article, l_new=b'Mid-Class'):
+  return Log(l_project=b'My test project',
+             l_namespace=0,
+             l_article=article,
+             l_action=b'quality',
+             l_timestamp=b'20180401123000',
+             l_old=b'NotA-Class',
+             l_new=l_new,
+             l_revision_timestamp=b'2018-01-01T12:00:00Z')
+
+
+class InsertOrUpdateManyTest(BaseWpOneDbTest):
+
+  def test_inserts_logs(self):
+    logs = [_make_log(b'Article %s' % str(i).encode('utf-8')) for i in range(5)]
+
+    count = logic_log.insert_or_update_many(self.wp10db, logs)
+
+    self.assertEqual(5, count)
+    self.assertEqual(5, len(_get_all_logs(self.wp10db)))
+
+  def test_keeps_existing_log(self):
+    logic_log.insert_or_update(self.wp10db, _make_log(b'Testing'))
+
+    logic_log.insert_or_update_many(self.wp10db,
+                                    [_make_log(b'Testing', l_new=b'Top-Class')])
+
+    logs = _get_all_logs(self.wp10db)
+    self.assertEqual(1, len(logs))
+    self.assertEqual(b'Mid-Class', logs[0].l_new)
+
+  def test_empty(self):
+    self.assertEqual(0, logic_log.insert_or_update_many(self.wp10db, []))
+
+
+class LogWriterTest(BaseWpOneDbTest):
+
+  def test_buffers_until_flush(self):
+    writer = logic_log.LogWriter(self.wp10db, batch_size=10)
+    for i in range(3):
+      writer.add(_make_log(b'Article %s' % str(i).encode('utf-8')))
+
+    self.assertEqual(0, len(_get_all_logs(self.wp10db)))
+
+    writer.flush()
+    self.assertEqual(3, len(_get_all_logs(self.wp10db)))
+    self.assertEqual(3, writer.rows_written)
+
+  def test_writes_full_batches(self):
+    writer = logic_log.LogWriter(self.wp10db, batch_size=2)
+    for i in range(5):
+      writer.add(_make_log(b'Article %s' % str(i).encode('utf-8')))
+
+    self.assertEqual(4, len(_get_all_logs(self.wp10db)))
+
+    writer.flush()
+    self.assertEqual(5, len(_get_all_logs(self.wp10db)))
+
+  def test_dedupes_on_primary_key(self):
+    writer = logic_log.LogWriter(self.wp10db)
+    writer.add(_make_log(b'Testing'))
+    writer.add(_make_log(b'Testing', l_new=b'Top-Class'))
+    writer.flush()
+
+    logs = _get_all_logs(self.wp10db)
+    self.assertEqual(1, len(logs))
+    self.assertEqual(b'Mid-Class', logs[0].l_new)
+    self.assertEqual(1, writer.rows_written)
@@ -0,0 +1,177 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import json
+import logging
+import time
+
+from wp1.constants import (MOVE_CACHE_BUCKET_SECS, MOVE_CACHE_LOCAL_SIZE,
+                           MOVE_CACHE_NEGATIVE_TTL_SECS, MOVE_CACHE_TTL_SECS,
+                           TS_FORMAT)
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+_STATS_KEY = b'move_cache:stats'
+
+
+class LruCache:
+  """An in-process cache that evicts the least recently used entries.
+
+  Entries also expire once the ttl_secs they were set with have passed.
+  """
+
+  def __init__(self, max_size=MOVE_CACHE_LOCAL_SIZE):
+    self.max_size = max_size
+    self._entries = OrderedDict()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def get(self, key):
+    """Returns (True, value) for a cached key, otherwise (False, None)."""
+    entry = self._entries.get(key)
+    if entry is None:
+      return False, None
+    value, expires_at = entry
+    if expires_at <= time.monotonic():
+      del self._entries[key]
+      return False, None
+    self._entries.move_to_end(key)
+    return True, value
+
+  def set(self, key, value, ttl_secs):
+    self._entries[key] = (value, time.monotonic() + ttl_secs)
+    self._entries.move_to_end(key)
+    while len(self._entries) > self.max_size:
+      self._entries.popitem(last=False)
+
+  def clear(self):
+    self._entries.clear()
+
+
+# Shared by the MoveCaches of the process, so that the titles looked up for
+# one project are also cached for the next one.
+_local_cache = LruCache()
+
+
+def _encode(move_data):
+  if move_data is None:
+    return b'null'
+  return json.dumps({
+      'dest_ns': move_data['dest_ns'],
+      'dest_title': move_data['dest_title'].decode('utf-8'),
+      'timestamp': move_data['timestamp_dt'].strftime(TS_FORMAT),
+  }).encode('utf-8')
+
+
+def _decode(value):
+  data = json.loads(value.decode('utf-8'))
+  if data is None:
+    return None
+  return {
+      'dest_ns': data['dest_ns'],
+      'dest_title': data['dest_title'].encode('utf-8'),
+      'timestamp_dt': datetime.strptime(data['timestamp'], TS_FORMAT),
+  }
+
+
+class MoveCache:
+  """Caches the move data of articles in Redis, with an LruCache in front.
+
+  Entries are keyed by the lookup that produced them, the namespace and title
+  of the article, and the bucket of MOVE_CACHE_BUCKET_SECS seconds that the
+  lookup's timestamp falls in. Lookups whose results are cached must be made
+  with the start of the bucket, from bucket_start, and their results filtered
+  by the actual timestamp, so that any timestamp in the bucket can share
+  them. Articles that were found to be moved are cached for ttl_secs, the
+  ones that weren't for negative_ttl_secs, since a later move would be missed
+  for that long.
+  """
+
+  def __init__(self,
+               redis,
+               local=None,
+               ttl_secs=MOVE_CACHE_TTL_SECS,
+               negative_ttl_secs=MOVE_CACHE_NEGATIVE_TTL_SECS,
+               bucket_secs=MOVE_CACHE_BUCKET_SECS):
+    self.redis = redis
+    self.local = _local_cache if local is None else local
+    self.ttl_secs = ttl_secs
+    self.negative_ttl_secs = negative_ttl_secs
+    self.bucket_secs = bucket_secs
+    self.local_hits = 0
+    self.redis_hits = 0
+    self.misses = 0
+
+  def _bucket(self, timestamp_dt):
+    return int((timestamp_dt - _EPOCH).total_seconds()) // self.bucket_secs
+
+  def bucket_start(self, timestamp_dt):
+    return _EPOCH + timedelta(seconds=self._bucket(timestamp_dt) *
+                              self.bucket_secs)
+
+  def _key(self, lookup, bucket, namespace, title):
+    return b'move:%s:%d:%d:%s' % (lookup.encode('utf-8'), bucket, namespace,
+                                  title)
+
+  def get_many(self, lookup, keys, timestamp_dt):
+    """Returns a dict of the cached (namespace, title) to their move data.
+
+    Keys that are not cached are left out. Cached negative results map to
+    None.
+    """
+    bucket = self._bucket(timestamp_dt)
+    found = {}
+    remote = []
+    for namespace, title in keys:
+      cache_key = self._key(lookup, bucket, namespace, title)
+      hit, value = self.local.get(cache_key)
+      if hit:
+        found[(namespace, title)] = value
+      else:
+        remote.append(((namespace, title), cache_key))
+    self.local_hits += len(found)
+
+    if remote:
+      values = self.redis.mget([cache_key for key, cache_key in remote])
+      for (key, cache_key), value in zip(remote, values):
+        if value is None:
+          continue
+        move_data = _decode(value)
+        self.local.set(
+            cache_key, move_data,
+            self.negative_ttl_secs if move_data is None else self.ttl_secs)
+        found[key] = move_data
+        self.redis_hits += 1
+
+    self.misses += len(keys) - len(found)
+    return found
+
+  def set_many(self, lookup, move_data_by_key, timestamp_dt):
+    """Caches the move data of each (namespace, title), None if not moved."""
+    bucket = self._bucket(timestamp_dt)
+    pipeline = self.redis.pipeline()
+    for (namespace, title), move_data in move_data_by_key.items():
+      cache_key = self._key(lookup, bucket, namespace, title)
+      ttl_secs = self.negative_ttl_secs if move_data is None else self.ttl_secs
+      self.local.set(cache_key, move_data, ttl_secs)
+      pipeline.setex(cache_key, ttl_secs, _encode(move_data))
+    pipeline.execute()
+
+  def log_stats(self, project_name):
+    logger.info('Move cache for %s: %s local hits, %s Redis hits, %s misses',
+                project_name.decode('utf-8'), self.local_hits, self.redis_hits,
+                self.misses)
+    # Totals across runs, to measure how many lookups the cache saves.
+    pipeline = self.redis.pipeline()
+    pipeline.hincrby(_STATS_KEY, 'local_hits', self.local_hits)
+    pipeline.hincrby(_STATS_KEY, 'redis_hits', self.redis_hits)
+    pipeline.hincrby(_STATS_KEY, 'misses', self.misses)
+    pipeline.execute()
+
+
+def get_stats(redis):
+  """Returns the total hits and misses of the move cache, across all runs."""
+  stats = redis.hgetall(_STATS_KEY)
+  return dict((field, int(stats.get(field.encode('utf-8'), 0)))
+              for field in ('local_hits', 'redis_hits', 'misses'))
@@ -0,0 +1,139 @@
+from datetime import datetime
+import unittest
+from unittest.mock import patch
+
+from wp1.base_redis_test import BaseRedisTest
+from wp1.logic import move_cache as logic_move_cache
+
+MOVED = {
+    'dest_ns': 0,
+    'dest_title': b'Moved_to_\xc3\xa9',
+    'timestamp_dt': datetime(2020, 5, 6, 7, 8, 9),
+}
+
+
+class LruCacheTest(unittest.TestCase):
+
+  def test_get_missing(self):
+    cache = logic_move_cache.LruCache(max_size=2)
+    self.assertEqual((False, None), cache.get(b'a'))
+
+  def test_get_none(self):
+    cache = logic_move_cache.LruCache(max_size=2)
+    cache.set(b'a', None, 100)
+    self.assertEqual((True, None), cache.get(b'a'))
+
+  def test_evicts_least_recently_used(self):
+    cache = logic_move_cache.LruCache(max_size=2)
+    cache.set(b'a', 1, 100)
+    cache.set(b'b', 2, 100)
+    cache.get(b'a')
+    cache.set(b'c', 3, 100)
+
+    self.assertEqual(2, len(cache))
+    self.assertEqual((True, 1), cache.get(b'a'))
+    self.assertEqual((False, None), cache.get(b'b'))
+    self.assertEqual((True, 3), cache.get(b'c'))
+
+  @patch('wp1.logic.move_cache.time.monotonic')
+  def test_expires(self, patched_monotonic):
+    cache = logic_move_cache.LruCache(max_size=2)
+    patched_monotonic.return_value = 100
+    cache.set(b'a', 1, 10)
+    patched_monotonic.return_value = 110
+
+    self.assertEqual((False, None), cache.get(b'a'))
+    self.assertEqual(0, len(cache))
+
+
+class MoveCacheTest(BaseRedisTest):
+
+  def setUp(self):
+    super().setUp()
+    self.local = logic_move_cache.LruCache()
+    self.cache = logic_move_cache.MoveCache(self.redis, local=self.local)
+    self.timestamp_dt = datetime(2020, 5, 1, 12, 30)
+
+  def test_bucket_start(self):
+    self.assertEqual(datetime(2020, 5, 1),
+                     self.cache.bucket_start(self.timestamp_dt))
+
+  def test_miss(self):
+    self.assertEqual({},
+                     self.cache.get_many('api_moves', [(0, b'Foo')],
+                                         self.timestamp_dt))
+    self.assertEqual(1, self.cache.misses)
+
+  def test_local_hit(self):
+    self.cache.set_many('api_moves', {
+        (0, b'Foo'): MOVED,
+        (0, b'Bar'): None
+    }, self.timestamp_dt)
+
+    actual = self.cache.get_many('api_moves', [(0, b'Foo'), (0, b'Bar')],
+                                 self.timestamp_dt)
+    self.assertEqual({(0, b'Foo'): MOVED, (0, b'Bar'): None}, actual)
+    self.assertEqual(2, self.cache.local_hits)
+    self.assertEqual(0, self.cache.misses)
+
+  def test_redis_hit(self):
+    self.cache.set_many('api_moves', {
+        (0, b'Foo'): MOVED,
+        (0, b'Bar'): None
+    }, self.timestamp_dt)
+    self.local.clear()
+
+    actual = self.cache.get_many('api_moves', [(0, b'Foo'), (0, b'Bar')],
+                                 self.timestamp_dt)
+    self.assertEqual({(0, b'Foo'): MOVED, (0, b'Bar'): None}, actual)
+    self.assertEqual(2, self.cache.redis_hits)
+    self.assertEqual(2, len(self.local))
+
+  def test_same_bucket(self):
+    self.cache.set_many('api_moves', {(0, b'Foo'): MOVED}, self.timestamp_dt)
+
+    actual = self.cache.get_many('api_moves', [(0, b'Foo')],
+                                 datetime(2020, 5, 1, 23, 59))
+    self.assertEqual({(0, b'Foo'): MOVED}, actual)
+
+  def test_other_bucket(self):
+    self.cache.set_many('api_moves', {(0, b'Foo'): MOVED}, self.timestamp_dt)
+    self.local.clear()
+
+    actual = self.cache.get_many('api_moves', [(0, b'Foo')],
+                                 datetime(2020, 5, 2, 0, 0))
+    self.assertEqual({}, actual)
+
+  def test_other_lookup(self):
+    self.cache.set_many('api_moves', {(0, b'Foo'): MOVED}, self.timestamp_dt)
+
+    actual = self.cache.get_many('db_redirects', [(0, b'Foo')],
+                                 self.timestamp_dt)
+    self.assertEqual({}, actual)
+
+  def test_ttls(self):
+    self.cache.set_many('api_moves', {
+        (0, b'Foo'): MOVED,
+        (0, b'Bar'): None
+    }, self.timestamp_dt)
+
+    keys = sorted(self.redis.keys(b'move:*'))
+    ttls = dict((key, self.redis.ttl(key)) for key in keys)
+    self.assertEqual(2, len(ttls))
+    self.assertTrue(
+        any(0 < ttl <= self.cache.negative_ttl_secs for ttl in ttls.values()))
+    self.assertTrue(
+        any(self.cache.negative_ttl_secs < ttl <= self.cache.ttl_secs
+            for ttl in ttls.values()))
+
+  def test_stats(self):
+    self.cache.get_many('api_moves', [(0, b'Foo')], self.timestamp_dt)
+    self.cache.set_many('api_moves', {(0, b'Foo'): MOVED}, self.timestamp_dt)
+    self.cache.get_many('api_moves', [(0, b'Foo')], self.timestamp_dt)
+    self.cache.log_stats(b'Project')
+
+    self.assertEqual({
+        'local_hits': 1,
+        'redis_hits': 0,
+        'misses': 1
+    }, logic_move_cache.get_stats(self.redis))
@@ -1,9 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 import logging
+import threading
+import time
 
 import requests
 
-from wp1.constants import TS_FORMAT, GLOBAL_TIMESTAMP
+from wp1.constants import (TS_FORMAT, TS_FORMAT_WP10, GLOBAL_TIMESTAMP,
+                           API_MAX_TITLES_PER_QUERY, MOVE_API_MAX_CONCURRENCY,
+                           MOVE_LOG_CHUNK_SIZE, MOVE_REDIRECT_CHUNK_SIZE,
+                           MOVE_RESOLVER_WORKERS)
+from wp1.models.wiki.log import Log as WikiLog
 from wp1.models.wiki.page import Page
 from wp1.models.wp10.log import Log
 from wp1.models.wp10.move import Move
@@ -14,6 +22,9 @@ import wp1.logic.util as logic_util
 
 logger = logging.getLogger(__name__)
 
+# Shared by every MoveResolver, so that the cap holds across resolvers.
+_api_slots = threading.BoundedSemaphore(MOVE_API_MAX_CONCURRENCY)
+
 
 def get_pages_by_category(wikidb, category, ns=None):
   query = '''
@@ -37,8 +48,113 @@ def get_pages_by_category(wikidb, category, ns=None):
       yield Page(**result)
 
 
-def update_page_moved(wp10db, project, old_ns, old_title, new_ns, new_title,
-                      move_timestamp_dt):
+def get_pages_by_categories(wikidb,
+                            categories,
+                            ns=None,
+                            ordered=False,
+                            since=None,
+                            pages=None):
+  """Yields the pages that are members of any of the given categories.
+
+  All of the categories are fetched with a single query. The cl_to field of
+  each page is set to the category it was found in, so that callers can
+  demultiplex the results. A page that is a member of more than one of the
+  categories is yielded once for each of them. If ordered is True, the pages
+  are yielded in (page_namespace, page_title) order.
+
+  If since is given, only memberships with a cl_timestamp newer than that
+  datetime are returned. If pages is given, only the memberships of those
+  (page_namespace, page_title) pairs are returned.
+  """
+  categories = tuple(set(categories))
+  if not categories:
+    return
+
+  query = '''
+      SELECT page_namespace, page_title, page_id, cl_sortkey, cl_timestamp,
+             cl_to
+      FROM page
+      JOIN categorylinks ON page_id = cl_from
+      WHERE cl_to IN %(categories)s
+  '''
+
+  params = {'categories': categories}
+  if ns is not None:
+    query += ' AND page_namespace = %(ns)s'
+    params['ns'] = ns
+  if since is not None:
+    query += ' AND cl_timestamp > %(since)s'
+    params['since'] = since
+  if pages is not None:
+    pages = tuple(pages)
+    if not pages:
+      return
+    query += ' AND (page_namespace, page_title) IN %(pages)s'
+    params['pages'] = pages
+  if ordered:
+    query += ' ORDER BY page_namespace, page_title'
+
+  with wikidb.cursor() as cursor:
+    cursor.execute(query, params)
+    while True:
+      result = cursor.fetchone()
+      if not result:
+        break
+      yield Page(**result)
+
+
+def get_category_stats(wikidb, categories):
+  """Returns the member count and newest cl_timestamp of the categories.
+
+  The return value is a list of dicts with cl_to, count and max_timestamp
+  keys, one for each of the categories that has at least one member, computed
+  with a single aggregated query.
+  """
+  categories = tuple(set(categories))
+  if not categories:
+    return []
+
+  with wikidb.cursor() as cursor:
+    cursor.execute(
+        '''
+        SELECT cl_to, COUNT(*) AS count, MAX(cl_timestamp) AS max_timestamp
+        FROM categorylinks
+        WHERE cl_to IN %(categories)s
+        GROUP BY cl_to
+    ''', {'categories': categories})
+    return list(cursor.fetchall())
+
+
+def get_category_member_counts(wikidb, categories):
+  """Returns the number of members of the categories in each namespace.
+
+  The return value is a list of dicts with cl_to, page_namespace and count
+  keys.
+  """
+  categories = tuple(set(categories))
+  if not categories:
+    return []
+
+  with wikidb.cursor() as cursor:
+    cursor.execute(
+        '''
+        SELECT cl_to, page_namespace, COUNT(*) AS count
+        FROM page
+        JOIN categorylinks ON page_id = cl_from
+        WHERE cl_to IN %(categories)s
+        GROUP BY cl_to, page_namespace
+    ''', {'categories': categories})
+    return list(cursor.fetchall())
+
+
+def update_page_moved(wp10db,
+                      project,
+                      old_ns,
+                      old_title,
+                      new_ns,
+                      new_title,
+                      move_timestamp_dt,
+                      log_writer=None):
   logger.debug('Updating moves table for %s -> %s', old_title.decode('utf-8'),
                new_title.decode('utf-8'))
   db_timestamp = move_timestamp_dt.strftime(TS_FORMAT).encode('utf-8')
@@ -62,30 +178,150 @@ def update_page_moved(wp10db, project, old_ns, old_title, new_ns, new_title,
                 l_old=b'',
                 l_new=b'',
                 l_revision_timestamp=db_timestamp)
-  logic_log.insert_or_update(wp10db, new_log)
+  if log_writer is None:
+    logic_log.insert_or_update(wp10db, new_log)
+  else:
+    log_writer.add(new_log)
+
+
+def get_redirects_from_db(wikidb, keys):
+  """Finds the redirects of many articles in the replica.
+
+  keys is a list of (namespace, title), which are queried
+  MOVE_REDIRECT_CHUNK_SIZE at a time. Returns a dict of each of them to the
+  move data of its redirect, in the format of get_move_data, or None if it is
+  not a redirect.
+  """
+  ans = dict((key, None) for key in keys)
+  # The titles of the replica have underscores instead of spaces.
+  by_db_key = dict(((namespace, title.replace(b' ', b'_')), (namespace, title))
+                   for namespace, title in ans)
+  db_keys = list(by_db_key)
+  if db_keys:
+    wikidb.ping()
+  for i in range(0, len(db_keys), MOVE_REDIRECT_CHUNK_SIZE):
+    with wikidb.cursor() as cursor:
+      cursor.execute(
+          '''
+          SELECT page_namespace, page_title, rd_namespace, rd_title,
+                 page_touched
+          FROM page
+          JOIN redirect ON page_id = rd_from
+          WHERE (page_namespace, page_title) IN %(titles)s
+      ''', {'titles': tuple(db_keys[i:i + MOVE_REDIRECT_CHUNK_SIZE])})
+      for row in cursor.fetchall():
+        key = by_db_key[(row['page_namespace'], row['page_title'])]
+        ans[key] = {
+            'dest_ns':
+                row['rd_namespace'],
+            'dest_title':
+                row['rd_title'],
+            'timestamp_dt':
+                datetime.strptime(row['page_touched'].decode('utf-8'),
+                                  '%Y%m%d%H%M%S'),
+        }
+  return ans
 
 
 def _get_redirects_from_db(wikidb, namespace, title, timestamp_dt):
-  wiki_db_title = title.decode('utf-8').replace(' ', '_')
+  return get_redirects_from_db(wikidb, [(namespace, title)])[(namespace, title)]
+
+
+def get_move_data_by_page_ids(wp10db, wikidb, talk_pages, timestamp_dt):
+  """Finds the articles whose talk page was moved, by the page id of the page.
+
+  talk_pages is a dict of the page id of a talk page to the (namespace, title)
+  of the article that it was recorded for. Returns a dict of each of those
+  (namespace, title) to its move data, as returned by get_move_data, or None
+  if its talk page has the same title or no longer exists. The time of the
+  move is that of the most recent move of the article newer than timestamp_dt
+  in the replica logging table, see get_moves_from_log. If there is none, it
+  is unknown and timestamp_dt is None in the move data.
+  """
+  ans = dict((key, None) for key in talk_pages.values())
+  if not talk_pages:
+    return ans
+
   wikidb.ping()
-  args_dict = {'title': wiki_db_title, 'namespace': namespace}
   with wikidb.cursor() as cursor:
     cursor.execute(
         '''
-        SELECT rd_namespace, rd_title, page_touched FROM page
-        JOIN redirect ON page_id = rd_from AND
-             page_title = %(title)s AND page_namespace = %(namespace)s
-    ''', args_dict)
-    row = cursor.fetchone()
-    if row:
-      timestamp_dt = datetime.strptime(row['page_touched'].decode('utf-8'),
-                                       '%Y%m%d%H%M%S')
-      return {
-          'dest_ns': row['rd_namespace'],
-          'dest_title': row['rd_title'],
-          'timestamp_dt': timestamp_dt,
+        SELECT page_id, page_namespace, page_title FROM page
+        WHERE page_id IN %(page_ids)s
+    ''', {'page_ids': tuple(talk_pages)})
+    for row in cursor.fetchall():
+      key = talk_pages[row['page_id']]
+      # Talk pages are moved along with their article.
+      dest = (row['page_namespace'] - 1, row['page_title'])
+      if dest == key:
+        continue
+      ans[key] = {
+          'dest_ns': dest[0],
+          'dest_title': dest[1],
+          'timestamp_dt': None,
       }
-    return None
+
+  moved = [key for key, data in ans.items() if data is not None]
+  for key, logged in get_moves_from_log(wp10db, wikidb, moved,
+                                        timestamp_dt).items():
+    if logged is not None:
+      ans[key]['timestamp_dt'] = logged['timestamp_dt']
+  return ans
+
+
+def _split_title(wp10db, full_title):
+  """Returns the (namespace, title) of a title with a namespace prefix."""
+  title = full_title.replace(b' ', b'_')
+  if b':' in full_title:
+    prefix, rest = full_title.split(b':', 1)
+    namespace = logic_util.ns_to_int(wp10db).get(prefix.replace(b'_', b' '))
+    if namespace is not None:
+      return namespace, rest.replace(b' ', b'_')
+  return 0, title
+
+
+def get_moves_from_log(wp10db, wikidb, keys, timestamp_dt):
+  """Finds the moves of many articles in the replica logging table.
+
+  keys is a list of (namespace, title), which are queried MOVE_LOG_CHUNK_SIZE
+  at a time. Returns a dict of each of them to the move data of its most
+  recent move newer than timestamp_dt, in the format of get_move_data, or
+  None if it was not moved.
+  """
+  ans = dict((key, None) for key in keys)
+  keys = list(ans)
+  since = timestamp_dt.strftime(TS_FORMAT_WP10).encode('utf-8')
+  if keys:
+    wikidb.ping()
+  for i in range(0, len(keys), MOVE_LOG_CHUNK_SIZE):
+    with wikidb.cursor() as cursor:
+      cursor.execute(
+          '''
+          SELECT log_namespace, log_title, log_timestamp, log_params
+          FROM logging
+          WHERE log_type = 'move' AND log_timestamp > %(since)s AND
+                (log_namespace, log_title) IN %(titles)s
+          ORDER BY log_timestamp DESC
+      ''', {
+              'since': since,
+              'titles': tuple(keys[i:i + MOVE_LOG_CHUNK_SIZE])
+          })
+      for row in cursor.fetchall():
+        log = WikiLog(**row)
+        key = (log.log_namespace, log.log_title)
+        # The rows are newest first, so the first move found is kept.
+        if key not in ans or ans[key] is not None:
+          continue
+        target = log.move_target
+        if target is None:
+          continue
+        dest_ns, dest_title = _split_title(wp10db, target)
+        ans[key] = {
+            'dest_ns': dest_ns,
+            'dest_title': dest_title,
+            'timestamp_dt': log.timestamp_dt,
+        }
+  return ans
 
 
 def _get_moves_from_api(wp10db, namespace, title, timestamp_dt):
@@ -119,6 +355,35 @@ def _get_redirects_from_api(wp10db, namespace, title, timestamp_dt):
   return None
 
 
+def _get_redirects_from_api_batch(wp10db, keys, timestamp_dt):
+  """Returns the move data of the redirects of the keys, from the API.
+
+  If the API can't be queried, the keys are left out of the result, so that
+  they are not cached as not moved.
+  """
+  titles = dict(
+      (key, logic_util.title_for_api(wp10db, key[0], key[1])) for key in keys)
+  try:
+    redirs = api_page.get_redirects(list(titles.values()))
+  except api_page.QUERY_ERRORS:
+    logger.exception('Error querying API for redirects, skipping %s articles',
+                     len(keys))
+    return {}
+
+  ans = {}
+  for key, title_with_ns in titles.items():
+    redir = redirs.get(title_with_ns)
+    if redir is not None and redir['timestamp_dt'] > timestamp_dt:
+      ans[key] = {
+          'dest_ns': redir['ns'],
+          'dest_title': redir['title'].encode('utf-8'),
+          'timestamp_dt': redir['timestamp_dt'],
+      }
+    else:
+      ans[key] = None
+  return ans
+
+
 def get_move_data(wp10db, wikidb, namespace, title, timestamp_dt):
   moves = _get_moves_from_api(wp10db, namespace, title, timestamp_dt)
   if moves:
@@ -130,3 +395,130 @@ def get_move_data(wp10db, wikidb, namespace, title, timestamp_dt):
 
   moves = _get_redirects_from_api(wp10db, namespace, title, timestamp_dt)
   return moves
+
+
+class MoveResolver:
+  """Looks up the move data of many articles, with concurrent API requests.
+
+  The moves are found in the replica logging table, MOVE_LOG_CHUNK_SIZE
+  articles per query, then the redirects in the replica,
+  MOVE_REDIRECT_CHUNK_SIZE articles per query, and lastly the
+  redirects in the API, which is only needed for redirects that are missing
+  from the replica. The API queries take API_MAX_TITLES_PER_QUERY articles
+  each and run on a pool of max_workers threads, with at most
+  MOVE_API_MAX_CONCURRENCY requests in flight across the process. The replica
+  lookups share wikidb, so they run in the calling thread.
+
+  With a MoveCache, the results of each step are cached and only the articles
+  that are not cached are looked up. Articles whose lookup failed are left out
+  of its results, so that they are looked up again next time.
+  """
+
+  def __init__(self,
+               wp10db,
+               wikidb,
+               cache=None,
+               max_workers=MOVE_RESOLVER_WORKERS):
+    self.wp10db = wp10db
+    self.wikidb = wikidb
+    self.cache = cache
+    self.max_workers = max_workers
+    self.api_requests = 0
+    self.api_secs = 0.0
+    self.db_queries = 0
+    self.db_secs = 0.0
+    self.wall_secs = 0.0
+    self._lock = threading.Lock()
+
+  def _api_request(self, lookup, *args):
+    with _api_slots:
+      start = time.monotonic()
+      try:
+        return lookup(self.wp10db, *args)
+      finally:
+        elapsed = time.monotonic() - start
+        with self._lock:
+          self.api_requests += 1
+          self.api_secs += elapsed
+
+  def _db_moves(self, keys, since_dt):
+    start = time.monotonic()
+    ans = get_moves_from_log(self.wp10db, self.wikidb, keys, since_dt)
+    self.db_queries += (len(keys) + MOVE_LOG_CHUNK_SIZE -
+                        1) // MOVE_LOG_CHUNK_SIZE
+    self.db_secs += time.monotonic() - start
+    return ans
+
+  def _db_redirects(self, keys, since_dt):
+    start = time.monotonic()
+    ans = get_redirects_from_db(self.wikidb, keys)
+    self.db_queries += (len(keys) + MOVE_REDIRECT_CHUNK_SIZE -
+                        1) // MOVE_REDIRECT_CHUNK_SIZE
+    self.db_secs += time.monotonic() - start
+    return ans
+
+  def _api_redirects(self, executor, keys, since_dt):
+    futures = [
+        executor.submit(self._api_request, _get_redirects_from_api_batch,
+                        keys[i:i + API_MAX_TITLES_PER_QUERY], since_dt)
+        for i in range(0, len(keys), API_MAX_TITLES_PER_QUERY)
+    ]
+    ans = {}
+    for future in futures:
+      ans.update(future.result())
+    return ans
+
+  def _step(self, name, lookup, move_data, timestamp_dt, filter_by_timestamp):
+    pending = [key for key, data in move_data.items() if data is None]
+    if self.cache is None:
+      found = lookup(pending, timestamp_dt)
+    else:
+      # The lookups are made from the start of the cache bucket, so their
+      # results are filtered by the actual timestamp below.
+      since_dt = self.cache.bucket_start(timestamp_dt)
+      found = self.cache.get_many(name, pending, timestamp_dt)
+      looked_up = lookup([key for key in pending if key not in found], since_dt)
+      self.cache.set_many(name, looked_up, timestamp_dt)
+      found.update(looked_up)
+
+    for key, data in found.items():
+      if data is None:
+        continue
+      if filter_by_timestamp and data['timestamp_dt'] <= timestamp_dt:
+        continue
+      move_data[key] = data
+
+  def resolve(self, keys, timestamp_dt):
+    """Returns a dict of (namespace, title) to the move data of the article.
+
+    The move data is the same as returned by get_move_data, None if no move or
+    redirect newer than timestamp_dt was found.
+    """
+    start = time.monotonic()
+    # The namespace names are read from wp10db, which can't be shared between
+    # threads. Load them before any lookup runs so that the threads only read
+    # the cached names.
+    logic_util.int_to_ns(self.wp10db)
+
+    move_data = dict((key, None) for key in keys)
+    with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+      self._step('db_moves', self._db_moves, move_data, timestamp_dt, True)
+      # Redirects in the replica are found regardless of the timestamp.
+      self._step('db_redirects', self._db_redirects, move_data, timestamp_dt,
+                 False)
+      self._step('api_redirects', partial(self._api_redirects, executor),
+                 move_data, timestamp_dt, True)
+
+    self.wall_secs += time.monotonic() - start
+    return move_data
+
+  def log_stats(self, project_name):
+    # api_secs is the time the requests would have taken one after the other,
+    # so its ratio to the wall time is the speedup of the thread pool.
+    logger.info(
+        'Resolved moves for %s: %s API requests taking %.1fs, '
+        '%s replica queries taking %.1fs, %.1fs in total',
+        project_name.decode('utf-8'), self.api_requests, self.api_secs,
+        self.db_queries, self.db_secs, self.wall_secs)
+    if self.cache is not None:
+      self.cache.log_stats(project_name)
@@ -1,11 +1,16 @@
 from datetime import datetime
-from unittest.mock import patch
 import time
+import unittest
+from unittest.mock import patch
 
 import attr
+import fakeredis
+import requests
 
 from wp1.base_db_test import BaseWikiDbTest, BaseWpOneDbTest, BaseCombinedDbTest
 from wp1.constants import TS_FORMAT
+from wp1.logic import log as logic_log
+from wp1.logic.move_cache import LruCache, MoveCache
 from wp1.logic import page as logic_page
 from wp1.logic import project as logic_project
 from wp1.models.wp10.log import Log
@@ -118,6 +123,39 @@ class LogicPageCategoryTest(BaseWikiDbTest):
     self.assertTrue(b'Superman Facts' in titles)
     self.assertTrue(b'Places Superman vacations' in titles)
 
+  def test_get_pages_by_categories(self):
+    with self.wikidb.cursor() as cursor:
+      cursor.execute(
+          '''
+          INSERT INTO categorylinks (cl_from, cl_to, cl_timestamp)
+          VALUES (100, 'Superman clothing', %s)
+      ''', (datetime(2018, 9, 30, 12, 30, 0),))
+    self.wikidb.commit()
+
+    titles = set()
+    for page in logic_page.get_pages_by_categories(
+        self.wikidb, [b'Articles about Superman', b'Superman clothing']):
+      titles.add((page.cl_to, page.page_title))
+
+    self.assertEqual(5, len(titles))
+    self.assertTrue((b'Superman clothing', b'The cape of Superman') in titles)
+    self.assertTrue((b'Articles about Superman',
+                     b'The cape of Superman') in titles)
+
+  def test_get_pages_by_categories_ns_filter(self):
+    titles = set()
+    for page in logic_page.get_pages_by_categories(
+        self.wikidb, [b'Articles about Superman', b'Unknown category'], ns=14):
+      titles.add(page.page_title)
+
+    self.assertEqual(2, len(titles))
+    self.assertTrue(b'Superman Facts' in titles)
+    self.assertTrue(b'Places Superman vacations' in titles)
+
+  def test_get_pages_by_categories_empty(self):
+    self.assertEqual([],
+                     list(logic_page.get_pages_by_categories(self.wikidb, [])))
+
 
 class LogicPageMovesTest(BaseCombinedDbTest):
 
@@ -235,6 +273,216 @@ class LogicPageMovesTest(BaseCombinedDbTest):
                                          datetime(2014, 1, 1))
     self.assertIsNone(move_data)
 
+  def _insert_move_log(self, namespace, title, timestamp, target):
+    params = b'a:2:{s:9:"4::target";s:%d:"%s";s:10:"5::noredir";s:1:"0";}' % (
+        len(target), target)
+    with self.wikidb.cursor() as cursor:
+      cursor.execute(
+          '''
+          INSERT INTO logging
+            (log_type, log_action, log_timestamp, log_namespace, log_title,
+             log_params)
+          VALUES ('move', 'move', %s, %s, %s, %s)
+      ''', (timestamp, namespace, title, params))
+    self.wikidb.commit()
+
+  def test_get_moves_from_log(self):
+    self._insert_move_log(0, b'Moved_Article', b'20110428123000',
+                          b'Article moved to')
+    self._insert_move_log(0, b'Project_Article', b'20110428123000',
+                          b'Wikipedia:Article moved to')
+
+    move_data = logic_page.get_moves_from_log(self.wp10db, self.wikidb,
+                                              [(0, b'Moved_Article'),
+                                               (0, b'Project_Article'),
+                                               (0, b'Other_Article')],
+                                              datetime(1970, 1, 1))
+
+    self.assertEqual(
+        {
+            (0, b'Moved_Article'): {
+                'dest_ns': 0,
+                'dest_title': b'Article_moved_to',
+                'timestamp_dt': self.expected_dt,
+            },
+            (0, b'Project_Article'): {
+                'dest_ns': 4,
+                'dest_title': b'Article_moved_to',
+                'timestamp_dt': self.expected_dt,
+            },
+            (0, b'Other_Article'): None,
+        }, move_data)
+
+  def test_get_moves_from_log_most_recent(self):
+    self._insert_move_log(0, b'Moved_Article', b'20100808123000',
+                          b'Some other article')
+    self._insert_move_log(0, b'Moved_Article', b'20110428123000',
+                          b'Article moved to')
+    self._insert_move_log(0, b'Moved_Article', b'20080808123000',
+                          b'Another crazy article')
+
+    move_data = logic_page.get_moves_from_log(self.wp10db, self.wikidb,
+                                              [(0, b'Moved_Article')],
+                                              datetime(1970, 1, 1))
+
+    self.assertEqual(b'Article_moved_to',
+                     move_data[(0, b'Moved_Article')]['dest_title'])
+
+  def test_get_moves_from_log_too_old(self):
+    self._insert_move_log(0, b'Moved_Article', b'20110428123000',
+                          b'Article moved to')
+
+    move_data = logic_page.get_moves_from_log(self.wp10db, self.wikidb,
+                                              [(0, b'Moved_Article')],
+                                              datetime(2014, 1, 1))
+
+    self.assertEqual({(0, b'Moved_Article'): None}, move_data)
+
+  @patch('wp1.logic.page.MOVE_LOG_CHUNK_SIZE', 2)
+  def test_get_moves_from_log_chunks(self):
+    keys = [(0, b'Article_%d' % i) for i in range(5)]
+    for namespace, title in keys:
+      self._insert_move_log(namespace, title, b'20110428123000',
+                            b'Moved ' + title)
+
+    move_data = logic_page.get_moves_from_log(self.wp10db, self.wikidb, keys,
+                                              datetime(1970, 1, 1))
+
+    for namespace, title in keys:
+      self.assertEqual(b'Moved_' + title,
+                       move_data[(namespace, title)]['dest_title'])
+
+  def _insert_redirect(self, page_id, namespace, title, dest_title):
+    with self.wikidb.cursor() as cursor:
+      cursor.execute(
+          '''
+          INSERT INTO page (page_id, page_namespace, page_title, page_touched)
+          VALUES (%s, %s, %s, %s)
+      ''', (page_id, namespace, title, b'20110428123000'))
+      cursor.execute(
+          '''
+          INSERT INTO redirect (rd_from, rd_namespace, rd_title)
+          VALUES (%s, 0, %s)
+      ''', (page_id, dest_title))
+    self.wikidb.commit()
+
+  def test_get_redirects_from_db(self):
+    self._insert_redirect(1, 0, b'Redirected_Article', b'Article_moved_to')
+    self._insert_redirect(2, 4, b'Project_Article', b'Article_moved_to')
+
+    move_data = logic_page.get_redirects_from_db(self.wikidb,
+                                                 [(0, b'Redirected Article'),
+                                                  (0, b'Project_Article'),
+                                                  (0, b'Other Article')])
+
+    self.assertEqual(
+        {
+            (0, b'Redirected Article'): {
+                'dest_ns': 0,
+                'dest_title': b'Article_moved_to',
+                'timestamp_dt': self.expected_dt,
+            },
+            (0, b'Project_Article'): None,
+            (0, b'Other Article'): None,
+        }, move_data)
+
+  @patch('wp1.logic.page.MOVE_REDIRECT_CHUNK_SIZE', 2)
+  def test_get_redirects_from_db_chunks(self):
+    keys = [(0, b'Article_%d' % i) for i in range(5)]
+    for i, (namespace, title) in enumerate(keys):
+      self._insert_redirect(i + 1, namespace, title, b'Moved_' + title)
+
+    move_data = logic_page.get_redirects_from_db(self.wikidb, keys)
+
+    for namespace, title in keys:
+      self.assertEqual(b'Moved_' + title,
+                       move_data[(namespace, title)]['dest_title'])
+
+  def test_get_redirects_from_db_empty(self):
+    self.assertEqual({}, logic_page.get_redirects_from_db(self.wikidb, []))
+
+  @patch('wp1.logic.api.page.site')
+  def test_resolver(self, patched_site):
+    self._insert_move_log(0, b'Moved Article', b'20110428123000',
+                          b'Article moved to')
+
+    def fake_api(*args, **kwargs):
+      self.assertEqual(':Redirected Article|:Deleted Article', kwargs['titles'])
+      return {
+          'query': {
+              'normalized': [{
+                  'from': ':Redirected Article',
+                  'to': 'Redirected Article',
+              }],
+              'redirects': [{
+                  'from': 'Redirected Article',
+                  'to': self.expected_title,
+              }],
+              'pages': self.api_return['query']['pages'],
+          },
+      }
+
+    patched_site.api.side_effect = fake_api
+    resolver = logic_page.MoveResolver(self.wp10db, self.wikidb, max_workers=3)
+    move_data = resolver.resolve([(0, b'Moved Article'),
+                                  (0, b'Redirected Article'),
+                                  (0, b'Deleted Article')],
+                                 datetime(1970, 1, 1))
+
+    self.assertEqual(3, len(move_data))
+    self.assertEqual(self.expected_title.encode('utf-8'),
+                     move_data[(0, b'Moved Article')]['dest_title'])
+    self.assertEqual(self.expected_title.encode('utf-8'),
+                     move_data[(0, b'Redirected Article')]['dest_title'])
+    self.assertIsNone(move_data[(0, b'Deleted Article')])
+    patched_site.logevents.assert_not_called()
+    self.assertEqual(1, resolver.api_requests)
+    self.assertEqual(2, resolver.db_queries)
+
+  @patch('wp1.logic.api.page.site')
+  def test_resolver_cached(self, patched_site):
+    self._insert_move_log(0, b'Moved Article', b'20110428123000',
+                          b'Article moved to')
+    cache = MoveCache(fakeredis.FakeStrictRedis(), local=LruCache())
+    keys = [(0, b'Moved Article'), (0, b'Other Article')]
+
+    first = logic_page.MoveResolver(self.wp10db, self.wikidb,
+                                    cache=cache).resolve(
+                                        keys, datetime(2011, 1, 1, 12, 30))
+    resolver = logic_page.MoveResolver(self.wp10db, self.wikidb, cache=cache)
+    second = resolver.resolve(keys, datetime(2011, 1, 1, 18, 0))
+
+    self.assertEqual(first, second)
+    self.assertEqual(self.expected_dt,
+                     second[(0, b'Moved Article')]['timestamp_dt'])
+    self.assertEqual(0, resolver.api_requests)
+    self.assertEqual(0, resolver.db_queries)
+    self.assertEqual(4, cache.local_hits)
+
+  @patch('wp1.logic.api.page.site')
+  def test_resolver_cached_filters_timestamp(self, patched_site):
+    self._insert_move_log(0, b'Moved Article', b'20110428123000',
+                          b'Article moved to')
+    cache = MoveCache(fakeredis.FakeStrictRedis(), local=LruCache())
+    keys = [(0, b'Moved Article')]
+
+    # The move is from 2011-04-28T12:30:00Z, so it is cached for the whole
+    # day but is only newer than the first timestamp.
+    logic_page.MoveResolver(self.wp10db, self.wikidb,
+                            cache=cache).resolve(keys,
+                                                 datetime(2011, 4, 28, 8, 0))
+    move_data = logic_page.MoveResolver(self.wp10db, self.wikidb,
+                                        cache=cache).resolve(
+                                            keys, datetime(2011, 4, 28, 18, 0))
+
+    self.assertEqual({(0, b'Moved Article'): None}, move_data)
+
+  @patch('wp1.logic.api.page.site')
+  def test_resolver_empty(self, patched_site):
+    resolver = logic_page.MoveResolver(self.wp10db, self.wikidb)
+    self.assertEqual({}, resolver.resolve([], datetime(1970, 1, 1)))
+    self.assertEqual(0, resolver.api_requests)
+
 
 class LogicPageMoveDbTest(BaseWpOneDbTest):
 
@@ -314,3 +562,69 @@ class LogicPageMoveDbTest(BaseWpOneDbTest):
 
     all_logs = get_all_logs(self.wp10db)
     self.assertEqual(1, len(all_logs))
+
+  def test_new_move_log_with_writer(self):
+    log_writer = logic_log.LogWriter(self.wp10db)
+    logic_page.update_page_moved(self.wp10db,
+                                 self.project,
+                                 self.old_ns,
+                                 self.old_article,
+                                 self.new_ns,
+                                 self.new_article,
+                                 self.dt,
+                                 log_writer=log_writer)
+
+    self.assertEqual(0, len(get_all_logs(self.wp10db)))
+    log_writer.flush()
+
+    all_logs = get_all_logs(self.wp10db)
+    self.assertEqual(1, len(all_logs))
+    self.assertEqual(b'moved', all_logs[0].l_action)
+
+
+@patch('wp1.logic.page.logic_util.title_for_api',
+       lambda wp10db, namespace, title: title.decode('utf-8'))
+@patch('wp1.logic.api.page.site')
+class ApiRedirectsErrorTest(unittest.TestCase):
+
+  keys = [(0, b'Foo'), (0, b'Bar')]
+
+  def setUp(self):
+    self.cache = MoveCache(fakeredis.FakeStrictRedis(), local=LruCache())
+
+  def _lookup(self, keys, since_dt):
+    return logic_page._get_redirects_from_api_batch(None, keys, since_dt)
+
+  def test_batch_leaves_out_failed(self, patched_site):
+    patched_site.api.side_effect = requests.exceptions.ConnectionError()
+
+    actual = logic_page._get_redirects_from_api_batch(None, self.keys,
+                                                      datetime(2011, 1, 1))
+
+    self.assertEqual({}, actual)
+
+  def test_failed_not_cached(self, patched_site):
+    patched_site.api.side_effect = requests.exceptions.ConnectionError()
+    resolver = logic_page.MoveResolver(None, None, cache=self.cache)
+    move_data = dict((key, None) for key in self.keys)
+
+    resolver._step('api_redirects', self._lookup, move_data,
+                   datetime(2011, 1, 1), True)
+
+    self.assertEqual({(0, b'Foo'): None, (0, b'Bar'): None}, move_data)
+    self.assertEqual({},
+                     self.cache.get_many('api_redirects', self.keys,
+                                         datetime(2011, 1, 1)))
+
+  def test_not_redirects_cached(self, patched_site):
+    patched_site.api.return_value = {'query': {}}
+    resolver = logic_page.MoveResolver(None, None, cache=self.cache)
+    move_data = dict((key, None) for key in self.keys)
+
+    resolver._step('api_redirects', self._lookup, move_data,
+                   datetime(2011, 1, 1), True)
+
+    self.assertEqual({
+        (0, b'Foo'): None,
+        (0, b'Bar'): None
+    }, self.cache.get_many('api_redirects', self.keys, datetime(2011, 1, 1)))
@@ -1,4 +1,7 @@
 from collections import defaultdict
+from datetime import datetime, timedelta
+import hashlib
+import json
 import logging
 import math
 import re
@@ -8,14 +11,15 @@ import attr
 
 from wp1 import api
 from wp1.conf import get_conf
-from wp1.constants import AssessmentKind, CATEGORY_NS_INT, GLOBAL_TIMESTAMP, GLOBAL_TIMESTAMP_WIKI, MAX_ARTICLES_BEFORE_COMMIT
-from wp1.logic import page as logic_page, util as logic_util, rating as logic_rating, category as logic_category
+from wp1.constants import AssessmentKind, CATEGORY_NS_INT, DELTA_UPDATE_CHUNK_SIZE, DELTA_UPDATE_OVERLAP_SECS, FULL_UPDATE_INTERVAL_DAYS, GLOBAL_TIMESTAMP, GLOBAL_TIMESTAMP_WIKI, MERGE_UPDATE_CHUNK_SIZE, MERGE_UPDATE_MIN_ARTICLES, MOVE_RESOLVER_BATCH_SIZE, PROGRESS_FLUSH_ITEMS, PROGRESS_FLUSH_SECS, TS_FORMAT_WP10, UPDATE_DURATION_WEIGHT, UPDATE_FAILURE_BACKOFF_SECS, UPDATE_FAILURE_MAX_BACKOFF_SECS
+from wp1.logic import page as logic_page, util as logic_util, rating as logic_rating, category as logic_category, transaction as logic_transaction, rating_index as logic_rating_index, move_cache as logic_move_cache, project_stats as logic_project_stats
 from wp1.logic.api import project as api_project
 from wp1.models.wiki.page import Page
 from wp1.models.wp10.category import Category
 from wp1.models.wp10.project import Project
 from wp1.models.wp10.rating import Rating
 from wp1.redis_db import connect as redis_connect
+from wp1.timestamp import utcnow
 from wp1 import tables
 from wp1.wp10_db import connect as wp10_connect
 from wp1.wiki_db import connect as wiki_connect
@@ -59,7 +63,10 @@ def update_global_project_count():
     wp10db.close()
 
 
-def update_project_by_name(project_name, track_progress=False):
+def update_project_by_name(project_name,
+                           track_progress=False,
+                           merge_join=None,
+                           force=False):
   wp10db = wp10_connect()
   wikidb = wiki_connect()
   redis = redis_connect()
@@ -70,60 +77,45 @@ def update_project_by_name(project_name, track_progress=False):
   logging.getLogger('requests_oauthlib').setLevel(logging.CRITICAL)
   logging.getLogger('oauthlib').setLevel(logging.CRITICAL)
 
+  start = time.monotonic()
   try:
     project = get_project_by_name(wp10db, project_name)
     if not project:
       project = Project(p_project=project_name,
                         p_timestamp=GLOBAL_TIMESTAMP_WIKI)
+    # Manual updates, which track their progress, always run in full.
     update_project(wikidb,
                    wp10db,
                    project,
                    redis=redis,
-                   track_progress=track_progress)
+                   track_progress=track_progress,
+                   merge_join=merge_join,
+                   force=force or track_progress)
 
     if track_progress:
       redis.expire(_project_progress_key(project_name), 600)
+    record_update_duration(redis, project_name, time.monotonic() - start)
+    clear_update_failures(redis, project_name)
+  except Exception:
+    until = record_update_failure(redis, project_name)
+    logger.warning('Update of %s failed, backing off until %s',
+                   project_name.decode('utf-8'), until)
+    raise
   finally:
+    clear_project_in_flight(redis, project_name)
+    if not track_progress and pop_manual_follow_up(redis, project_name):
+      _enqueue_manual_follow_up(redis, project_name)
     wp10db.close()
     wikidb.close()
 
 
-def update_global_articles_for_project_name(wp10db, project_name):
-  logger.info('Executing global update for: %s' % project_name.decode('utf-8'))
-  with wp10db.cursor() as cursor:
-    cursor.execute(
-        '''
-        REPLACE INTO global_articles
-        SELECT art, max(qrating), max(irating), max(score)
-        FROM (
-          SELECT art, qrating, irating, score FROM
-            (SELECT a_article AS art, a_quality AS qrating,
-                    a_importance AS irating, a_score AS score
-             FROM global_articles
-             JOIN ratings
-               ON r_namespace = 0 AND r_project = %(project)s AND
-                  a_article = r_article
-            ) as t1
-            UNION
-            (SELECT r_article AS art, qual.gr_ranking AS qrating,
-                    imp.gr_ranking AS irating, r_score AS score
-             FROM ratings
-             JOIN categories AS ci
-               ON r_project = ci.c_project AND ci.c_type = 'importance' AND
-                  r_importance = ci.c_rating
-             JOIN categories AS cq
-               ON r_project = cq.c_project AND
-                  cq.c_type = 'quality' AND r_quality = cq.c_rating
-             JOIN global_rankings AS qual
-               ON qual.gr_type = 'quality' AND qual.gr_rating = cq.c_replacement
-             JOIN global_rankings AS imp
-               ON imp.gr_type = 'importance' AND
-                  imp.gr_rating = ci.c_replacement
-             WHERE r_namespace = 0 AND r_project = %(project)s)
-        ) as t2
-        GROUP BY art
-    ''', {'project': project_name})
-  wp10db.commit()
+def _enqueue_manual_follow_up(redis, project_name):
+  # wp1.queues enqueues the jobs of this module, so it can't be imported at
+  # the top of it.
+  from wp1 import queues
+  logger.info('Enqueuing the manual update requested while updating %s',
+              project_name.decode('utf-8'))
+  queues.enqueue_single_project(redis, project_name, manual=True)
 
 
 def project_names_to_update(wikidb):
@@ -162,7 +154,9 @@ def insert_or_update(wp10db, project):
         SET p_timestamp=%(p_timestamp)s, p_wikipage=%(p_wikipage)s,
             p_parent=%(p_parent)s, p_shortname=%(p_shortname)s,
             p_count=%(p_count)s, p_qcount=%(p_qcount)s, p_icount=%(p_icount)s,
-            p_upload_timestamp=%(p_upload_timestamp)s, p_scope=%(p_scope)s
+            p_upload_timestamp=%(p_upload_timestamp)s, p_scope=%(p_scope)s,
+            p_fingerprint=%(p_fingerprint)s,
+            p_full_timestamp=%(p_full_timestamp)s
         WHERE p_project=%(p_project)s
     ''', attr.asdict(project))
     if cursor.rowcount == 0:
@@ -171,11 +165,13 @@ def insert_or_update(wp10db, project):
           '''
           INSERT INTO projects
             (p_project, p_timestamp, p_wikipage, p_parent, p_shortname, p_count,
-             p_qcount, p_icount, p_upload_timestamp, p_scope)
+             p_qcount, p_icount, p_upload_timestamp, p_scope, p_fingerprint,
+             p_full_timestamp)
           VALUES
             (%(p_project)s, %(p_timestamp)s, %(p_wikipage)s, %(p_parent)s,
              %(p_shortname)s, %(p_count)s, %(p_qcount)s, %(p_icount)s,
-             %(p_upload_timestamp)s, %(p_scope)s)
+             %(p_upload_timestamp)s, %(p_scope)s, %(p_fingerprint)s,
+             %(p_full_timestamp)s)
           ON DUPLICATE KEY UPDATE p_timestamp = %(p_timestamp)s
       ''', attr.asdict(project))
   wp10db.commit()
@@ -267,32 +263,64 @@ def create_not_a_class_categories(wp10db, project):
     logic_category.insert_or_update(wp10db, category)
 
 
-def update_project_categories_by_kind(wikidb, wp10db, project, extra, kind):
+def update_project_categories(wikidb,
+                              wp10db,
+                              project,
+                              extra,
+                              kinds=(AssessmentKind.QUALITY,
+                                     AssessmentKind.IMPORTANCE)):
+  """Updates the categories of a project and returns their rating mappings.
+
+  The category pages for all of the given kinds are fetched from the replica
+  with a single query. The return value is a dict of AssessmentKind to the
+  rating_to_category mapping of that kind.
+  """
   logger.info('Updating project categories for %s', project.p_project)
-  rating_to_category = {}
-  category_name_main = logic_util.category_for_project_by_kind(
-      project.p_project, kind, category_prefix=False)
-  category_name_alt = logic_util.category_for_project_by_kind(
-      project.p_project, kind, category_prefix=False, use_alt=True)
-
-  found_page = False
-  for category_name in (category_name_main, category_name_alt):
-    for page in logic_page.get_pages_by_category(wikidb,
-                                                 category_name,
-                                                 ns=CATEGORY_NS_INT):
-      found_page = True
-      update_category(wp10db, project, page, extra, kind, rating_to_category)
-
-    # There might not be any pages listed "by importance" so we have to check
-    # the alternate name ("by priority"), unless we already found pages.
-    if found_page:
-      break
+  category_names = {}
+  for kind in kinds:
+    category_names[kind] = (
+        logic_util.category_for_project_by_kind(project.p_project,
+                                                kind,
+                                                category_prefix=False),
+        logic_util.category_for_project_by_kind(project.p_project,
+                                                kind,
+                                                category_prefix=False,
+                                                use_alt=True),
+    )
+
+  pages_by_category = defaultdict(list)
+  for page in logic_page.get_pages_by_categories(
+      wikidb, [name for names in category_names.values() for name in names],
+      ns=CATEGORY_NS_INT):
+    pages_by_category[page.cl_to].append(page)
+
+  rating_to_category_by_kind = {}
+  for kind, names in category_names.items():
+    rating_to_category = {}
+    for category_name in names:
+      pages = pages_by_category.get(category_name)
+      # There might not be any pages listed "by importance" so we have to check
+      # the alternate name ("by priority"), unless we already found pages.
+      if pages:
+        for page in pages:
+          update_category(wp10db, project, page, extra, kind,
+                          rating_to_category)
+        break
+    rating_to_category_by_kind[kind] = rating_to_category
 
   # There is no wiki category for NotA-Class, but we need to make categories
   # for it so that it shows up in the assessment table.
   create_not_a_class_categories(wp10db, project)
 
-  return rating_to_category
+  return rating_to_category_by_kind
+
+
+def update_project_categories_by_kind(wikidb, wp10db, project, extra, kind):
+  return update_project_categories(wikidb,
+                                   wp10db,
+                                   project,
+                                   extra,
+                                   kinds=(kind,))[kind]
 
 
 def _project_progress_key(project_name):
@@ -313,6 +341,97 @@ def get_project_progress(redis, project_name):
   return redis.hmget(key, ('progress', 'work'))
 
 
+# The projects that have an update job queued or running, see wp1.queues. The
+# job removes its project when it ends.
+PROJECTS_IN_FLIGHT_KEY = b'projects_in_flight'
+
+
+def mark_project_in_flight(redis, project_name):
+  """Adds the project to the in-flight projects.
+
+  Returns False if it was already in flight.
+  """
+  return bool(redis.sadd(PROJECTS_IN_FLIGHT_KEY, project_name))
+
+
+def clear_project_in_flight(redis, project_name):
+  redis.srem(PROJECTS_IN_FLIGHT_KEY, project_name)
+
+
+# The projects whose manual update was requested while an update that doesn't
+# track its progress was running. That update enqueues the manual update when
+# it ends.
+MANUAL_FOLLOW_UPS_KEY = b'manual_follow_ups'
+
+
+def request_manual_follow_up(redis, project_name):
+  redis.sadd(MANUAL_FOLLOW_UPS_KEY, project_name)
+
+
+def pop_manual_follow_up(redis, project_name):
+  """Returns True if a manual follow-up was requested, and clears it."""
+  return bool(redis.srem(MANUAL_FOLLOW_UPS_KEY, project_name))
+
+
+# The average number of seconds that the update of each project took, which
+# the scheduler uses to order the projects.
+UPDATE_DURATIONS_KEY = b'project_update_secs'
+
+
+def record_update_duration(redis, project_name, secs):
+  """Adds the duration of an update to the average of the project.
+
+  The average is exponentially weighted, so that it follows projects that
+  grow or shrink. There is only one update of a project in flight at a time,
+  so it is not updated concurrently.
+  """
+  previous = redis.hget(UPDATE_DURATIONS_KEY, project_name)
+  if previous is not None:
+    secs = (UPDATE_DURATION_WEIGHT * secs +
+            (1 - UPDATE_DURATION_WEIGHT) * float(previous))
+  redis.hset(UPDATE_DURATIONS_KEY, project_name, secs)
+
+
+def get_update_durations(redis):
+  """Returns a dict of project name to its average update seconds."""
+  return dict(
+      (project_name, float(secs))
+      for project_name, secs in redis.hgetall(UPDATE_DURATIONS_KEY).items())
+
+
+# The number of consecutive failed updates of each project, and the time,
+# in TS_FORMAT_WP10, until which the scheduler backs off from updating it.
+UPDATE_FAILURES_KEY = b'project_update_failures'
+UPDATE_BACKOFFS_KEY = b'project_update_backoffs'
+
+
+def record_update_failure(redis, project_name):
+  """Records a failed update of the project, and returns the end of its backoff.
+
+  The backoff is UPDATE_FAILURE_BACKOFF_SECS, doubled for each consecutive
+  failure, up to UPDATE_FAILURE_MAX_BACKOFF_SECS.
+  """
+  failures = redis.hincrby(UPDATE_FAILURES_KEY, project_name, 1)
+  secs = UPDATE_FAILURE_BACKOFF_SECS
+  for _ in range(failures - 1):
+    secs = min(2 * secs, UPDATE_FAILURE_MAX_BACKOFF_SECS)
+  until = utcnow() + timedelta(seconds=secs)
+  redis.hset(UPDATE_BACKOFFS_KEY, project_name, until.strftime(TS_FORMAT_WP10))
+  return until
+
+
+def clear_update_failures(redis, project_name):
+  redis.hdel(UPDATE_FAILURES_KEY, project_name)
+  redis.hdel(UPDATE_BACKOFFS_KEY, project_name)
+
+
+def get_update_backoffs(redis):
+  """Returns a dict of project name to the end of its backoff, as a datetime."""
+  return dict(
+      (project_name, datetime.strptime(until.decode('utf-8'), TS_FORMAT_WP10))
+      for project_name, until in redis.hgetall(UPDATE_BACKOFFS_KEY).items())
+
+
 def count_initial_work(redis, wp10db, project_name):
   if redis is None:
     logger.error(
@@ -328,12 +447,54 @@ def count_initial_work(redis, wp10db, project_name):
   redis.hset(key, 'progress', 0)
 
 
-def increment_progress_count(redis, project_name):
+def increment_progress_count(redis, project_name, n=1):
   if redis is None:
     return
 
   key = _project_progress_key(project_name)
-  redis.hincrby(key, 'progress', 1)
+  redis.hincrby(key, 'progress', n)
+
+
+class ProgressReporter:
+  """Batches the progress increments of a manual project update.
+
+  Callers report each processed category member with increment(). The
+  increments are added up locally and written to Redis once batch_size of
+  them are pending or max_secs have passed since the last write, whichever
+  comes first, so that the update doesn't wait on Redis for every article.
+  The pending increments must be written with flush() at the end of each
+  phase of the update. Without a redis, nothing is tracked.
+  """
+
+  def __init__(self,
+               redis,
+               project_name,
+               batch_size=PROGRESS_FLUSH_ITEMS,
+               max_secs=PROGRESS_FLUSH_SECS):
+    self.redis = redis
+    self.project_name = project_name
+    self.batch_size = batch_size
+    self.max_secs = max_secs
+    self._pending = 0
+    self._last_flush_time = time.monotonic()
+
+  def increment(self, n=1):
+    if self.redis is None:
+      return
+    self._pending += n
+    if (self._pending >= self.batch_size or
+        time.monotonic() - self._last_flush_time >= self.max_secs):
+      self.flush()
+
+  def flush(self):
+    if self._pending:
+      increment_progress_count(self.redis, self.project_name, self._pending)
+      self._pending = 0
+    self._last_flush_time = time.monotonic()
+
+
+def _progress_reporter(redis, project, track_progress):
+  return ProgressReporter(redis if track_progress else None, project.p_project)
 
 
 def update_project_assessments(wikidb,
@@ -341,33 +502,95 @@ def update_project_assessments(wikidb,
                                project,
                                extra_assessments,
                                redis=None,
-                               track_progress=False):
-  old_ratings = {}
-  for rating in logic_rating.get_project_ratings(wp10db, project.p_project):
-    rating_ref = (str(rating.r_namespace).encode('utf-8') + b':' +
-                  rating.r_article)
-    old_ratings[rating_ref] = rating
+                               track_progress=False,
+                               merge_join=None,
+                               since_dt=None,
+                               counts=None):
+  """Updates the ratings of a project from its assessment categories.
+
+  There are two full update engines that write the same ratings and logs. By
+  default, the existing ratings are loaded into a RatingIndex and the
+  category members are looked up in it. With merge_join, both are streamed
+  in article order and diffed in a single merge pass instead, which keeps
+  memory constant regardless of the size of the project. If merge_join is
+  None, it is used for projects with at least MERGE_UPDATE_MIN_ARTICLES
+  articles.
+
+  If since_dt is given, only the memberships added after it are applied, see
+  delta_project_assessments, unless the rating categories of the project
+  changed. The changes to the counts of the project are added to counts, a
+  RatingCounts, if given. Returns True if the project was updated in full.
+  """
+  if merge_join is None:
+    merge_join = (project.p_count or 0) >= MERGE_UPDATE_MIN_ARTICLES
 
   if track_progress:
     count_initial_work(redis, wp10db, project.p_project)
 
-  seen = set()
+  transaction = logic_transaction.UpdateTransaction(wp10db, counts=counts)
+  old_categories = set(
+      logic_category.get_category_names_for_project(wp10db, project.p_project))
+  rating_to_category_by_kind = update_project_categories(
+      wikidb, wp10db, project, extra_assessments)
+
+  if since_dt is not None:
+    new_categories = set(
+        category for rating_to_category in rating_to_category_by_kind.values()
+        for category, ranking in rating_to_category.values())
+    if new_categories != old_categories:
+      logger.info('Rating categories of %s changed, updating in full',
+                  project.p_project.decode('utf-8'))
+    else:
+      delta_project_assessments(wikidb,
+                                wp10db,
+                                project,
+                                rating_to_category_by_kind,
+                                since_dt,
+                                redis=redis,
+                                track_progress=track_progress,
+                                transaction=transaction)
+      transaction.log_stats(project.p_project)
+      return False
+
+  if merge_join:
+    logger.info('Updating %s with the merge join engine',
+                project.p_project.decode('utf-8'))
+    merge_project_assessments(wikidb,
+                              wp10db,
+                              project,
+                              rating_to_category_by_kind,
+                              redis=redis,
+                              track_progress=track_progress,
+                              transaction=transaction)
+    transaction.log_stats(project.p_project)
+    return True
+
+  index = logic_rating_index.RatingIndex.from_ratings(
+      project.p_project,
+      logic_rating.iter_project_ratings(wp10db, project.p_project))
+  new_ratings_by_kind = get_new_ratings(wikidb,
+                                        wp10db,
+                                        project,
+                                        rating_to_category_by_kind,
+                                        index,
+                                        redis=redis,
+                                        track_progress=track_progress,
+                                        transaction=transaction)
   for kind in (AssessmentKind.QUALITY, AssessmentKind.IMPORTANCE):
-    logger.debug('Updating %s assessments by %s',
+    logger.debug('Storing %s assessments by %s',
                  project.p_project.decode('utf-8'), kind)
-    new_ratings, rating_to_category = update_project_assessments_by_kind(
-        wikidb,
-        wp10db,
-        project,
-        extra_assessments,
-        kind,
-        old_ratings,
-        seen,
-        redis=redis,
-        track_progress=track_progress)
-    store_new_ratings(wp10db, new_ratings, old_ratings, rating_to_category)
+    store_new_ratings(wp10db,
+                      new_ratings_by_kind[kind],
+                      transaction=transaction)
 
-  process_unseen_articles(wikidb, wp10db, project, old_ratings, seen)
+  process_unseen_articles(wikidb,
+                          wp10db,
+                          project,
+                          index,
+                          redis=redis,
+                          transaction=transaction)
+  transaction.log_stats(project.p_project)
+  return True
 
 
 def update_project_assessments_by_kind(wikidb,
@@ -375,10 +598,10 @@ def update_project_assessments_by_kind(wikidb,
                                        project,
                                        extra_assessments,
                                        kind,
-                                       old_ratings,
-                                       seen,
+                                       index,
                                        redis=None,
-                                       track_progress=False):
+                                       track_progress=False,
+                                       transaction=None):
   if kind not in (AssessmentKind.QUALITY, AssessmentKind.IMPORTANCE):
     raise ValueError('Parameter "kind" was not one of QUALITY or IMPORTANCE')
 
@@ -386,99 +609,476 @@ def update_project_assessments_by_kind(wikidb,
   rating_to_category = update_project_categories_by_kind(
       wikidb, wp10db, project, extra_assessments, kind)
 
-  n = 0
-  new_ratings = defaultdict(list)
-  for current_rating, (category, ranking) in rating_to_category.items():
-    logger.info('Fetching article list for %r' % category.decode('utf-8'))
-    current_rating = current_rating.encode('utf-8')
-
-    for page in logic_page.get_pages_by_category(wikidb, category):
-      # Talk pages are tagged, we want the NS of the article itself.
-      namespace = page.page_namespace - 1
-      if not logic_util.is_namespace_acceptable(namespace):
-        logger.debug('Skipping %s with namespace=%s', page.page_title,
-                     namespace)
-        continue
+  return get_new_ratings(wikidb,
+                         wp10db,
+                         project, {kind: rating_to_category},
+                         index,
+                         redis=redis,
+                         track_progress=track_progress,
+                         transaction=transaction)[kind]
+
+
+def get_new_ratings(wikidb,
+                    wp10db,
+                    project,
+                    rating_to_category_by_kind,
+                    index,
+                    redis=None,
+                    track_progress=False,
+                    transaction=None):
+  """Computes the new ratings of a project from its category memberships.
+
+  The members of every rating category, of every kind, are fetched with a
+  single streamed replica query and demultiplexed back into their categories
+  here. Every article found is marked as seen in the RatingIndex of the
+  project's existing ratings, and the page id of its talk page is recorded if
+  it changed. Returns a dict of AssessmentKind to the NewRatings of that kind.
+  """
+  if transaction is None:
+    transaction = logic_transaction.UpdateTransaction(wp10db)
+
+  progress = _progress_reporter(redis, project, track_progress)
+  category_to_ratings = _category_to_ratings(rating_to_category_by_kind)
+  new_ratings_by_kind = dict(
+      (kind, logic_rating_index.NewRatings(index, kind, rating_to_category))
+      for kind, rating_to_category in rating_to_category_by_kind.items())
+  logger.info('Fetching article lists for %s categories',
+              len(category_to_ratings))
+  for page in logic_page.get_pages_by_categories(wikidb, category_to_ratings):
+    # Talk pages are tagged, we want the NS of the article itself.
+    namespace = page.page_namespace - 1
+    if not logic_util.is_namespace_acceptable(namespace):
+      logger.debug('Skipping %s with namespace=%s', page.page_title, namespace)
+      continue
 
-      article_ref = str(namespace).encode('utf-8') + b':' + page.page_title
-      seen.add(article_ref)
-
-      old_rating = old_ratings.get(article_ref)
-      old_rating_value = None
-
-      if old_rating:
-        rating = Rating(**attr.asdict(old_rating))
-        if kind == AssessmentKind.QUALITY:
-          old_rating_value = rating.r_quality
-        elif kind == AssessmentKind.IMPORTANCE:
-          old_rating_value = rating.r_importance
-      else:
-        rating = Rating(r_project=project.p_project,
-                        r_namespace=namespace,
-                        r_article=page.page_title,
-                        r_score=0)
-        old_rating_value = NOT_A_CLASS.encode('utf-8')
+    # New ratings are inserted with their page id.
+    position = index.find(namespace, page.page_title)
+    if position is not None:
+      index.mark_seen(position)
+      if index.page_id(position) != page.page_id:
+        index.set_page_id(position, page.page_id)
+        transaction.page_ids.add(project.p_project, namespace, page.page_title,
+                                 page.page_id)
+
+    for kind, current_rating in category_to_ratings[page.cl_to]:
+      new_ratings_by_kind[kind].add(namespace,
+                                    page.page_title,
+                                    current_rating,
+                                    page.cl_timestamp,
+                                    position=position,
+                                    page_id=page.page_id)
+      transaction.row_done()
+      progress.increment()
+  progress.flush()
+  logger.info('End, committing db')
+  transaction.commit()
+
+  return new_ratings_by_kind
+
+
+def _category_to_ratings(rating_to_category_by_kind):
+  # A category could in theory carry a rating of each kind, so each category
+  # maps to a list of (kind, rating).
+  category_to_ratings = defaultdict(list)
+  for kind, rating_to_category in rating_to_category_by_kind.items():
+    for current_rating, (category, ranking) in rating_to_category.items():
+      category_to_ratings[category].append(
+          (kind, current_rating.encode('utf-8')))
+  return category_to_ratings
+
+
+def _iter_member_groups(wikidb, category_to_ratings, pages=None):
+  """Yields ((namespace, title), page_id, members) for the category articles.
+
+  The articles are yielded in (namespace, title) order, each with the page id
+  of its talk page and the list of (kind, rating, cl_timestamp) of every
+  rating category that it is in.
+  """
+  key = None
+  page_id = None
+  members = []
+  for page in logic_page.get_pages_by_categories(wikidb,
+                                                 category_to_ratings,
+                                                 ordered=True,
+                                                 pages=pages):
+    # Talk pages are tagged, we want the NS of the article itself.
+    namespace = page.page_namespace - 1
+    if not logic_util.is_namespace_acceptable(namespace):
+      logger.debug('Skipping %s with namespace=%s', page.page_title, namespace)
+      continue
 
+    if (namespace, page.page_title) != key:
+      if members:
+        yield key, page_id, members
+      key = (namespace, page.page_title)
+      members = []
+    page_id = page.page_id
+    for kind, current_rating in category_to_ratings[page.cl_to]:
+      members.append((kind, current_rating, page.cl_timestamp))
+
+  if members:
+    yield key, page_id, members
+
+
+def _rankings_by_kind(rating_to_category_by_kind):
+  return dict(
+      (kind,
+       dict((current_rating.encode('utf-8'), ranking)
+            for current_rating, (category,
+                                 ranking) in rating_to_category.items()))
+      for kind, rating_to_category in rating_to_category_by_kind.items())
+
+
+def _update_article_ratings(wp10db, project, key, page_id, members, current,
+                            rankings_by_kind, transaction):
+  """Stores the new ratings of one article from its category memberships.
+
+  members is the list of (kind, rating, cl_timestamp) of the article, current
+  its existing Rating or None. page_id is the page id of its talk page, which
+  is recorded if it changed, or inserted with the rating if it is new.
+  """
+  if current is not None and current.r_page_id != page_id:
+    transaction.page_ids.add(project.p_project, key[0], key[1], page_id)
+
+  # Only the highest ranked rating of each kind counts. On ties, the first
+  # one found wins.
+  best = {}
+  for kind, current_rating, timestamp_dt in members:
+    rankings = rankings_by_kind[kind]
+    if (kind not in best or rankings[current_rating] > rankings[best[kind][0]]):
+      best[kind] = (current_rating, timestamp_dt)
+
+  for kind, (current_rating, timestamp_dt) in best.items():
+    if current is None:
+      rating = Rating(r_project=project.p_project,
+                      r_namespace=key[0],
+                      r_article=key[1],
+                      r_score=0,
+                      r_page_id=page_id)
+      old_rating_value = NOT_A_CLASS.encode('utf-8')
+    else:
+      rating = Rating(**attr.asdict(current))
       if kind == AssessmentKind.QUALITY:
-        rating.r_quality = current_rating
-        rating.set_quality_timestamp_dt(page.cl_timestamp)
+        old_rating_value = current.r_quality
       elif kind == AssessmentKind.IMPORTANCE:
-        rating.r_importance = current_rating
-        rating.set_importance_timestamp_dt(page.cl_timestamp)
-
-      new_ratings[article_ref].append((rating, kind, old_rating_value))
-      n += 1
-      if n >= MAX_ARTICLES_BEFORE_COMMIT:
-        wp10db.ping()
-        wp10db.commit()
+        old_rating_value = current.r_importance
 
-      if track_progress:
-        increment_progress_count(redis, project.p_project)
+    if kind == AssessmentKind.QUALITY:
+      rating.r_quality = current_rating
+      rating.set_quality_timestamp_dt(timestamp_dt)
+    elif kind == AssessmentKind.IMPORTANCE:
+      rating.r_importance = current_rating
+      rating.set_importance_timestamp_dt(timestamp_dt)
+
+    if current is None or current_rating != old_rating_value:
+      _store_rating(wp10db,
+                    rating,
+                    kind,
+                    old_rating_value,
+                    transaction,
+                    new_row=current is None)
+
+
+def merge_project_assessments(wikidb,
+                              wp10db,
+                              project,
+                              rating_to_category_by_kind,
+                              redis=None,
+                              track_progress=False,
+                              transaction=None):
+  """Updates the ratings of a project with a single sorted merge pass.
+
+  The existing ratings are read in (r_namespace, r_article) order, in chunks
+  so that wp10db stays usable for writes, and the category members are
+  streamed from the replica in the same order. Only the current rating and
+  the current article are held in memory, along with the ratings of articles
+  that are no longer in any category, which are processed after the replica
+  stream is closed because their move lookups also query the replica.
+  """
+  if transaction is None:
+    transaction = logic_transaction.UpdateTransaction(wp10db)
+
+  progress = _progress_reporter(redis, project, track_progress)
+  rankings_by_kind = _rankings_by_kind(rating_to_category_by_kind)
+  category_to_ratings = _category_to_ratings(rating_to_category_by_kind)
+
+  old_ratings = logic_rating.iter_project_ratings(
+      wp10db, project.p_project, chunk_size=MERGE_UPDATE_CHUNK_SIZE)
+  old_rating = next(old_ratings, None)
+  unseen = []
+  logger.info('Merging article lists for %s categories',
+              len(category_to_ratings))
+  for key, page_id, members in _iter_member_groups(wikidb, category_to_ratings):
+    while (old_rating is not None and
+           (old_rating.r_namespace, old_rating.r_article) < key):
+      unseen.append(old_rating)
+      old_rating = next(old_ratings, None)
+
+    current = None
+    if (old_rating is not None and
+        (old_rating.r_namespace, old_rating.r_article) == key):
+      current = old_rating
+      old_rating = next(old_ratings, None)
+
+    transaction.row_done(len(members))
+    progress.increment(len(members))
+    _update_article_ratings(wp10db, project, key, page_id, members, current,
+                            rankings_by_kind, transaction)
+  progress.flush()
+
+  while old_rating is not None:
+    unseen.append(old_rating)
+    old_rating = next(old_ratings, None)
+
+  logger.debug('Processing %s unseen articles', len(unseen))
+  _process_unseen_ratings(wikidb,
+                          wp10db,
+                          project,
+                          unseen,
+                          transaction,
+                          redis=redis)
   logger.info('End, committing db')
-  wp10db.ping()
-  wp10db.commit()
+  transaction.commit()
+
+
+def _find_vanished_ratings(wikidb, wp10db, project, rating_to_category_by_kind):
+  """Returns the ratings whose article is no longer in the rating's category.
+
+  Only the categories whose number of members differs from the number of
+  articles with the matching rating are diffed. Articles in more than one
+  category of the same kind make the numbers differ, which costs an unneeded
+  diff, and can also mask a removal until the next full update.
+  """
+  member_counts = defaultdict(int)
+  for db_count in logic_page.get_category_member_counts(
+      wikidb, _category_to_ratings(rating_to_category_by_kind)):
+    if logic_util.is_namespace_acceptable(db_count['page_namespace'] - 1):
+      member_counts[db_count['cl_to']] += db_count['count']
+
+  vanished = {}
+  for kind, rating_to_category in rating_to_category_by_kind.items():
+    rating_counts = logic_rating.count_project_ratings_by_value(
+        wp10db, project.p_project, kind)
+    for current_rating, (category, ranking) in rating_to_category.items():
+      current_rating = current_rating.encode('utf-8')
+      if rating_counts.get(current_rating, 0) == member_counts[category]:
+        continue
 
-  return (new_ratings, rating_to_category)
+      logger.debug('Diffing category %s with %s members against %s ratings',
+                   category.decode('utf-8'), member_counts[category],
+                   rating_counts.get(current_rating, 0))
+      members = set(
+          (page.page_namespace - 1, page.page_title)
+          for page in logic_page.get_pages_by_category(wikidb, category))
+      for rating in logic_rating.get_project_ratings_by_value(
+          wp10db, project.p_project, kind, current_rating):
+        key = (rating.r_namespace, rating.r_article)
+        if key not in members:
+          vanished[key] = rating
 
+  return [vanished[key] for key in sorted(vanished)]
 
-def store_new_ratings(wp10db, new_ratings, old_ratings, rating_to_category):
 
-  def sort_rating_tuples(rating_tuple):
-    rating, kind, _ = rating_tuple
-    if kind == AssessmentKind.QUALITY:
-      return rating_to_category[rating.r_quality.decode('utf-8')][1]  # ranking
-    if kind == AssessmentKind.IMPORTANCE:
-      return rating_to_category[rating.r_importance.decode('utf-8')][
-          1]  # ranking
+def _rate_articles(wikidb,
+                   wp10db,
+                   project,
+                   category_to_ratings,
+                   rankings_by_kind,
+                   pages,
+                   current_ratings,
+                   transaction,
+                   progress=None):
+  """Rates the given talk pages from all of their category memberships.
+
+  pages is a list of (page_namespace, page_title) and current_ratings a dict
+  of (namespace, article) to the existing Rating of the article. Each category
+  member is reported to the ProgressReporter progress, if given. Returns the
+  set of (namespace, article) that are in any of the categories.
+  """
+  seen = set()
+  for key, page_id, members in _iter_member_groups(wikidb,
+                                                   category_to_ratings,
+                                                   pages=pages):
+    seen.add(key)
+    transaction.row_done(len(members))
+    if progress is not None:
+      progress.increment(len(members))
+    _update_article_ratings(wp10db, project, key, page_id, members,
+                            current_ratings.get(key), rankings_by_kind,
+                            transaction)
+  return seen
+
+
+def delta_project_assessments(wikidb,
+                              wp10db,
+                              project,
+                              rating_to_category_by_kind,
+                              since_dt,
+                              redis=None,
+                              track_progress=False,
+                              transaction=None):
+  """Updates the ratings of a project from the memberships added since since_dt.
+
+  Only the articles that were added to one of the rating categories after
+  since_dt are rated again, from all of their current memberships. Articles
+  that were removed from the category of their rating are then found with
+  _find_vanished_ratings and rated again, or processed like the unseen
+  articles of a full update if they are not in any rating category. Changes
+  that leave no trace in either, such as a talk page being renamed, are picked
+  up by the periodic full update.
+  """
+  if transaction is None:
+    transaction = logic_transaction.UpdateTransaction(wp10db)
+
+  progress = _progress_reporter(redis, project, track_progress)
+  rankings_by_kind = _rankings_by_kind(rating_to_category_by_kind)
+  category_to_ratings = _category_to_ratings(rating_to_category_by_kind)
+
+  changed = set()
+  for page in logic_page.get_pages_by_categories(wikidb,
+                                                 category_to_ratings,
+                                                 since=since_dt):
+    if logic_util.is_namespace_acceptable(page.page_namespace - 1):
+      changed.add((page.page_namespace, page.page_title))
+  changed = sorted(changed)
+  logger.info('Found %s articles with new memberships since %s', len(changed),
+              since_dt)
+
+  for i in range(0, len(changed), DELTA_UPDATE_CHUNK_SIZE):
+    pages = changed[i:i + DELTA_UPDATE_CHUNK_SIZE]
+    current_ratings = dict(
+        ((rating.r_namespace, rating.r_article), rating)
+        for rating in logic_rating.get_project_ratings_for_articles(
+            wp10db, project.p_project, [(ns - 1, title)
+                                        for ns, title in pages]))
+    _rate_articles(wikidb,
+                   wp10db,
+                   project,
+                   category_to_ratings,
+                   rankings_by_kind,
+                   pages,
+                   current_ratings,
+                   transaction,
+                   progress=progress)
+  progress.flush()
+  # The vanished ratings are found by counting, which needs the new ratings
+  # to be written.
+  transaction.commit()
+
+  vanished = _find_vanished_ratings(wikidb, wp10db, project,
+                                    rating_to_category_by_kind)
+  logger.info('Found %s ratings no longer in their category', len(vanished))
+  for i in range(0, len(vanished), DELTA_UPDATE_CHUNK_SIZE):
+    current_ratings = dict(
+        ((rating.r_namespace, rating.r_article), rating)
+        for rating in vanished[i:i + DELTA_UPDATE_CHUNK_SIZE])
+    # Articles that are still in another rating category are rated again from
+    # those, the rest are processed like the unseen articles of a full update.
+    seen = _rate_articles(wikidb, wp10db, project, category_to_ratings,
+                          rankings_by_kind,
+                          [(ns + 1, title) for ns, title in current_ratings],
+                          current_ratings, transaction)
+    _process_unseen_ratings(
+        wikidb,
+        wp10db,
+        project, [
+            old_rating for key, old_rating in current_ratings.items()
+            if key not in seen
+        ],
+        transaction,
+        redis=redis)
+  logger.info('End, committing db')
+  transaction.commit()
+
 
-  for article_ref, ratings_list in new_ratings.items():
-    sorted_ratings = sorted(ratings_list, key=sort_rating_tuples, reverse=True)
-    rating, kind, old_rating_value = sorted_ratings[0]
+def store_new_ratings(wp10db, new_ratings, transaction=None):
+  if transaction is None:
+    transaction = logic_transaction.UpdateTransaction(wp10db)
 
+  kind = new_ratings.kind
+  for position, rating in new_ratings.ratings():
     if kind == AssessmentKind.QUALITY:
-      rating_changed = rating.r_quality != old_rating_value
+      new_rating_value = rating.r_quality
     elif kind == AssessmentKind.IMPORTANCE:
-      rating_changed = rating.r_importance != old_rating_value
+      new_rating_value = rating.r_importance
 
-    if article_ref not in old_ratings or rating_changed:
-      logic_rating.insert_or_update(wp10db, rating, kind)
-      logic_rating.add_log_for_rating(wp10db, rating, kind, old_rating_value)
+    if position is None:
+      old_rating_value = NOT_A_CLASS.encode('utf-8')
+    else:
+      old_rating_value = new_ratings.index.value(position, kind)
+
+    if position is None or new_rating_value != old_rating_value:
+      _store_rating(wp10db,
+                    rating,
+                    kind,
+                    old_rating_value,
+                    transaction,
+                    new_row=position is None)
+
+  transaction.commit()
+
+
+def _store_rating(wp10db,
+                  rating,
+                  kind,
+                  old_rating_value,
+                  transaction,
+                  new_row=False):
+  transaction.ratings.add(rating, kind)
+  transaction.global_articles.add(rating.r_namespace, rating.r_article)
+  transaction.counts.add(rating, kind, old_rating_value, new_row=new_row)
+  logic_rating.add_log_for_rating(wp10db,
+                                  rating,
+                                  kind,
+                                  old_rating_value,
+                                  log_writer=transaction.logs)
+  transaction.row_done()
+
+
+def process_unseen_articles(wikidb,
+                            wp10db,
+                            project,
+                            index,
+                            redis=None,
+                            transaction=None):
+  if transaction is None:
+    transaction = logic_transaction.UpdateTransaction(wp10db)
+
+  in_seen = index.count_seen()
+  denom = len(index)
+  ratio = in_seen / denom if denom != 0 else 'NaN'
 
+  logger.debug('Looking for unseen articles, ratio was: %s', ratio)
+  old_ratings = [index.rating(position) for position in index.unseen()]
+  processed = _process_unseen_ratings(wikidb,
+                                      wp10db,
+                                      project,
+                                      old_ratings,
+                                      transaction,
+                                      redis=redis)
+  skipped = len(old_ratings) - processed
+  logger.info('End, committing db')
+  transaction.commit()
 
-def process_unseen_articles(wikidb, wp10db, project, old_ratings, seen):
-  denom = len(old_ratings.keys())
-  ratio = len(seen) / denom if denom != 0 else 'NaN'
+  logger.debug('SEEN REPORT:\nin seen: %s\nskipped: %s\nprocessed: %s', in_seen,
+               skipped, processed)
 
-  logger.debug('Looking for unseen articles, ratio was: %s', ratio)
-  in_seen = 0
-  skipped = 0
-  processed = 0
-  n = 0
-  for ref, old_rating in old_ratings.items():
-    if ref in seen:
-      in_seen += 1
-      continue
 
+def _process_unseen_ratings(wikidb,
+                            wp10db,
+                            project,
+                            old_ratings,
+                            transaction,
+                            redis=None):
+  """Processes the ratings of articles that are no longer in any category.
+
+  The move data of all of the articles is resolved in a single pre-pass with
+  _resolve_unseen_moves, then their ratings and logs are written. Returns the
+  number of ratings processed, the others were skipped because they had no
+  rating to clear.
+  """
+  to_clear = []
+  for old_rating in old_ratings:
     # By default, we evaluate both assessment kinds.
     kind = AssessmentKind.BOTH
     if old_rating.r_quality == NOT_A_CLASS or old_rating.r_quality is None:
@@ -486,102 +1086,161 @@ def process_unseen_articles(wikidb, wp10db, project, old_ratings, seen):
       kind = AssessmentKind.IMPORTANCE
       if (old_rating.r_importance == NOT_A_CLASS or
           old_rating.r_importance is None):
-        # The importance rating is also not set, so don't do anything.
-        skipped += 1
+        # The importance rating is also not set, so there is nothing to log,
+        # the empty rating is just deleted.
+        transaction.ratings.delete(old_rating)
+        transaction.counts.remove(old_rating)
         continue
-
-    logger.debug('Processing unseen article %s', ref.decode('utf-8'))
-    processed += 1
-    ns, title = ref.decode('utf-8').split(':', 1)
-    ns = int(ns.encode('utf-8'))
-    title = title.encode('utf-8')
-
-    move_data = logic_page.get_move_data(wp10db, wikidb, ns, title,
-                                         project.timestamp_dt)
-    if move_data is not None:
-      logic_page.update_page_moved(wp10db, project, ns, title,
-                                   move_data['dest_ns'],
-                                   move_data['dest_title'],
-                                   move_data['timestamp_dt'])
-
-    # Mark this article as having NOT_A_CLASS for it's quality or importance.
-    # This probably means the article was deleted, but could in fact mean that
-    # we just failed to find its move data. Either way, the new article would
-    # have already been picked up by the assessment updater, assuming it was
-    # tagged correctly.
-    rating = Rating(r_project=project.p_project,
-                    r_namespace=ns,
-                    r_article=title,
-                    r_score=0)
-    if kind in (AssessmentKind.QUALITY, AssessmentKind.BOTH):
-      rating.quality = NOT_A_CLASS.encode('utf-8')
-      if move_data:
-        rating.set_quality_timestamp_dt(move_data['timestamp_dt'])
-      else:
-        rating.r_quality_timestamp = GLOBAL_TIMESTAMP_WIKI
-    if kind in (AssessmentKind.IMPORTANCE, AssessmentKind.BOTH):
-      rating.importance = NOT_A_CLASS.encode('utf-8')
-      if move_data:
-        rating.set_importance_timestamp_dt(move_data['timestamp_dt'])
-      else:
-        rating.r_importance_timestamp = GLOBAL_TIMESTAMP_WIKI
-
-    logic_rating.insert_or_update(wp10db, rating, kind)
-
-    if kind in (AssessmentKind.QUALITY, AssessmentKind.BOTH):
-      logic_rating.add_log_for_rating(wp10db, rating, AssessmentKind.QUALITY,
-                                      old_rating.r_quality)
-    if kind in (AssessmentKind.IMPORTANCE, AssessmentKind.BOTH):
-      logic_rating.add_log_for_rating(wp10db, rating, AssessmentKind.IMPORTANCE,
-                                      old_rating.r_importance)
-
-    n += 1
-    if n >= MAX_ARTICLES_BEFORE_COMMIT:
-      wp10db.ping()
-      wp10db.commit()
-  logger.info('End, committing db')
-  wp10db.ping()
-  wp10db.commit()
-
-  logger.debug('SEEN REPORT:\nin seen: %s\nskipped: %s\nprocessed: %s', in_seen,
-               skipped, processed)
-
-
-def cleanup_project(wp10db, project):
-  # If both quality and importance are 'NotA-Class', that means the article
-  # was once rated but isn't any more, so we delete the row
-  count = logic_rating.delete_empty_for_project(wp10db, project)
-  logger.info('Deleted %s ratings that were empty for project: %s', count,
-              project.p_project.decode('utf-8'))
-
-  # It's possible for the quality to be NULL if the article has a
-  # rated importance but no rated quality (not even Unassessed-Class).
-  # This will always happen if the article has a quality rating that the
-  # bot doesn't recognize. Change the NULL to sentinel value.
-  count = logic_rating.update_null_quality_for_project(wp10db, project)
-  logger.info('Updated %s ratings, quality == NotAClass for project: %s', count,
-              project.p_project.decode('utf-8'))
-
-  # Finally, if a quality is assigned but not an importance, it is
-  # possible for the importance field to be null. Set it to
-  # $NotAClass in this case.
-  count = logic_rating.update_null_importance_for_project(wp10db, project)
-  logger.info('Updated %s ratings, importance == NotAClass for project: %s',
-              count, project.p_project.decode('utf-8'))
-
-
-def update_project_record(wp10db, project, metadata):
+    to_clear.append((old_rating, kind))
+
+  if not to_clear:
+    return 0
+
+  move_data_by_key = _resolve_unseen_moves(
+      wikidb,
+      wp10db,
+      project, [old_rating for old_rating, kind in to_clear],
+      redis=redis)
+  for old_rating, kind in to_clear:
+    _process_unseen_rating(
+        wp10db, project, old_rating, kind,
+        move_data_by_key[(old_rating.r_namespace, old_rating.r_article)],
+        transaction)
+  return len(to_clear)
+
+
+def _resolve_unseen_moves(wikidb, wp10db, project, old_ratings, redis=None):
+  """Returns a dict of (namespace, article) to the move data of each rating.
+
+  Articles whose rating has the page id of their talk page are found to be
+  moved if that page now has another title in the replica, which is looked up
+  MOVE_RESOLVER_BATCH_SIZE page ids at a time, along with the time of the move
+  since the last update of the project in the logging table, if any. The older ratings without a
+  page id are all resolved at once by a MoveResolver, which looks them up in
+  chunked queries of the replica, then concurrently in the API, and caches
+  them in redis if it is given.
+  """
+  move_data_by_key = {}
+  rated = [
+      old_rating for old_rating in old_ratings
+      if old_rating.r_page_id is not None
+  ]
+  for i in range(0, len(rated), MOVE_RESOLVER_BATCH_SIZE):
+    move_data_by_key.update(
+        logic_page.get_move_data_by_page_ids(
+            wp10db, wikidb,
+            dict((old_rating.r_page_id, (old_rating.r_namespace,
+                                         old_rating.r_article))
+                 for old_rating in rated[i:i + MOVE_RESOLVER_BATCH_SIZE]),
+            project.timestamp_dt))
+
+  legacy_keys = [(old_rating.r_namespace, old_rating.r_article)
+                 for old_rating in old_ratings
+                 if old_rating.r_page_id is None]
+  if legacy_keys:
+    cache = None
+    if redis is not None:
+      cache = logic_move_cache.MoveCache(redis)
+    resolver = logic_page.MoveResolver(wp10db, wikidb, cache=cache)
+    move_data_by_key.update(resolver.resolve(legacy_keys, project.timestamp_dt))
+    resolver.log_stats(project.p_project)
+  return move_data_by_key
+
+
+def _process_unseen_rating(wp10db, project, old_rating, kind, move_data,
+                           transaction):
+  """Clears the rating of an article that is no longer in any category.
+
+  kind is the kind of rating to clear and move_data the result of the move
+  lookup for the article, or None if it was not moved. Moves whose time is
+  unknown are not recorded, and the rating is cleared as if the article was
+  not moved.
+  """
+  ns = old_rating.r_namespace
+  title = old_rating.r_article
+  logger.debug('Processing unseen article %s:%s', ns, title.decode('utf-8'))
+
+  if move_data is not None and move_data['timestamp_dt'] is None:
+    logger.debug('Time of the move of %s:%s is unknown, not recording it', ns,
+                 title.decode('utf-8'))
+    move_data = None
+
+  if move_data is not None:
+    logic_page.update_page_moved(wp10db,
+                                 project,
+                                 ns,
+                                 title,
+                                 move_data['dest_ns'],
+                                 move_data['dest_title'],
+                                 move_data['timestamp_dt'],
+                                 log_writer=transaction.logs)
+
+  # Log this article as having NOT_A_CLASS for it's quality or importance,
+  # then delete its rating, which is left with no rating of either kind.
+  # This probably means the article was deleted, but could in fact mean that
+  # we just failed to find its move data. Either way, the new article would
+  # have already been picked up by the assessment updater, assuming it was
+  # tagged correctly.
+  rating = Rating(r_project=project.p_project,
+                  r_namespace=ns,
+                  r_article=title,
+                  r_score=0)
+  if kind in (AssessmentKind.QUALITY, AssessmentKind.BOTH):
+    rating.quality = NOT_A_CLASS.encode('utf-8')
+    if move_data:
+      rating.set_quality_timestamp_dt(move_data['timestamp_dt'])
+    else:
+      rating.r_quality_timestamp = GLOBAL_TIMESTAMP_WIKI
+  if kind in (AssessmentKind.IMPORTANCE, AssessmentKind.BOTH):
+    rating.importance = NOT_A_CLASS.encode('utf-8')
+    if move_data:
+      rating.set_importance_timestamp_dt(move_data['timestamp_dt'])
+    else:
+      rating.r_importance_timestamp = GLOBAL_TIMESTAMP_WIKI
+
+  transaction.ratings.delete(rating)
+  transaction.global_articles.add(ns, title)
+  transaction.counts.remove(old_rating)
+
+  if kind in (AssessmentKind.QUALITY, AssessmentKind.BOTH):
+    logic_rating.add_log_for_rating(wp10db,
+                                    rating,
+                                    AssessmentKind.QUALITY,
+                                    old_rating.r_quality,
+                                    log_writer=transaction.logs)
+  if kind in (AssessmentKind.IMPORTANCE, AssessmentKind.BOTH):
+    logic_rating.add_log_for_rating(wp10db,
+                                    rating,
+                                    AssessmentKind.IMPORTANCE,
+                                    old_rating.r_importance,
+                                    log_writer=transaction.logs)
+
+  transaction.row_done()
+
+
+def update_project_record(wp10db, project, metadata, counts=None):
+  """Updates the record of a project after its ratings were updated.
+
+  If counts, the RatingCounts of the update, is given and the project has
+  counts from its last update, its counts are updated from the changes.
+  Otherwise, the ratings are counted in the database, and the project_stats
+  of the project are rebuilt from them.
+  """
   project_display = project.p_project.decode('utf-8')
   logger.info('Updating project record: %r', project_display)
 
-  num_ratings = logic_rating.count_for_project(wp10db, project)
-
-  n_quality = logic_rating.count_unassessed_quality_for_project(wp10db, project)
-  quality_count = num_ratings - n_quality
-
-  n_importance = logic_rating.count_unassessed_importance_for_project(
-      wp10db, project)
-  importance_count = num_ratings - n_importance
+  if counts is not None and None not in (project.p_count, project.p_qcount,
+                                         project.p_icount):
+    counts.apply(project)
+  else:
+    project.p_count = logic_rating.count_for_project(wp10db, project)
+    project.p_qcount = (
+        project.p_count -
+        logic_rating.count_unassessed_quality_for_project(wp10db, project))
+    project.p_icount = (
+        project.p_count -
+        logic_rating.count_unassessed_importance_for_project(wp10db, project))
+    logic_project_stats.rebuild_project_stats(wp10db, project.p_project)
 
   # Okay, update the fields of the project, warning if we're setting NULLs.
   project.p_timestamp = GLOBAL_TIMESTAMP
@@ -600,34 +1259,90 @@ def update_project_record(wp10db, project, metadata):
     logger.warning('Setting NULL shortname for project: %s', project_display)
   else:
     project.shortname = shortname.encode('utf-8')
-  project.p_count = num_ratings
-  project.p_qcount = quality_count
-  project.p_icount = importance_count
   project.p_scope = 0
   project.upload_timestamp = b'00000000000000'
 
   insert_or_update(wp10db, project)
 
 
-def update_project(wikidb, wp10db, project, redis=None, track_progress=False):
-  extra_assessments = api_project.get_extra_assessments(project.p_project)
+def project_fingerprint(wikidb, wp10db, project, extra_assessments):
+  """Returns a fingerprint of the assessment category memberships of a project.
 
-  update_project_assessments(wikidb,
-                             wp10db,
-                             project,
-                             extra_assessments,
-                             redis=redis,
-                             track_progress=track_progress)
+  The fingerprint covers the member count and newest cl_timestamp of the
+  project's "by quality" and "by importance" categories, which list its rating
+  categories, and of each rating category found by the last update, as well
+  as the extra assessments. If none of these changed, an update would not
+  find any new ratings.
+  """
+  categories = set(
+      logic_category.get_category_names_for_project(wp10db, project.p_project))
+  for kind in (AssessmentKind.QUALITY, AssessmentKind.IMPORTANCE):
+    for use_alt in (False, True):
+      categories.add(
+          logic_util.category_for_project_by_kind(project.p_project,
+                                                  kind,
+                                                  category_prefix=False,
+                                                  use_alt=use_alt))
+
+  digest = hashlib.sha1()
+  for stats in sorted(logic_page.get_category_stats(wikidb, categories),
+                      key=lambda stats: stats['cl_to']):
+    digest.update(b'%s|%d|%s\n' % (stats['cl_to'], stats['count'],
+                                   str(stats['max_timestamp']).encode('utf-8')))
+  digest.update(json.dumps(extra_assessments, sort_keys=True).encode('utf-8'))
+  return digest.hexdigest().encode('utf-8')
+
+
+def update_project(wikidb,
+                   wp10db,
+                   project,
+                   redis=None,
+                   track_progress=False,
+                   merge_join=None,
+                   force=False):
+  extra_assessments = api_project.get_extra_assessments(project.p_project)
 
-  cleanup_project(wp10db, project)
+  fingerprint = project_fingerprint(wikidb, wp10db, project, extra_assessments)
+  full_update = (force or project.full_timestamp_dt is None or
+                 utcnow() - project.full_timestamp_dt >=
+                 timedelta(days=FULL_UPDATE_INTERVAL_DAYS))
+  if not full_update and fingerprint == project.p_fingerprint:
+    logger.info(
+        'Assessment categories of %s are unchanged, only updating '
+        'the project record', project.p_project.decode('utf-8'))
+    update_project_record(wp10db,
+                          project,
+                          extra_assessments,
+                          counts=logic_rating.RatingCounts())
+    return
 
-  update_project_record(wp10db, project, extra_assessments)
+  since_dt = None
+  if not full_update:
+    since_dt = project.timestamp_dt - timedelta(
+        seconds=DELTA_UPDATE_OVERLAP_SECS)
+
+  counts = logic_rating.RatingCounts()
+  full_update = update_project_assessments(wikidb,
+                                           wp10db,
+                                           project,
+                                           extra_assessments,
+                                           redis=redis,
+                                           track_progress=track_progress,
+                                           merge_join=merge_join,
+                                           since_dt=since_dt,
+                                           counts=counts)
+
+  # The fingerprint was computed before the update, so any change made while
+  # it ran will be picked up by the next one.
+  project.p_fingerprint = fingerprint
+  if full_update:
+    project.p_full_timestamp = GLOBAL_TIMESTAMP
+    # Full updates count the ratings again, so that counts that drifted, for
+    # example after an update failed halfway, are corrected periodically.
+    counts = None
+  update_project_record(wp10db, project, extra_assessments, counts=counts)
 
   ## This is where the old code would update the project scores. However, since
   ## we don't have reliable selection_data at the moment, and we're not sure if
   ## the score metrics will be changing, skip it for now.
   # update_project_scores(wp10_session, project)
-
-  # This is commented out because it can't be done in parallel with other
-  # project updates. See https://github.com/openzim/wikimedia_wp1_bot/issues/71
-  # update_global_articles_table(wp10db, project)
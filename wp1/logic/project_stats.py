@@ -0,0 +1,118 @@
+import logging
+
+from wp1.conf import get_conf
+
+config = get_conf()
+NOT_A_CLASS = config['NOT_A_CLASS']
+
+logger = logging.getLogger(__name__)
+
+# The number of ratings of each project for each quality and importance, which
+# the project tables are generated from. Project updates adjust the counts as
+# they write ratings, so the tables don't have to aggregate the ratings.
+TABLE = 'project_stats'
+
+
+def update_many(wp10db, deltas):
+  """Adds the given deltas to the stored counts.
+
+  deltas is a dict of (project, quality, importance) to the change in the
+  number of ratings with those values. Returns the number of counts changed.
+  """
+  values = [{
+      'ps_project': project_name,
+      'ps_quality': quality,
+      'ps_importance': importance,
+      'ps_count': delta,
+  } for (project_name, quality,
+         importance), delta in sorted(deltas.items()) if delta]
+  if not values:
+    return 0
+
+  with wp10db.cursor() as cursor:
+    cursor.executemany(
+        'INSERT INTO ' + TABLE + '''
+          (ps_project, ps_quality, ps_importance, ps_count)
+        VALUES
+          (%(ps_project)s, %(ps_quality)s, %(ps_importance)s, %(ps_count)s)
+        ON DUPLICATE KEY UPDATE ps_count = ps_count + VALUES(ps_count)
+    ''', values)
+  return len(values)
+
+
+def get_project_stats(wp10db, project_name):
+  """Returns the stored counts of a project, in the format of the tables.
+
+  That is a list of dicts with the count n of the ratings with quality q and
+  importance i. Counts that dropped to zero are left out.
+  """
+  with wp10db.cursor() as cursor:
+    cursor.execute(
+        '''
+        SELECT ps_count AS n, ps_quality AS q, ps_importance AS i,
+               ps_project AS project
+        FROM ''' + TABLE + '''
+        WHERE ps_project = %s AND ps_count > 0
+    ''', (project_name,))
+    return cursor.fetchall()
+
+
+def count_project_stats(wp10db, project_name):
+  """Counts the ratings of a project, in the same format as the stored counts.
+
+  This aggregates all of the ratings of the project. Ratings written by older
+  versions without a quality or importance are counted as NotA-Class, like
+  the updates do.
+  """
+  with wp10db.cursor() as cursor:
+    cursor.execute(
+        '''
+        SELECT count(r_article) AS n,
+               COALESCE(r_quality, %(not_a_class)s) AS q,
+               COALESCE(r_importance, %(not_a_class)s) AS i,
+               r_project AS project
+        FROM ratings
+        WHERE r_project = %(r_project)s GROUP BY q, i, r_project
+    ''', {
+            'r_project': project_name,
+            'not_a_class': NOT_A_CLASS.encode('utf-8')
+        })
+    return cursor.fetchall()
+
+
+def rebuild_project_stats(wp10db, project_name):
+  """Replaces the stored counts of a project with a count of its ratings."""
+  with wp10db.cursor() as cursor:
+    cursor.execute('DELETE FROM ' + TABLE + ' WHERE ps_project = %s',
+                   (project_name,))
+    cursor.execute(
+        'INSERT INTO ' + TABLE + '''
+          (ps_project, ps_quality, ps_importance, ps_count)
+        SELECT r_project, COALESCE(r_quality, %(not_a_class)s) AS q,
+               COALESCE(r_importance, %(not_a_class)s) AS i, COUNT(*)
+        FROM ratings
+        WHERE r_project = %(r_project)s
+        GROUP BY r_project, q, i
+    ''', {
+            'r_project': project_name,
+            'not_a_class': NOT_A_CLASS.encode('utf-8')
+        })
+  logger.info('Rebuilt the stats of %s', project_name.decode('utf-8'))
+
+
+def diff_project_stats(wp10db, project_name):
+  """Compares the stored counts of a project with a count of its ratings.
+
+  Returns a dict of (quality, importance) to (stored, counted) for every pair
+  whose counts differ, so an empty dict if the stored counts are correct.
+  """
+  stored = dict(((row['q'], row['i']), row['n'])
+                for row in get_project_stats(wp10db, project_name))
+  counted = dict(((row['q'], row['i']), row['n'])
+                 for row in count_project_stats(wp10db, project_name))
+
+  diff = {}
+  for key in set(stored) | set(counted):
+    if stored.get(key, 0) != counted.get(key, 0):
+      diff[key] = (stored.get(key, 0), counted.get(key, 0))
+  return diff
@@ -0,0 +1,111 @@
+import attr
+
+from wp1.base_db_test import BaseWpOneDbTest
+from wp1.logic import project_stats as logic_project_stats
+from wp1.models.wp10.rating import Rating
+
+
+class ProjectStatsTest(BaseWpOneDbTest):
+
+  ratings = (
+      (b'Project A', b'Art of testing', b'FA-Class', b'Top-Class'),
+      (b'Project A', b'Testing mechanics', b'FA-Class', b'Top-Class'),
+      (b'Project A', b'Rules of testing', b'B-Class', b'NotA-Class'),
+      (b'Project A', b'Test frameworks', None, b'Low-Class'),
+      (b'Project B', b'Art of testing', b'B-Class', b'Low-Class'),
+  )
+
+  def setUp(self):
+    super().setUp()
+    with self.wp10db.cursor() as cursor:
+      for project, article, quality, importance in self.ratings:
+        cursor.execute(
+            '''
+            INSERT INTO ratings
+              (r_project, r_namespace, r_article, r_score, r_quality,
+               r_importance)
+            VALUES
+              (%(r_project)s, %(r_namespace)s, %(r_article)s, %(r_score)s,
+               %(r_quality)s, %(r_importance)s)
+        ''',
+            attr.asdict(
+                Rating(r_project=project,
+                       r_namespace=0,
+                       r_article=article,
+                       r_quality=quality,
+                       r_importance=importance)))
+    self.wp10db.commit()
+
+  def _stats(self, project_name):
+    return sorted((row['q'], row['i'], row['n'])
+                  for row in logic_project_stats.get_project_stats(
+                      self.wp10db, project_name))
+
+  def test_count_project_stats(self):
+    actual = sorted((row['q'], row['i'], row['n'])
+                    for row in logic_project_stats.count_project_stats(
+                        self.wp10db, b'Project A'))
+    self.assertEqual([
+        (b'B-Class', b'NotA-Class', 1),
+        (b'FA-Class', b'Top-Class', 2),
+        (b'NotA-Class', b'Low-Class', 1),
+    ], actual)
+
+  def test_rebuild_project_stats(self):
+    logic_project_stats.rebuild_project_stats(self.wp10db, b'Project A')
+
+    self.assertEqual([
+        (b'B-Class', b'NotA-Class', 1),
+        (b'FA-Class', b'Top-Class', 2),
+        (b'NotA-Class', b'Low-Class', 1),
+    ], self._stats(b'Project A'))
+    self.assertEqual([], self._stats(b'Project B'))
+
+  def test_update_many(self):
+    logic_project_stats.rebuild_project_stats(self.wp10db, b'Project A')
+
+    count = logic_project_stats.update_many(
+        self.wp10db, {
+            (b'Project A', b'FA-Class', b'Top-Class'): -1,
+            (b'Project A', b'A-Class', b'Top-Class'): 1,
+            (b'Project A', b'B-Class', b'NotA-Class'): 0,
+        })
+
+    self.assertEqual(2, count)
+    self.assertEqual([
+        (b'A-Class', b'Top-Class', 1),
+        (b'B-Class', b'NotA-Class', 1),
+        (b'FA-Class', b'Top-Class', 1),
+        (b'NotA-Class', b'Low-Class', 1),
+    ], self._stats(b'Project A'))
+
+  def test_update_many_empty(self):
+    self.assertEqual(0, logic_project_stats.update_many(self.wp10db, {}))
+
+  def test_get_project_stats_skips_zero(self):
+    logic_project_stats.update_many(self.wp10db, {
+        (b'Project B', b'B-Class', b'Low-Class'): 1,
+    })
+    logic_project_stats.update_many(self.wp10db, {
+        (b'Project B', b'B-Class', b'Low-Class'): -1,
+    })
+
+    self.assertEqual([], self._stats(b'Project B'))
+
+  def test_diff_project_stats(self):
+    logic_project_stats.rebuild_project_stats(self.wp10db, b'Project A')
+    self.assertEqual({},
+                     logic_project_stats.diff_project_stats(
+                         self.wp10db, b'Project A'))
+
+    logic_project_stats.update_many(
+        self.wp10db, {
+            (b'Project A', b'FA-Class', b'Top-Class'): 1,
+            (b'Project A', b'A-Class', b'Top-Class'): 1,
+        })
+
+    self.assertEqual(
+        {
+            (b'FA-Class', b'Top-Class'): (3, 2),
+            (b'A-Class', b'Top-Class'): (1, 0),
+        }, logic_project_stats.diff_project_stats(self.wp10db, b'Project A'))
@@ -6,12 +6,18 @@ import attr
 import fakeredis
 
 from wp1.base_db_test import BaseWpOneDbTest, BaseWikiDbTest, BaseCombinedDbTest
+from wp1.base_redis_test import BaseRedisTest
 from wp1.conf import get_conf
-from wp1.constants import AssessmentKind, CATEGORY_NS_INT, GLOBAL_TIMESTAMP_WIKI, TS_FORMAT
+from wp1.constants import AssessmentKind, CATEGORY_NS_INT, GLOBAL_TIMESTAMP_WIKI, MERGE_UPDATE_MIN_ARTICLES, TS_FORMAT
+from wp1.logic import global_articles as logic_global_articles
 from wp1.logic import project as logic_project
+from wp1.logic import page as logic_page
+from wp1.logic import project_stats as logic_project_stats
+from wp1.logic import rating as logic_rating
 from wp1.models.wiki.page import Page
 from wp1.models.wp10.category import Category
 from wp1.models.wp10.log import Log
+from wp1.models.wp10.move import Move
 from wp1.models.wp10.project import Project
 from wp1.models.wp10.rating import Rating
 
@@ -358,30 +364,6 @@ class ArticlesTest(BaseCombinedDbTest):
   old_ts_wiki = b'2018-07-04T05:05:05Z'
   expected_ts_wiki = b'2018-12-25T11:22:33Z'
 
-  global_article_scores = [
-      (225, 100, 475),
-      (150, 0, 625),
-      (100, 100, 229),
-      (150, 100, 589),
-      (150, 200, 596),
-      (150, 100, 398),
-      (0, 0, 109),
-      (225, 100, 434),
-      (150, 300, 629),
-      (150, 300, 629),
-      (150, 300, 629),
-      (100, 100, 461),
-      (225, 0, 288),
-      (0, 0, 35),
-      (150, 100, 665),
-      (150, 100, 527),
-      (100, 0, 176),
-      (150, 100, 37),
-      (15, 100, 279),
-      (150, 100, 279),
-      (100, 100, 415),
-  ]
-
   custom_quality_pages = (
       (107, b'Draft-Class_Test_articles', b'Test_articles_by_quality', None,
        14),
@@ -534,18 +516,6 @@ class ArticlesTest(BaseCombinedDbTest):
         ''', attr.asdict(rating))
     self.wp10db.commit()
 
-  def _insert_global_scores(self):
-    article_scores = [(art[1],) + score for score, art in zip(
-        self.global_article_scores, self.quality_pages[6:])]
-    with self.wp10db.cursor() as cursor:
-      cursor.executemany(
-          '''
-          INSERT INTO global_articles
-            (a_article, a_quality, a_importance, a_score)
-          VALUES (%s, %s, %s, %s)
-      ''', article_scores)
-    self.wp10db.commit()
-
   def setUp(self):
     super().setUp()
     self.project = Project(p_project=b'Test', p_timestamp=b'20100101000000')
@@ -906,6 +876,28 @@ class UpdateProjectAssessmentsTest(ArticlesTest):
     self._assert_updated_quality_ratings(assert_log_len=False)
     self._assert_updated_importance_ratings(assert_log_len=False)
 
+  @patch('wp1.logic.api.page.site')
+  def test_project_stats_match_ratings(self, patched_site):
+    patched_site.api.return_value = {}
+    self._insert_pages(self.quality_pages)
+    self._insert_pages(self.importance_pages)
+    logic_project.update_project_assessments(self.wikidb, self.wp10db,
+                                             self.project, {})
+    self.assertEqual({},
+                     logic_project_stats.diff_project_stats(
+                         self.wp10db, self.project.p_project))
+
+    self._insert_pages(self.multiple_quality_pages)
+    with self.wikidb.cursor() as cursor:
+      cursor.execute('DELETE FROM categorylinks WHERE cl_from IN (252, 2520)')
+    self.wikidb.commit()
+    logic_project.update_project_assessments(self.wikidb, self.wp10db,
+                                             self.project, {})
+
+    self.assertEqual({},
+                     logic_project_stats.diff_project_stats(
+                         self.wp10db, self.project.p_project))
+
   @patch('wp1.logic.api.page.site')
   def test_not_seen_quality(self, patched_site):
     self._insert_pages(self.quality_pages[:-2])
@@ -921,22 +913,21 @@ class UpdateProjectAssessmentsTest(ArticlesTest):
     logic_project.update_project_assessments(self.wikidb, self.wp10db,
                                              self.project, {})
 
-    self.assertEqual(2, len(patched_site.api.call_args_list))
+    # Both unseen articles are looked up in a single query.
+    self.assertEqual(1, len(patched_site.api.call_args_list))
 
     ratings = _get_all_ratings(self.wp10db)
     self.assertNotEqual(0, len(ratings))
 
-    pages = self.quality_pages[6:]
+    # The ratings of the unseen articles are deleted.
+    pages = self.quality_pages[6:-2]
     expected_titles = set(p[1] for p in pages)
     actual_titles = set(r.r_article for r in ratings)
     self.assertEqual(expected_titles, actual_titles)
 
     page_to_rating = dict((p[1], p[3]) for p in pages)
     for r in ratings:
-      if r.r_article in (b'How to test', b'Failures of tests'):
-        self.assertIsNone(r.r_quality)
-      else:
-        self.assertEqual(page_to_rating[r.r_article], r.r_quality)
+      self.assertEqual(page_to_rating[r.r_article], r.r_quality)
 
   @patch('wp1.logic.api.page.site')
   def test_not_seen_importance(self, patched_site):
@@ -954,22 +945,36 @@ class UpdateProjectAssessmentsTest(ArticlesTest):
     logic_project.update_project_assessments(self.wikidb, self.wp10db,
                                              self.project, {})
 
-    self.assertEqual(2, len(patched_site.api.call_args_list))
+    # Both unseen articles are looked up in a single query.
+    self.assertEqual(1, len(patched_site.api.call_args_list))
 
     ratings = _get_all_ratings(self.wp10db)
     self.assertNotEqual(0, len(ratings))
 
-    pages = self.importance_pages[4:]
+    # The ratings of the unseen articles are deleted.
+    pages = self.importance_pages[4:-2]
     expected_titles = set(p[1] for p in pages)
     actual_titles = set(r.r_article for r in ratings)
     self.assertEqual(expected_titles, actual_titles)
 
     page_to_rating = dict((p[1], p[3]) for p in pages)
     for r in ratings:
-      if r.r_article in (b'How to test', b'Failures of tests'):
-        self.assertIsNone(r.r_quality)
-      else:
-        self.assertEqual(page_to_rating[r.r_article], r.r_importance, repr(r))
+      self.assertEqual(page_to_rating[r.r_article], r.r_importance, repr(r))
+
+  @patch('wp1.logic.project.MOVE_RESOLVER_BATCH_SIZE', 1)
+  @patch('wp1.logic.api.page.site')
+  def test_not_seen_resolved_in_one_pass(self, patched_site):
+    self._insert_pages(self.quality_pages[:-2])
+    self._insert_ratings(self.quality_pages[6:], 0, AssessmentKind.QUALITY)
+    patched_site.api.return_value = {}
+
+    with patch('wp1.logic.page.get_redirects_from_db',
+               wraps=logic_page.get_redirects_from_db) as patched_redirects:
+      logic_project.update_project_assessments(self.wikidb, self.wp10db,
+                                               self.project, {})
+
+    self.assertEqual(1, len(patched_redirects.call_args_list))
+    self.assertEqual(2, len(patched_redirects.call_args[0][1]))
 
   @patch('wp1.logic.api.page.site')
   def test_not_seen_null_quality(self, patched_site):
@@ -1012,189 +1017,69 @@ class UpdateProjectAssessmentsTest(ArticlesTest):
     patched_site.assert_not_called()
 
 
-class GlobalArticlesTest(ArticlesTest):
+class UpdateProjectAssessmentsMergeJoinTest(UpdateProjectAssessmentsTest):
+  """Runs the update assessments tests against the merge join engine."""
 
   def setUp(self):
     super().setUp()
+    # The engine is selected by size, and a small chunk size makes the ratings
+    # be read with several queries.
+    self.project.p_count = MERGE_UPDATE_MIN_ARTICLES
+    patcher = patch('wp1.logic.project.MERGE_UPDATE_CHUNK_SIZE', 3)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  @patch('wp1.logic.project.get_new_ratings')
+  def test_merge_join_selected(self, patched_get_new_ratings):
     self._insert_pages(self.quality_pages)
-    self._insert_pages(self.importance_pages)
-    self._insert_ratings(zip(self.quality_pages[6:], self.importance_pages[4:]),
-                         0, 'both')
-
-    self._insert_global_scores()
-
-  def test_update_global_articles_table(self):
-    expected = [{
-        'a_article': b'Art of testing',
-        'a_importance': b'400',
-        'a_quality': b'500',
-        'a_score': 475
-    }, {
-        'a_article': b'Failures of tests',
-        'a_importance': b'100',
-        'a_quality': b'225',
-        'a_score': 176
-    }, {
-        'a_article': b'How to test',
-        'a_importance': b'100',
-        'a_quality': b'225',
-        'a_score': 37
-    }, {
-        'a_article': b'Important tests',
-        'a_importance': b'300',
-        'a_quality': b'425',
-        'a_score': 434
-    }, {
-        'a_article': b'Lesser-known tests',
-        'a_importance': b'100',
-        'a_quality': b'225',
-        'a_score': 527
-    }, {
-        'a_article': b'Operation of tests',
-        'a_importance': b'100',
-        'a_quality': b'300',
-        'a_score': 665
-    }, {
-        'a_article': b'Rules of testing',
-        'a_importance': b'400',
-        'a_quality': b'500',
-        'a_score': 229
-    }, {
-        'a_article': b'Test frameworks',
-        'a_importance': b'300',
-        'a_quality': b'480',
-        'a_score': 398
-    }, {
-        'a_article': b'Test main inheritance',
-        'a_importance': b'300',
-        'a_quality': b'400',
-        'a_score': 629
-    }, {
-        'a_article': b'Test other inheritance',
-        'a_importance': b'200',
-        'a_quality': b'400',
-        'a_score': 461
-    }, {
-        'a_article': b'Test practices',
-        'a_importance': b'400',
-        'a_quality': b'480',
-        'a_score': 589
-    }, {
-        'a_article': b'Test results',
-        'a_importance': b'300',
-        'a_quality': b'425',
-        'a_score': 629
-    }, {
-        'a_article': b'Test sub inheritance',
-        'a_importance': b'300',
-        'a_quality': b'400',
-        'a_score': 629
-    }, {
-        'a_article': b'Testing best practices',
-        'a_importance': b'100',
-        'a_quality': b'300',
-        'a_score': 288
-    }, {
-        'a_article': b'Testing figures',
-        'a_importance': b'300',
-        'a_quality': b'425',
-        'a_score': 109
-    }, {
-        'a_article': b'Testing history',
-        'a_importance': b'300',
-        'a_quality': b'480',
-        'a_score': 596
-    }, {
-        'a_article': b'Testing mechanics',
-        'a_importance': b'400',
-        'a_quality': b'500',
-        'a_score': 625
-    }, {
-        'a_article': b'Testing tools',
-        'a_importance': b'100',
-        'a_quality': b'300',
-        'a_score': 35
-    }]
 
-    logic_project.update_project(self.wikidb, self.wp10db, self.project)
-    logic_project.update_global_articles_for_project_name(
-        self.wp10db, self.project.p_project)
+    logic_project.update_project_assessments(self.wikidb, self.wp10db,
+                                             self.project, {})
 
-    actual = _get_all_global_article_scores(self.wp10db)
-    actual = sorted(sorted(list(a.items())) for a in actual)
-    expected = sorted(sorted(list(e.items())) for e in expected)
-    self.assertEqual(expected, actual)
+    patched_get_new_ratings.assert_not_called()
+    self.assertNotEqual(0, len(_get_all_ratings(self.wp10db)))
 
 
-class CleanupProjectTest(BaseWpOneDbTest):
-  ratings = (
-      (b'Art of testing', b'FA-Class', b'High-Class'),
-      (b'Testing mechanics', b'FA-Class', b'Mid-Class'),
-      (b'Rules of testing', b'FA-Class', b'NotA-Class'),
-      (b'Test frameworks', b'NotA-Class', b'Mid-Class'),
-      (b'Test practices', b'FL-Class', None),
-      (b'Testing history', b'FL-Class', None),
-      (b'Testing figures', None, b'Low-Class'),
-      (b'Important tests', None, b'Low-Class'),
-      (b'Test results', b'NotA-Class', b'NotA-Class'),
-      (b'Test main inheritance', b'NotA-Class', b'NotA-Class'),
-      (b'Failures of tests', None, None),
-      (b'How to test', None, None),
-  )
-  not_a_class_db = NOT_A_CLASS.encode('utf-8')
+class IncrementalGlobalArticlesTest(ArticlesTest):
 
   def setUp(self):
     super().setUp()
-    self.project = Project(p_project=b'Test', p_timestamp=None)
+    self._insert_pages(self.quality_pages)
+    self._insert_pages(self.importance_pages)
 
-    qual_ts = b'2018-04-01T12:30:00Z'
-    imp_ts = b'2018-05-01T13:45:10Z'
-    with self.wp10db.cursor() as cursor:
-      for r in self.ratings:
-        rating = Rating(r_project=self.project.p_project,
-                        r_namespace=0,
-                        r_article=r[0],
-                        r_quality=r[1],
-                        r_importance=r[2],
-                        r_quality_timestamp=qual_ts,
-                        r_importance_timestamp=imp_ts)
-        cursor.execute(
-            '''
-            INSERT INTO ratings
-              (r_project, r_namespace, r_article, r_score, r_quality,
-               r_quality_timestamp, r_importance, r_importance_timestamp)
-            VALUES
-              (%(r_project)s, %(r_namespace)s, %(r_article)s, %(r_score)s,
-               %(r_quality)s, %(r_quality_timestamp)s, %(r_importance)s,
-               %(r_importance_timestamp)s)
-        ''', attr.asdict(rating))
-    self.wp10db.commit()
+  def _sorted_scores(self):
+    return sorted(
+        sorted(a.items()) for a in _get_all_global_article_scores(self.wp10db))
 
-    logic_project.cleanup_project(self.wp10db, self.project)
+  def test_matches_full_pass(self):
+    logic_project.update_project(self.wikidb, self.wp10db, self.project)
+    actual = self._sorted_scores()
 
-  def test_deletes_empty(self):
-    ratings = _get_all_ratings(self.wp10db)
-    self.assertEqual(8, len(ratings))
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('DELETE FROM global_articles')
+    logic_global_articles.rebuild_global_articles(self.wp10db, processes=1)
 
-    titles = set(r.r_article for r in ratings)
-    self.assertTrue(b'Test results' not in titles, titles)
-    self.assertTrue(b'Test main inheritance' not in titles, titles)
-    self.assertTrue(b'Failures of tests' not in titles, titles)
-    self.assertTrue(b'How to test' not in titles, titles)
+    self.assertNotEqual([], actual)
+    self.assertEqual(self._sorted_scores(), actual)
 
-  def test_updates_quality(self):
-    ratings = _get_all_ratings(self.wp10db)
-    for article in (b'Testing figures', b'Important tests'):
-      for rating in ratings:
-        if rating.r_article == article:
-          self.assertEqual(self.not_a_class_db, rating.r_quality)
+  @patch('wp1.logic.api.page.site')
+  def test_removes_unrated(self, patched_site):
+    patched_site.api.return_value = {}
+    logic_project.update_project(self.wikidb, self.wp10db, self.project)
+    with self.wikidb.cursor() as cursor:
+      # The talk pages leave all of the rating categories.
+      cursor.execute('''
+          DELETE FROM categorylinks WHERE cl_from IN (
+            SELECT page_id FROM page WHERE page_namespace = 1)
+      ''')
+    self.wikidb.commit()
 
-  def test_updates_importance(self):
-    ratings = _get_all_ratings(self.wp10db)
-    for article in (b'Testing history', b'Test practices'):
-      for rating in ratings:
-        if rating.r_article == article:
-          self.assertEqual(self.not_a_class_db, rating.r_importance)
+    logic_project.update_project(self.wikidb,
+                                 self.wp10db,
+                                 self.project,
+                                 force=True)
+
+    self.assertEqual([], self._sorted_scores())
 
 
 class UpdateProjectRecordTest(BaseWpOneDbTest):
@@ -1260,6 +1145,29 @@ class UpdateProjectRecordTest(BaseWpOneDbTest):
   def test_importance_count(self):
     self.assertEqual(6, self.project.p_icount)
 
+  def test_counts_applied(self):
+    counts = logic_rating.RatingCounts()
+    counts.rows = 2
+    counts.quality = 1
+    counts.importance = -1
+
+    logic_project.update_project_record(self.wp10db, self.project,
+                                        self.metadata, counts)
+
+    self.assertEqual(10, self.project.p_count)
+    self.assertEqual(6, self.project.p_qcount)
+    self.assertEqual(5, self.project.p_icount)
+
+  def test_counts_without_previous_counts(self):
+    self.project.p_count = None
+    counts = logic_rating.RatingCounts()
+    counts.rows = 2
+
+    logic_project.update_project_record(self.wp10db, self.project,
+                                        self.metadata, counts)
+
+    self.assertEqual(8, self.project.p_count)
+
 
 class ProjectNamesTest(ArticlesTest):
 
@@ -1423,6 +1331,324 @@ class UpdateProjectByNameTest(BaseCombinedDbTest):
       self.wikidb.close = orig_wiki_close
 
 
+class PageIdTest(ArticlesTest):
+
+  def setUp(self):
+    super().setUp()
+    self._insert_pages(self.quality_pages)
+    self._update()
+
+  def _update(self):
+    logic_project.update_project_assessments(self.wikidb, self.wp10db,
+                                             self.project, {})
+
+  def _move_page(self, page_id, new_title, log_timestamp=None):
+    with self.wikidb.cursor() as cursor:
+      cursor.execute(
+          '''
+          SELECT page_namespace, page_title FROM page WHERE page_id = %s
+      ''', (page_id,))
+      page = cursor.fetchone()
+      # The page was touched after the move, which doesn't change its time.
+      cursor.execute(
+          '''
+          UPDATE page SET page_title = %s, page_touched = %s
+          WHERE page_id = %s
+      ''', (new_title, b'20200101000000', page_id))
+      if log_timestamp is not None:
+        params = (b'a:2:{s:9:"4::target";s:%d:"%s";s:10:"5::noredir";'
+                  b's:1:"0";}' % (len(new_title), new_title))
+        cursor.execute(
+            '''
+            INSERT INTO logging
+              (log_type, log_action, log_timestamp, log_namespace, log_title,
+               log_params)
+            VALUES ('move', 'move', %s, %s, %s, %s)
+        ''', (log_timestamp, page['page_namespace'] - 1, page['page_title'],
+              params))
+    self.wikidb.commit()
+
+  def _get_all_moves(self):
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('SELECT * FROM moves')
+      return [Move(**db_move) for db_move in cursor.fetchall()]
+
+  def test_records_page_ids(self):
+    ratings = dict((r.r_article, r) for r in _get_all_ratings(self.wp10db))
+    for p in self.quality_pages[6:]:
+      self.assertEqual(p[0], ratings[p[1]].r_page_id)
+
+  def test_records_missing_page_ids(self):
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('UPDATE ratings SET r_page_id = NULL')
+    self.wp10db.commit()
+
+    self._update()
+
+    ratings = dict((r.r_article, r) for r in _get_all_ratings(self.wp10db))
+    for p in self.quality_pages[6:]:
+      self.assertEqual(p[0], ratings[p[1]].r_page_id)
+
+  def test_new_articles_not_a_class(self):
+    ratings = _get_all_ratings(self.wp10db)
+
+    self.assertEqual(len(self.quality_pages[6:]), len(ratings))
+    for rating in ratings:
+      self.assertEqual(b'NotA-Class', rating.r_importance)
+
+    logic_project.update_project_record(self.wp10db, self.project, {})
+    self.assertEqual(len(ratings), self.project.p_count)
+    self.assertEqual(0, self.project.p_icount)
+
+  @patch('wp1.logic.api.page.site')
+  def test_move_found_by_page_id(self, patched_site):
+    self._move_page(252, b'How to test better', log_timestamp=b'20190102030405')
+
+    self._update()
+
+    patched_site.api.assert_not_called()
+    patched_site.logevents.assert_not_called()
+    moves = self._get_all_moves()
+    self.assertEqual(1, len(moves))
+    self.assertEqual(b'How to test', moves[0].m_old_article)
+    self.assertEqual(0, moves[0].m_new_namespace)
+    self.assertEqual(b'How to test better', moves[0].m_new_article)
+    self.assertEqual(b'2019-01-02T03:04:05Z', moves[0].m_timestamp)
+
+    ratings = dict((r.r_article, r) for r in _get_all_ratings(self.wp10db))
+    self.assertEqual(b'C-Class', ratings[b'How to test better'].r_quality)
+    self.assertEqual(252, ratings[b'How to test better'].r_page_id)
+
+  @patch('wp1.logic.api.page.site')
+  def test_move_found_by_page_id_without_log(self, patched_site):
+    self._move_page(252, b'How to test better')
+
+    self._update()
+
+    patched_site.api.assert_not_called()
+    self.assertEqual([], self._get_all_moves())
+    ratings = dict((r.r_article, r) for r in _get_all_ratings(self.wp10db))
+    self.assertNotIn(b'How to test', ratings)
+    self.assertEqual(252, ratings[b'How to test better'].r_page_id)
+
+  @patch('wp1.logic.api.page.site')
+  def test_move_found_by_page_id_before_update(self, patched_site):
+    # The project was last updated in 2010.
+    self._move_page(252, b'How to test better', log_timestamp=b'20090102030405')
+
+    self._update()
+
+    self.assertEqual([], self._get_all_moves())
+
+  @patch('wp1.logic.api.page.site')
+  def test_deleted_page_not_looked_up(self, patched_site):
+    with self.wikidb.cursor() as cursor:
+      cursor.execute('DELETE FROM page WHERE page_id = 252')
+      cursor.execute('DELETE FROM categorylinks WHERE cl_from = 252')
+    self.wikidb.commit()
+
+    self._update()
+
+    patched_site.api.assert_not_called()
+    patched_site.logevents.assert_not_called()
+    self.assertEqual([], self._get_all_moves())
+    ratings = dict((r.r_article, r) for r in _get_all_ratings(self.wp10db))
+    self.assertNotIn(b'How to test', ratings)
+
+
+class PageIdMergeJoinTest(PageIdTest):
+  """Runs the page id tests against the merge join engine."""
+
+  def _update(self):
+    logic_project.update_project_assessments(self.wikidb,
+                                             self.wp10db,
+                                             self.project, {},
+                                             merge_join=True)
+
+
+class DeltaProjectAssessmentsTest(ArticlesTest):
+
+  def setUp(self):
+    super().setUp()
+    self._insert_pages(self.quality_pages)
+    logic_project.update_project_assessments(self.wikidb, self.wp10db,
+                                             self.project, {})
+    # Age the existing memberships, so that only the ones inserted by the
+    # tests are newer than the last update.
+    with self.wikidb.cursor() as cursor:
+      cursor.execute('UPDATE categorylinks SET cl_timestamp = %s',
+                     (datetime(2018, 1, 1),))
+    self.wikidb.commit()
+    self.since_dt = datetime(2018, 6, 1)
+
+  def _update_delta(self):
+    return logic_project.update_project_assessments(self.wikidb,
+                                                    self.wp10db,
+                                                    self.project, {},
+                                                    since_dt=self.since_dt)
+
+  def test_returns_false(self):
+    self.assertFalse(self._update_delta())
+
+  def test_new_membership(self):
+    self._insert_pages(self.multiple_quality_pages)
+
+    self._update_delta()
+
+    ratings = dict((r.r_article, r) for r in _get_all_ratings(self.wp10db))
+    for p in self.multiple_quality_pages:
+      self.assertEqual(b'A-Class', ratings[p[1]].r_quality)
+      self.assertEqual(self.expected_ts_wiki, ratings[p[1]].r_quality_timestamp)
+    self.assertEqual(b'FA-Class', ratings[b'Art of testing'].r_quality)
+
+  @patch('wp1.logic.api.page.site')
+  def test_vanished_membership(self, patched_site):
+    patched_site.api.return_value = {}
+    with self.wikidb.cursor() as cursor:
+      cursor.execute('DELETE FROM categorylinks WHERE cl_from = 252')
+    self.wikidb.commit()
+
+    self._update_delta()
+
+    ratings = dict((r.r_article, r) for r in _get_all_ratings(self.wp10db))
+    self.assertNotIn(b'How to test', ratings)
+    self.assertEqual(b'C-Class', ratings[b'Failures of tests'].r_quality)
+
+  @patch('wp1.logic.api.page.site')
+  def test_vanished_still_tagged(self, patched_site):
+    self._insert_pages(self.multiple_quality_pages)
+    self._update_delta()
+    with self.wikidb.cursor() as cursor:
+      cursor.execute('DELETE FROM categorylinks WHERE cl_from = 262')
+    self.wikidb.commit()
+    self.since_dt = datetime(2019, 1, 1)
+
+    self._update_delta()
+
+    ratings = dict((r.r_article, r) for r in _get_all_ratings(self.wp10db))
+    self.assertEqual(b'C-Class', ratings[b'How to test'].r_quality)
+    patched_site.api.assert_not_called()
+
+  @patch('wp1.logic.api.page.site')
+  def test_counts_match_database(self, patched_site):
+    patched_site.api.return_value = {}
+    logic_project.update_project_record(self.wp10db, self.project, {})
+    self._insert_pages(self.multiple_quality_pages)
+    with self.wikidb.cursor() as cursor:
+      cursor.execute('DELETE FROM categorylinks WHERE cl_from = 252')
+    self.wikidb.commit()
+
+    counts = logic_rating.RatingCounts()
+    logic_project.update_project_assessments(self.wikidb,
+                                             self.wp10db,
+                                             self.project, {},
+                                             since_dt=self.since_dt,
+                                             counts=counts)
+    logic_project.update_project_record(self.wp10db, self.project, {}, counts)
+    expected = (self.project.p_count, self.project.p_qcount,
+                self.project.p_icount)
+    stats_diff = logic_project_stats.diff_project_stats(self.wp10db,
+                                                        self.project.p_project)
+    logic_project.update_project_record(self.wp10db, self.project, {})
+
+    self.assertEqual(
+        expected,
+        (self.project.p_count, self.project.p_qcount, self.project.p_icount))
+    self.assertEqual({}, stats_diff)
+
+  def test_categories_changed(self):
+    self._insert_pages(self.custom_quality_pages)
+
+    self.assertTrue(self._update_delta())
+
+    ratings = dict((r.r_article, r) for r in _get_all_ratings(self.wp10db))
+    self.assertEqual(b'Draft-Class', ratings[b'Your First Test'].r_quality)
+
+
+class UpdateProjectFingerprintTest(ArticlesTest):
+
+  def test_fingerprint_stable(self):
+    self._insert_pages(self.quality_pages)
+    self.assertEqual(
+        logic_project.project_fingerprint(self.wikidb, self.wp10db,
+                                          self.project, {}),
+        logic_project.project_fingerprint(self.wikidb, self.wp10db,
+                                          self.project, {}))
+
+  def test_fingerprint_changes_with_categories(self):
+    self._insert_pages(self.quality_pages)
+    before = logic_project.project_fingerprint(self.wikidb, self.wp10db,
+                                               self.project, {})
+    self._insert_pages(self.custom_quality_pages)
+    after = logic_project.project_fingerprint(self.wikidb, self.wp10db,
+                                              self.project, {})
+    self.assertNotEqual(before, after)
+
+  def test_fingerprint_changes_with_members(self):
+    self._insert_pages(self.quality_pages)
+    logic_project.update_project_categories(self.wikidb, self.wp10db,
+                                            self.project, {})
+    before = logic_project.project_fingerprint(self.wikidb, self.wp10db,
+                                               self.project, {})
+    self._insert_pages(self.multiple_quality_pages)
+    after = logic_project.project_fingerprint(self.wikidb, self.wp10db,
+                                              self.project, {})
+    self.assertNotEqual(before, after)
+
+  def test_fingerprint_changes_with_extra(self):
+    self._insert_pages(self.quality_pages)
+    before = logic_project.project_fingerprint(self.wikidb, self.wp10db,
+                                               self.project, {})
+    after = logic_project.project_fingerprint(
+        self.wikidb, self.wp10db, self.project,
+        {'extra': {
+            'Draft-Class_Test_articles': {
+                'title': 'Draft-Class'
+            }
+        }})
+    self.assertNotEqual(before, after)
+
+  @patch('wp1.logic.project.api_project.get_extra_assessments')
+  @patch('wp1.logic.project.update_project_assessments')
+  def test_skips_unchanged(self, patched_update_assessments, patched_extra):
+    patched_extra.return_value = {}
+    self._insert_pages(self.quality_pages)
+
+    logic_project.update_project(self.wikidb, self.wp10db, self.project)
+    logic_project.update_project(self.wikidb, self.wp10db, self.project)
+
+    self.assertEqual(1, patched_update_assessments.call_count)
+    project = logic_project.get_project_by_name(self.wp10db,
+                                                self.project.p_project)
+    self.assertIsNotNone(project.p_fingerprint)
+
+  @patch('wp1.logic.project.api_project.get_extra_assessments')
+  @patch('wp1.logic.project.update_project_assessments')
+  def test_updates_changed(self, patched_update_assessments, patched_extra):
+    patched_extra.return_value = {}
+    self._insert_pages(self.quality_pages)
+
+    logic_project.update_project(self.wikidb, self.wp10db, self.project)
+    self._insert_pages(self.custom_quality_pages)
+    logic_project.update_project(self.wikidb, self.wp10db, self.project)
+
+    self.assertEqual(2, patched_update_assessments.call_count)
+
+  @patch('wp1.logic.project.api_project.get_extra_assessments')
+  @patch('wp1.logic.project.update_project_assessments')
+  def test_force(self, patched_update_assessments, patched_extra):
+    patched_extra.return_value = {}
+    self._insert_pages(self.quality_pages)
+
+    logic_project.update_project(self.wikidb, self.wp10db, self.project)
+    logic_project.update_project(self.wikidb,
+                                 self.wp10db,
+                                 self.project,
+                                 force=True)
+
+    self.assertEqual(2, patched_update_assessments.call_count)
+
+
 class ProjectProgressTest(ArticlesTest):
 
   def setUp(self):
@@ -1451,3 +1677,176 @@ class ProjectProgressTest(ArticlesTest):
     actual = self.redis.hget(b'progress:%s' % self.project.p_project,
                              'progress')
     self.assertEqual(b'36', actual)
+
+  def test_progress_batched(self):
+    with patch('wp1.logic.project.increment_progress_count',
+               wraps=logic_project.increment_progress_count) as patched:
+      logic_project.update_project_assessments(self.wikidb,
+                                               self.wp10db,
+                                               self.project, {},
+                                               redis=self.redis,
+                                               track_progress=True)
+    # The 36 members are written in a few increments, not one by one.
+    self.assertLess(patched.call_count, 36)
+    self.assertEqual(36, sum(c[0][2] for c in patched.call_args_list))
+
+
+class ProgressReporterTest(BaseRedisTest):
+
+  def setUp(self):
+    super().setUp()
+    self.project_name = b'Test'
+    self.key = b'progress:Test'
+
+  def _progress(self):
+    return self.redis.hget(self.key, 'progress')
+
+  def test_pending_until_batch_size(self):
+    progress = logic_project.ProgressReporter(self.redis,
+                                              self.project_name,
+                                              batch_size=3,
+                                              max_secs=100)
+    progress.increment()
+    progress.increment()
+    self.assertIsNone(self._progress())
+
+    progress.increment()
+    self.assertEqual(b'3', self._progress())
+
+  @patch('wp1.logic.project.time.monotonic')
+  def test_flushes_after_max_secs(self, patched_monotonic):
+    patched_monotonic.return_value = 100
+    progress = logic_project.ProgressReporter(self.redis,
+                                              self.project_name,
+                                              batch_size=1000,
+                                              max_secs=0.25)
+    progress.increment(2)
+    self.assertIsNone(self._progress())
+
+    patched_monotonic.return_value = 100.25
+    progress.increment()
+    self.assertEqual(b'3', self._progress())
+
+  def test_flush(self):
+    progress = logic_project.ProgressReporter(self.redis,
+                                              self.project_name,
+                                              batch_size=1000,
+                                              max_secs=100)
+    progress.increment(5)
+    progress.flush()
+    progress.flush()
+    self.assertEqual(b'5', self._progress())
+
+  def test_no_redis(self):
+    progress = logic_project.ProgressReporter(None, self.project_name)
+    progress.increment(5)
+    progress.flush()
+
+
+class UpdateDurationTest(BaseRedisTest):
+
+  def test_first_duration(self):
+    logic_project.record_update_duration(self.redis, b'Water', 100)
+
+    self.assertEqual({b'Water': 100},
+                     logic_project.get_update_durations(self.redis))
+
+  @patch('wp1.logic.project.UPDATE_DURATION_WEIGHT', 0.25)
+  def test_average_duration(self):
+    logic_project.record_update_duration(self.redis, b'Water', 100)
+    logic_project.record_update_duration(self.redis, b'Water', 200)
+    logic_project.record_update_duration(self.redis, b'Air', 10)
+
+    self.assertEqual({
+        b'Water': 125,
+        b'Air': 10
+    }, logic_project.get_update_durations(self.redis))
+
+  @patch('wp1.logic.project.utcnow',
+         return_value=datetime(2018, 12, 25, 5, 55, 55))
+  @patch('wp1.logic.project.UPDATE_FAILURE_BACKOFF_SECS', 60 * 60)
+  @patch('wp1.logic.project.UPDATE_FAILURE_MAX_BACKOFF_SECS', 3 * 60 * 60)
+  def test_failure_backoff(self, patched_utcnow):
+    actual = [
+        logic_project.record_update_failure(self.redis, b'Water')
+        for _ in range(3)
+    ]
+
+    self.assertEqual([
+        datetime(2018, 12, 25, 6, 55, 55),
+        datetime(2018, 12, 25, 7, 55, 55),
+        datetime(2018, 12, 25, 8, 55, 55),
+    ], actual)
+    self.assertEqual({b'Water': datetime(2018, 12, 25, 8, 55, 55)},
+                     logic_project.get_update_backoffs(self.redis))
+
+  @patch('wp1.logic.project.utcnow',
+         return_value=datetime(2018, 12, 25, 5, 55, 55))
+  def test_clear_update_failures(self, patched_utcnow):
+    logic_project.record_update_failure(self.redis, b'Water')
+    logic_project.record_update_failure(self.redis, b'Water')
+
+    logic_project.clear_update_failures(self.redis, b'Water')
+
+    self.assertEqual({}, logic_project.get_update_backoffs(self.redis))
+    self.assertEqual(datetime(2018, 12, 25, 6, 55, 55),
+                     logic_project.record_update_failure(self.redis, b'Water'))
+
+  def test_in_flight(self):
+    self.assertTrue(logic_project.mark_project_in_flight(self.redis, b'Water'))
+    self.assertFalse(logic_project.mark_project_in_flight(self.redis, b'Water'))
+
+    logic_project.clear_project_in_flight(self.redis, b'Water')
+
+    self.assertTrue(logic_project.mark_project_in_flight(self.redis, b'Water'))
+
+
+@patch('wp1.logic.project.wiki_connect', MagicMock())
+@patch('wp1.logic.project.wp10_connect', MagicMock())
+@patch('wp1.logic.project.get_project_by_name', MagicMock())
+@patch('wp1.queues.enqueue_single_project')
+@patch('wp1.logic.project.update_project')
+@patch('wp1.logic.project.redis_connect')
+class ManualFollowUpTest(BaseRedisTest):
+
+  def test_enqueues_follow_up(self, patched_redis_connect,
+                              patched_update_project, patched_enqueue):
+    patched_redis_connect.return_value = self.redis
+    logic_project.request_manual_follow_up(self.redis, b'Water')
+
+    logic_project.update_project_by_name(b'Water')
+
+    patched_enqueue.assert_called_once_with(self.redis, b'Water', manual=True)
+    self.assertFalse(logic_project.pop_manual_follow_up(self.redis, b'Water'))
+    self.assertEqual({}, logic_project.get_update_backoffs(self.redis))
+
+  def test_enqueues_follow_up_after_failure(self, patched_redis_connect,
+                                            patched_update_project,
+                                            patched_enqueue):
+    patched_redis_connect.return_value = self.redis
+    patched_update_project.side_effect = Exception('Update failed')
+    logic_project.request_manual_follow_up(self.redis, b'Water')
+
+    with self.assertRaises(Exception):
+      logic_project.update_project_by_name(b'Water')
+
+    patched_enqueue.assert_called_once_with(self.redis, b'Water', manual=True)
+    self.assertIn(b'Water', logic_project.get_update_backoffs(self.redis))
+
+  def test_no_follow_up(self, patched_redis_connect, patched_update_project,
+                        patched_enqueue):
+    patched_redis_connect.return_value = self.redis
+
+    logic_project.update_project_by_name(b'Water')
+
+    patched_enqueue.assert_not_called()
+
+  def test_manual_update_keeps_follow_up(self, patched_redis_connect,
+                                         patched_update_project,
+                                         patched_enqueue):
+    patched_redis_connect.return_value = self.redis
+    logic_project.request_manual_follow_up(self.redis, b'Water')
+
+    logic_project.update_project_by_name(b'Water', track_progress=True)
+
+    patched_enqueue.assert_not_called()
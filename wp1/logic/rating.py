@@ -1,9 +1,11 @@
+from collections import defaultdict
 import logging
+import time
 
 import attr
 
 from wp1.conf import get_conf
-from wp1.constants import GLOBAL_TIMESTAMP, AssessmentKind
+from wp1.constants import GLOBAL_TIMESTAMP, RATINGS_WRITE_BATCH_SIZE, AssessmentKind
 from wp1.logic import log as logic_log
 from wp1.models.wp10.log import Log
 from wp1.models.wp10.rating import Rating
@@ -24,6 +26,100 @@ def get_project_ratings(wp10db, project_name):
     return [Rating(**db_rating) for db_rating in cursor.fetchall()]
 
 
+def iter_project_ratings(wp10db, project_name, chunk_size=None):
+  """Yields the ratings of a project in (r_namespace, r_article) order.
+
+  The rows are consumed one at a time instead of being fetched as a list, so
+  on a streaming cursor only the current rating is held in memory. If
+  chunk_size is given, the ratings are instead fetched chunk_size rows at a
+  time, each chunk with its own query seeking past the last key of the
+  previous one. This leaves the connection free for other queries between
+  chunks.
+  """
+  if chunk_size is None:
+    with wp10db.cursor() as cursor:
+      cursor.execute(
+          'SELECT * FROM ' + Rating.table_name + '''
+        WHERE r_project = %(r_project)s
+        ORDER BY r_namespace, r_article
+      ''', {'r_project': project_name})
+      for db_rating in cursor:
+        yield Rating(**db_rating)
+    return
+
+  params = {'r_project': project_name, 'limit': chunk_size}
+  where = ''
+  while True:
+    with wp10db.cursor() as cursor:
+      cursor.execute(
+          'SELECT * FROM ' + Rating.table_name + '''
+        WHERE r_project = %(r_project)s''' + where + '''
+        ORDER BY r_namespace, r_article
+        LIMIT %(limit)s
+      ''', params)
+      ratings = [Rating(**db_rating) for db_rating in cursor.fetchall()]
+
+    yield from ratings
+    if len(ratings) < chunk_size:
+      return
+
+    params['namespace'] = ratings[-1].r_namespace
+    params['article'] = ratings[-1].r_article
+    where = ' AND (r_namespace, r_article) > (%(namespace)s, %(article)s)'
+
+
+def get_project_ratings_for_articles(wp10db, project_name, articles):
+  """Returns the ratings of a project for the given (namespace, article)s."""
+  articles = tuple(articles)
+  if not articles:
+    return []
+
+  with wp10db.cursor() as cursor:
+    cursor.execute(
+        'SELECT * FROM ' + Rating.table_name + '''
+      WHERE r_project = %(r_project)s AND
+            (r_namespace, r_article) IN %(articles)s
+    ''', {
+            'r_project': project_name,
+            'articles': articles
+        })
+    return [Rating(**db_rating) for db_rating in cursor.fetchall()]
+
+
+def _rating_column(kind):
+  if kind == AssessmentKind.QUALITY:
+    return 'r_quality'
+  if kind == AssessmentKind.IMPORTANCE:
+    return 'r_importance'
+  raise ValueError('AssessmentKind was not QUALITY or IMPORTANCE: %s' % kind)
+
+
+def count_project_ratings_by_value(wp10db, project_name, kind):
+  """Returns a dict of rating value to the number of articles with it."""
+  column = _rating_column(kind)
+  with wp10db.cursor() as cursor:
+    cursor.execute(
+        'SELECT ' + column + ' AS rating, COUNT(*) AS count FROM ' +
+        Rating.table_name + '''
+      WHERE r_project = %(r_project)s
+      GROUP BY ''' + column, {'r_project': project_name})
+    return dict((db_count['rating'], db_count['count'])
+                for db_count in cursor.fetchall())
+
+
+def get_project_ratings_by_value(wp10db, project_name, kind, value):
+  """Returns the ratings of a project with the given value of the given kind."""
+  column = _rating_column(kind)
+  with wp10db.cursor() as cursor:
+    cursor.execute(
+        'SELECT * FROM ' + Rating.table_name + '''
+      WHERE r_project = %(r_project)s AND ''' + column + ' = %(value)s', {
+            'r_project': project_name,
+            'value': value
+        })
+    return [Rating(**db_rating) for db_rating in cursor.fetchall()]
+
+
 def _project_rating_query(project_name,
                           quality=None,
                           importance=None,
@@ -250,50 +346,293 @@ def insert_or_update(wp10db, rating, kind):
     ''' + duplicate_clause, attr.asdict(rating))
 
 
-def delete_empty_for_project(wp10db, project):
-  not_a_class_db = NOT_A_CLASS.encode('utf-8')
-  with wp10db.cursor() as cursor:
-    args = {'r_project': project.p_project, 'not_a_class': not_a_class_db}
-    cursor.execute(
+_BULK_DUPLICATE_CLAUSES = {
+    AssessmentKind.QUALITY:
         '''
-        DELETE FROM ratings
-        WHERE r_project=%(r_project)s AND
-              (r_quality IS NULL OR r_quality=%(not_a_class)s) AND
-              (r_importance IS NULL OR r_importance=%(not_a_class)s)
-    ''', args)
-    return cursor.rowcount
+      ON DUPLICATE KEY UPDATE r_quality=VALUES(r_quality),
+                              r_quality_timestamp=VALUES(r_quality_timestamp)
+    ''',
+    AssessmentKind.IMPORTANCE:
+        '''
+      ON DUPLICATE KEY UPDATE r_importance=VALUES(r_importance),
+                              r_importance_timestamp=VALUES(r_importance_timestamp)
+    ''',
+    AssessmentKind.BOTH:
+        '''
+      ON DUPLICATE KEY UPDATE r_quality=VALUES(r_quality),
+                              r_quality_timestamp=VALUES(r_quality_timestamp),
+                              r_importance=VALUES(r_importance),
+                              r_importance_timestamp=VALUES(r_importance_timestamp)
+    ''',
+}
+
+
+def insert_or_update_many(wp10db, ratings, kind):
+  """Upserts a list of ratings of the given kind in a single statement.
+
+  The ratings can either be Rating objects or dicts of their attributes. The
+  final state of the table is the same as calling insert_or_update on each
+  rating in order.
+  """
+  duplicate_clause = _BULK_DUPLICATE_CLAUSES.get(kind)
+  if duplicate_clause is None:
+    raise ValueError('AssessmentKind was not QUALITY or IMPORTANCE: %s', kind)
 
+  if not ratings:
+    return 0
 
-def update_null_quality_for_project(wp10db, project):
-  not_a_class_db = NOT_A_CLASS.encode('utf-8')
+  values = [r if isinstance(r, dict) else attr.asdict(r) for r in ratings]
+  for value in values:
+    value.setdefault('r_page_id', None)
   with wp10db.cursor() as cursor:
-    args = {'r_project': project.p_project, 'not_a_class': not_a_class_db}
-    cursor.execute(
+    # PyMySQL rewrites executemany of an INSERT ... VALUES statement into a
+    # single multi-row INSERT, which is why the duplicate clause above uses
+    # VALUES() instead of named parameters. The page id is only written for
+    # new ratings, the ids of existing ones are written by PageIdWriter.
+    cursor.executemany(
         '''
-        UPDATE ratings
-          SET r_quality = %(not_a_class)s,
-              r_quality_timestamp=r_importance_timestamp
-        WHERE r_project=%(r_project)s AND
-              r_quality IS NULL
-    ''', args)
-    return cursor.rowcount
+        INSERT INTO ratings
+          (r_project, r_namespace, r_article, r_score, r_quality,
+           r_quality_timestamp, r_importance, r_importance_timestamp,
+           r_page_id)
+        VALUES
+          (%(r_project)s, %(r_namespace)s, %(r_article)s, %(r_score)s,
+           %(r_quality)s, %(r_quality_timestamp)s, %(r_importance)s,
+           %(r_importance_timestamp)s, %(r_page_id)s)
+    ''' + duplicate_clause, values)
+  return len(values)
 
 
-def update_null_importance_for_project(wp10db, project):
-  not_a_class_db = NOT_A_CLASS.encode('utf-8')
+def delete_many(wp10db, project_name, articles):
+  """Deletes the ratings of a project for the given (namespace, article)s."""
+  articles = tuple(articles)
+  if not articles:
+    return 0
+
   with wp10db.cursor() as cursor:
-    args = {'r_project': project.p_project, 'not_a_class': not_a_class_db}
     cursor.execute(
         '''
-        UPDATE ratings
-          SET r_importance = %(not_a_class)s,
-              r_importance_timestamp=r_quality_timestamp
-        WHERE r_project=%(r_project)s AND
-              r_importance IS NULL
-    ''', args)
+        DELETE FROM ratings
+        WHERE r_project = %(r_project)s AND
+              (r_namespace, r_article) IN %(articles)s
+    ''', {
+            'r_project': project_name,
+            'articles': articles
+        })
     return cursor.rowcount
 
 
+class RatingWriter:
+  """Buffers rating upserts and deletes and writes them in multi-row batches.
+
+  Ratings are collected per AssessmentKind, because each kind only updates its
+  own columns on duplicate keys. A kind's buffer is written as soon as it holds
+  batch_size ratings, and everything outstanding is written by flush(), which
+  must be called before the transaction is committed.
+
+  New ratings get NotA-Class, with the timestamp of the kind that is written,
+  for the kind that they are not rated for, which used to be set by a cleanup
+  pass after the update.
+  """
+
+  def __init__(self, wp10db, batch_size=RATINGS_WRITE_BATCH_SIZE):
+    self.wp10db = wp10db
+    self.batch_size = batch_size
+    self.rows_written = 0
+    self.rows_deleted = 0
+    self.secs_writing = 0.0
+    self._pending = defaultdict(list)
+    self._deletes = defaultdict(set)
+
+  def add(self, rating, kind):
+    if kind not in _BULK_DUPLICATE_CLAUSES:
+      raise ValueError('AssessmentKind was not QUALITY or IMPORTANCE: %s', kind)
+
+    # Copy the attributes now, the caller is free to reuse the rating object.
+    values = attr.asdict(rating)
+    # Only used if the rating is new, existing ratings keep the other kind.
+    if kind == AssessmentKind.QUALITY and values['r_importance'] is None:
+      values['r_importance'] = NOT_A_CLASS.encode('utf-8')
+      values['r_importance_timestamp'] = values['r_quality_timestamp']
+    elif kind == AssessmentKind.IMPORTANCE and values['r_quality'] is None:
+      values['r_quality'] = NOT_A_CLASS.encode('utf-8')
+      values['r_quality_timestamp'] = values['r_importance_timestamp']
+
+    pending = self._pending[kind]
+    pending.append(values)
+    if len(pending) >= self.batch_size:
+      self._write(kind)
+
+  def delete(self, rating):
+    """Deletes the rating, once all of the pending upserts are written."""
+    deletes = self._deletes[rating.r_project]
+    deletes.add((rating.r_namespace, rating.r_article))
+    if len(deletes) >= self.batch_size:
+      self.flush()
+
+  def flush(self):
+    for kind in list(self._pending):
+      self._write(kind)
+    for project_name in list(self._deletes):
+      start = time.monotonic()
+      self.rows_deleted += delete_many(self.wp10db, project_name,
+                                       sorted(self._deletes.pop(project_name)))
+      self.secs_writing += time.monotonic() - start
+
+  @property
+  def rows_per_sec(self):
+    if self.secs_writing == 0:
+      return 0.0
+    return self.rows_written / self.secs_writing
+
+  def log_stats(self, project_name):
+    logger.info(
+        'Wrote %s ratings and deleted %s for %s in %.2fs (%.1f rows/sec, '
+        'batch size %s)', self.rows_written, self.rows_deleted,
+        project_name.decode('utf-8'), self.secs_writing, self.rows_per_sec,
+        self.batch_size)
+
+  def _write(self, kind):
+    pending = self._pending.pop(kind, None)
+    if not pending:
+      return
+
+    start = time.monotonic()
+    self.rows_written += insert_or_update_many(self.wp10db, pending, kind)
+    self.secs_writing += time.monotonic() - start
+
+
+def _is_assessed(value):
+  return value is not None and value not in (NOT_A_CLASS.encode('utf-8'),
+                                             UNASSESSED_CLASS.encode('utf-8'))
+
+
+class RatingCounts:
+  """Tracks the changes that a project update makes to its project counts.
+
+  rows is the change in the number of ratings of the project, quality and
+  importance the change in the number of them that are assessed for that
+  kind, with anything but NotA-Class or Unassessed-Class. The changes to the
+  number of ratings with each pair of quality and importance, which are
+  stored in project_stats, are kept until they are taken with pop_cells().
+  Callers report each rating that they write with add() and each one that
+  they delete with remove().
+  """
+
+  def __init__(self):
+    self.rows = 0
+    self.quality = 0
+    self.importance = 0
+    # The (quality, importance) of every article written so far, whose
+    # ratings may be written again for the other kind.
+    self._values = {}
+    self._cells = defaultdict(int)
+
+  def add(self, rating, kind, old_value, new_row=False):
+    """Counts a rating of the given kind that used to have old_value.
+
+    new_row is True if the rating did not exist before the update. Both kinds
+    of a new rating can be added, it is only counted once. The first time an
+    existing rating is added, its value of the other kind must be the stored
+    one.
+    """
+    key = (rating.r_project, rating.r_namespace, rating.r_article)
+    before = self._values.get(key)
+    if before is None and not new_row:
+      if kind == AssessmentKind.QUALITY:
+        before = (old_value, rating.r_importance)
+      else:
+        before = (rating.r_quality, old_value)
+
+    # New ratings get NotA-Class for the kind that they are not rated for.
+    quality, importance = before or (None, None)
+    if kind == AssessmentKind.QUALITY:
+      after = (rating.r_quality, importance)
+    elif kind == AssessmentKind.IMPORTANCE:
+      after = (quality, rating.r_importance)
+    else:
+      return
+
+    if before is None:
+      self.rows += 1
+    else:
+      self._add_cell(key[0], before, -1)
+    self._add_cell(key[0], after, 1)
+    self._values[key] = after
+    self.quality += _is_assessed(after[0]) - _is_assessed(quality)
+    self.importance += _is_assessed(after[1]) - _is_assessed(importance)
+
+  def remove(self, rating):
+    """Counts a deleted rating, with its values before the update."""
+    key = (rating.r_project, rating.r_namespace, rating.r_article)
+    before = self._values.pop(key, (rating.r_quality, rating.r_importance))
+    self.rows -= 1
+    self.quality -= _is_assessed(before[0])
+    self.importance -= _is_assessed(before[1])
+    self._add_cell(key[0], before, -1)
+
+  def pop_cells(self):
+    """Returns the changes of project_stats since the last call.
+
+    The changes are a dict of (project, quality, importance) to the change in
+    the number of ratings with that quality and importance.
+    """
+    cells = self._cells
+    self._cells = defaultdict(int)
+    return cells
+
+  def apply(self, project):
+    """Updates the counts of the project, which must be the ones before."""
+    project.p_count += self.rows
+    project.p_qcount += self.quality
+    project.p_icount += self.importance
+
+  def _add_cell(self, project_name, values, delta):
+    # NULL ratings, written by older versions, are the same as NotA-Class.
+    not_a_class = NOT_A_CLASS.encode('utf-8')
+    self._cells[(project_name, values[0] or not_a_class, values[1] or
+                 not_a_class)] += delta
+
+
+class PageIdWriter:
+  """Buffers the talk page ids of existing ratings until they are flushed.
+
+  New ratings are inserted with their id, see insert_or_update_many. The ids
+  are written with updates, which never create a rating, by flush(), which
+  the UpdateTransaction calls after the ratings are written. Ratings whose
+  values did not change can still have their id recorded this way.
+  """
+
+  def __init__(self, wp10db):
+    self.wp10db = wp10db
+    self.rows_written = 0
+    self._pending = {}
+
+  def add(self, project_name, namespace, article, page_id):
+    self._pending[(project_name, namespace, article)] = page_id
+
+  def flush(self):
+    if not self._pending:
+      return
+
+    values = [{
+        'r_project': project_name,
+        'r_namespace': namespace,
+        'r_article': article,
+        'r_page_id': page_id,
+    } for (project_name, namespace,
+           article), page_id in sorted(self._pending.items())]
+    self._pending = {}
+    with self.wp10db.cursor() as cursor:
+      cursor.executemany(
+          '''
+          UPDATE ratings SET r_page_id = %(r_page_id)s
+          WHERE r_project = %(r_project)s AND r_namespace = %(r_namespace)s AND
+                r_article = %(r_article)s
+      ''', values)
+    self.rows_written += len(values)
+
+
 def count_for_project(wp10db, project):
   with wp10db.cursor() as cursor:
     cursor.execute(
@@ -341,7 +680,11 @@ def count_unassessed_importance_for_project(wp10db, project):
     return cursor.fetchone()['cnt']
 
 
-def add_log_for_rating(wp10db, new_rating, kind, old_rating_value):
+def add_log_for_rating(wp10db,
+                       new_rating,
+                       kind,
+                       old_rating_value,
+                       log_writer=None):
   if kind == AssessmentKind.QUALITY:
     action = b'quality'
     timestamp = new_rating.r_quality_timestamp
@@ -361,4 +704,7 @@ def add_log_for_rating(wp10db, new_rating, kind, old_rating_value):
             l_old=old_rating_value,
             l_new=new,
             l_revision_timestamp=timestamp)
-  logic_log.insert_or_update(wp10db, log)
+  if log_writer is None:
+    logic_log.insert_or_update(wp10db, log)
+  else:
+    log_writer.add(log)
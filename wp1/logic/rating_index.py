@@ -0,0 +1,267 @@
+"""Compact in-memory indexes of the ratings of a project.
+
+A project update needs the existing rating of every article in the project,
+which of those articles are still tagged and the new ratings that were found.
+For the largest projects, keeping these as Rating objects in dicts and sets
+costs gigabytes of memory, so the classes here keep them in flat arrays
+instead: rating values are interned as small ints, titles live in a single
+byte arena addressed by offsets and the seen articles are a bitset.
+"""
+
+from array import array
+from bisect import bisect_left
+
+from wp1.constants import AssessmentKind
+from wp1.models.wp10.rating import Rating
+
+
+class _Interner:
+  """Maps repeated values, including None, to small ints and back."""
+
+  def __init__(self):
+    self._values = [None]
+    self._ids = {None: 0}
+
+  def __len__(self):
+    return len(self._values)
+
+  def id_for(self, value):
+    value_id = self._ids.get(value)
+    if value_id is None:
+      value_id = len(self._values)
+      self._ids[value] = value_id
+      self._values.append(value)
+    return value_id
+
+  def value(self, value_id):
+    return self._values[value_id]
+
+
+class _Keys:
+  """Read-only sequence of the (namespace, title) keys of a RatingIndex."""
+
+  def __init__(self, index):
+    self._index = index
+
+  def __len__(self):
+    return len(self._index)
+
+  def __getitem__(self, position):
+    return self._index.key(position)
+
+
+class RatingIndex:
+  """The existing ratings of a project, ordered by (namespace, article).
+
+  Ratings have to be added in (r_namespace, r_article) order, which is the
+  order of the primary key of the ratings table, so that articles can be found
+  with a binary search over the title arena. Each rating is identified by its
+  position in that order.
+  """
+
+  def __init__(self, project_name):
+    self.project_name = project_name
+    self._values = _Interner()
+    self._timestamps = _Interner()
+    self._titles = bytearray()
+    self._offsets = array('Q', [0])
+    self._namespaces = array('l')
+    self._scores = array('L')
+    self._quality = array('H')
+    self._quality_ts = array('L')
+    self._importance = array('H')
+    self._importance_ts = array('L')
+    # Page ids are positive, so 0 stands for a rating without one.
+    self._page_ids = array('L')
+    self._seen = bytearray()
+    self._keys = _Keys(self)
+
+  @classmethod
+  def from_ratings(cls, project_name, ratings):
+    index = cls(project_name)
+    for rating in ratings:
+      index.add(rating)
+    return index
+
+  def __len__(self):
+    return len(self._namespaces)
+
+  def add(self, rating):
+    if len(self) and (rating.r_namespace,
+                      rating.r_article) <= self.key(len(self) - 1):
+      raise ValueError('Ratings must be added in (namespace, article) order, '
+                       'got %s:%r' % (rating.r_namespace, rating.r_article))
+
+    self._titles.extend(rating.r_article)
+    self._offsets.append(len(self._titles))
+    self._namespaces.append(rating.r_namespace)
+    self._scores.append(rating.r_score)
+    self._quality.append(self._values.id_for(rating.r_quality))
+    self._quality_ts.append(self._timestamps.id_for(rating.r_quality_timestamp))
+    self._importance.append(self._values.id_for(rating.r_importance))
+    self._importance_ts.append(
+        self._timestamps.id_for(rating.r_importance_timestamp))
+    self._page_ids.append(rating.r_page_id or 0)
+    if len(self) > len(self._seen) * 8:
+      self._seen.append(0)
+
+  def title(self, position):
+    start = self._offsets[position]
+    end = self._offsets[position + 1]
+    return bytes(self._titles[start:end])
+
+  def namespace(self, position):
+    return self._namespaces[position]
+
+  def key(self, position):
+    return (self._namespaces[position], self.title(position))
+
+  def ref(self, position):
+    return str(self._namespaces[position]).encode('utf-8') + b':' + self.title(
+        position)
+
+  def find(self, namespace, title):
+    """Returns the position of the article, or None if it has no rating."""
+    key = (namespace, title)
+    position = bisect_left(self._keys, key)
+    if position < len(self) and self.key(position) == key:
+      return position
+    return None
+
+  def page_id(self, position):
+    return self._page_ids[position] or None
+
+  def set_page_id(self, position, page_id):
+    self._page_ids[position] = page_id or 0
+
+  def quality(self, position):
+    return self._values.value(self._quality[position])
+
+  def importance(self, position):
+    return self._values.value(self._importance[position])
+
+  def value(self, position, kind):
+    if kind == AssessmentKind.QUALITY:
+      return self.quality(position)
+    if kind == AssessmentKind.IMPORTANCE:
+      return self.importance(position)
+    raise ValueError('AssessmentKind was not QUALITY or IMPORTANCE: %s' % kind)
+
+  def rating(self, position):
+    """Returns a new Rating object for the rating at the given position."""
+    return Rating(
+        r_project=self.project_name,
+        r_namespace=self._namespaces[position],
+        r_article=self.title(position),
+        r_score=self._scores[position],
+        r_quality=self.quality(position),
+        r_quality_timestamp=self._timestamps.value(self._quality_ts[position]),
+        r_importance=self.importance(position),
+        r_importance_timestamp=self._timestamps.value(
+            self._importance_ts[position]),
+        r_page_id=self.page_id(position),
+    )
+
+  def mark_seen(self, position):
+    self._seen[position >> 3] |= 1 << (position & 7)
+
+  def is_seen(self, position):
+    return bool(self._seen[position >> 3] & (1 << (position & 7)))
+
+  def count_seen(self):
+    return sum(bin(byte).count('1') for byte in self._seen)
+
+  def unseen(self):
+    """Yields the positions of the ratings that have not been marked seen."""
+    for position in range(len(self)):
+      if not self.is_seen(position):
+        yield position
+
+
+class NewRatings:
+  """The highest ranked new rating of one kind for each article of a project.
+
+  Articles that already have a rating in the RatingIndex are kept by position
+  in flat arrays. Articles that are rated for the first time, usually few, are
+  kept in a dict keyed by (namespace, title).
+  """
+
+  def __init__(self, index, kind, rating_to_category):
+    if kind not in (AssessmentKind.QUALITY, AssessmentKind.IMPORTANCE):
+      raise ValueError('AssessmentKind was not QUALITY or IMPORTANCE: %s' %
+                       kind)
+    self.index = index
+    self.kind = kind
+    self._rankings = dict(
+        (rating.encode('utf-8'), ranking)
+        for rating, (category, ranking) in rating_to_category.items())
+    self._values = _Interner()
+    self._timestamps = _Interner()
+    self._rating = array('H', [0]) * len(index)
+    self._timestamp = array('L', [0]) * len(index)
+    self._new = {}
+
+  def __len__(self):
+    return sum(1 for value_id in self._rating if value_id) + len(self._new)
+
+  def _outranks(self, value_id, current_id):
+    if not current_id:
+      return True
+    return (self._rankings[self._values.value(value_id)] >
+            self._rankings[self._values.value(current_id)])
+
+  def add(self,
+          namespace,
+          title,
+          rating,
+          timestamp_dt,
+          position=None,
+          page_id=None):
+    """Records a rating for an article, if it outranks the one already found.
+
+    position is the position of the article in the RatingIndex, or None if the
+    article has no existing rating, in which case page_id is the page id of
+    its talk page that the new rating is written with. timestamp_dt is the
+    datetime the article was tagged with the rating.
+    """
+    value_id = self._values.id_for(rating)
+    if position is None:
+      key = (namespace, title)
+      current = self._new.get(key)
+      if current is None or self._outranks(value_id, current[0]):
+        self._new[key] = (value_id, self._timestamps.id_for(timestamp_dt),
+                          page_id)
+    elif self._outranks(value_id, self._rating[position]):
+      self._rating[position] = value_id
+      self._timestamp[position] = self._timestamps.id_for(timestamp_dt)
+
+  def _apply(self, rating, value_id, timestamp_id):
+    value = self._values.value(value_id)
+    timestamp_dt = self._timestamps.value(timestamp_id)
+    if self.kind == AssessmentKind.QUALITY:
+      rating.r_quality = value
+      rating.set_quality_timestamp_dt(timestamp_dt)
+    else:
+      rating.r_importance = value
+      rating.set_importance_timestamp_dt(timestamp_dt)
+    return rating
+
+  def ratings(self):
+    """Yields (position, Rating) for every article that has a new rating.
+
+    position is None for articles that had no existing rating.
+    """
+    for position, value_id in enumerate(self._rating):
+      if value_id:
+        yield (position,
+               self._apply(self.index.rating(position), value_id,
+                           self._timestamp[position]))
+
+    for (namespace, title), (value_id, timestamp_id,
+                             page_id) in self._new.items():
+      rating = Rating(r_project=self.index.project_name,
+                      r_namespace=namespace,
+                      r_article=title,
+                      r_score=0,
+                      r_page_id=page_id)
+      yield (None, self._apply(rating, value_id, timestamp_id))
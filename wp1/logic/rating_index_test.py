@@ -0,0 +1,183 @@
+from datetime import datetime
+import unittest
+
+from wp1.constants import AssessmentKind
+from wp1.logic.rating_index import NewRatings, RatingIndex
+from wp1.models.wp10.rating import Rating
+
+
+def _rating(ns, article, quality=None, importance=None, page_id=None):
+  return Rating(r_project=b'Project',
+                r_namespace=ns,
+                r_article=article,
+                r_score=5,
+                r_quality=quality,
+                r_quality_timestamp=b'2018-04-01T12:30:00Z',
+                r_importance=importance,
+                r_importance_timestamp=None,
+                r_page_id=page_id)
+
+
+class RatingIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.ratings = [
+        _rating(0, b'Alpha', b'B-Class', b'Low-Class', page_id=101),
+        _rating(0, b'Beta', b'C-Class', b'Low-Class'),
+        _rating(0, b'Gamma\xc3\xa9', b'B-Class', page_id=4294967295),
+        _rating(14, b'Alpha', importance=b'High-Class'),
+    ]
+    self.index = RatingIndex.from_ratings(b'Project', self.ratings)
+
+  def test_len(self):
+    self.assertEqual(4, len(self.index))
+
+  def test_find(self):
+    self.assertEqual(0, self.index.find(0, b'Alpha'))
+    self.assertEqual(2, self.index.find(0, b'Gamma\xc3\xa9'))
+    self.assertEqual(3, self.index.find(14, b'Alpha'))
+
+  def test_find_missing(self):
+    self.assertIsNone(self.index.find(0, b'Aardvark'))
+    self.assertIsNone(self.index.find(0, b'Delta'))
+    self.assertIsNone(self.index.find(1, b'Alpha'))
+    self.assertIsNone(self.index.find(14, b'Zeta'))
+
+  def test_find_empty(self):
+    self.assertIsNone(RatingIndex(b'Project').find(0, b'Alpha'))
+
+  def test_rating_round_trip(self):
+    for position, rating in enumerate(self.ratings):
+      self.assertEqual(rating, self.index.rating(position))
+
+  def test_ref(self):
+    self.assertEqual(b'14:Alpha', self.index.ref(3))
+
+  def test_value(self):
+    self.assertEqual(b'C-Class', self.index.value(1, AssessmentKind.QUALITY))
+    self.assertEqual(b'Low-Class', self.index.value(1,
+                                                    AssessmentKind.IMPORTANCE))
+    self.assertIsNone(self.index.value(3, AssessmentKind.QUALITY))
+
+  def test_page_id(self):
+    self.assertEqual(101, self.index.page_id(0))
+    self.assertIsNone(self.index.page_id(1))
+
+  def test_set_page_id(self):
+    self.index.set_page_id(1, 202)
+    self.index.set_page_id(0, None)
+
+    self.assertEqual(202, self.index.rating(1).r_page_id)
+    self.assertIsNone(self.index.rating(0).r_page_id)
+
+  def test_value_bad_kind(self):
+    with self.assertRaises(ValueError):
+      self.index.value(0, AssessmentKind.BOTH)
+
+  def test_add_out_of_order(self):
+    with self.assertRaises(ValueError):
+      self.index.add(_rating(0, b'Aardvark'))
+
+  def test_add_duplicate(self):
+    with self.assertRaises(ValueError):
+      self.index.add(_rating(14, b'Alpha'))
+
+  def test_seen(self):
+    self.index.mark_seen(1)
+    self.index.mark_seen(3)
+
+    self.assertTrue(self.index.is_seen(1))
+    self.assertFalse(self.index.is_seen(2))
+    self.assertEqual(2, self.index.count_seen())
+    self.assertEqual([0, 2], list(self.index.unseen()))
+
+  def test_seen_across_bytes(self):
+    index = RatingIndex.from_ratings(
+        b'Project', [_rating(0, b'Article %03d' % i) for i in range(20)])
+    index.mark_seen(17)
+
+    self.assertEqual(1, index.count_seen())
+    self.assertTrue(index.is_seen(17))
+    self.assertEqual(19, len(list(index.unseen())))
+
+
+class NewRatingsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.index = RatingIndex.from_ratings(b'Project', [
+        _rating(0, b'Alpha', b'B-Class', b'Low-Class'),
+        _rating(0, b'Beta', b'C-Class', b'Low-Class'),
+    ])
+    self.rating_to_category = {
+        'B-Class': (b'B-Class_Project_articles', 300),
+        'C-Class': (b'C-Class_Project_articles', 200),
+        'GA-Class': (b'GA-Class_Project_articles', 400),
+    }
+    self.new_ratings = NewRatings(self.index, AssessmentKind.QUALITY,
+                                  self.rating_to_category)
+    self.dt = datetime(2019, 1, 1, 12, 30)
+
+  def test_bad_kind(self):
+    with self.assertRaises(ValueError):
+      NewRatings(self.index, AssessmentKind.BOTH, self.rating_to_category)
+
+  def test_existing_article(self):
+    self.new_ratings.add(0, b'Beta', b'B-Class', self.dt, position=1)
+
+    actual = list(self.new_ratings.ratings())
+    self.assertEqual(1, len(actual))
+    position, rating = actual[0]
+    self.assertEqual(1, position)
+    self.assertEqual(b'B-Class', rating.r_quality)
+    self.assertEqual(b'2019-01-01T12:30:00Z', rating.r_quality_timestamp)
+    self.assertEqual(b'Low-Class', rating.r_importance)
+    self.assertEqual(5, rating.r_score)
+
+  def test_new_article(self):
+    self.new_ratings.add(0, b'Gamma', b'C-Class', self.dt)
+
+    actual = list(self.new_ratings.ratings())
+    self.assertEqual(1, len(actual))
+    position, rating = actual[0]
+    self.assertIsNone(position)
+    self.assertEqual(
+        Rating(r_project=b'Project',
+               r_namespace=0,
+               r_article=b'Gamma',
+               r_score=0,
+               r_quality=b'C-Class',
+               r_quality_timestamp=b'2019-01-01T12:30:00Z'), rating)
+
+  def test_new_article_page_id(self):
+    self.new_ratings.add(0, b'Gamma', b'C-Class', self.dt, page_id=123)
+
+    (position, rating), = self.new_ratings.ratings()
+    self.assertEqual(123, rating.r_page_id)
+
+  def test_highest_ranking_wins(self):
+    self.new_ratings.add(0, b'Alpha', b'C-Class', self.dt, position=0)
+    self.new_ratings.add(0, b'Alpha', b'GA-Class', self.dt, position=0)
+    self.new_ratings.add(0, b'Alpha', b'B-Class', self.dt, position=0)
+    self.new_ratings.add(0, b'Gamma', b'B-Class', self.dt)
+    self.new_ratings.add(0, b'Gamma', b'C-Class', self.dt)
+
+    actual = dict((rating.r_article, rating.r_quality)
+                  for _, rating in self.new_ratings.ratings())
+    self.assertEqual({b'Alpha': b'GA-Class', b'Gamma': b'B-Class'}, actual)
+    self.assertEqual(2, len(self.new_ratings))
+
+  def test_missing_timestamp_keeps_old(self):
+    self.new_ratings.add(0, b'Alpha', b'C-Class', None, position=0)
+
+    _, rating = next(self.new_ratings.ratings())
+    self.assertEqual(b'2018-04-01T12:30:00Z', rating.r_quality_timestamp)
+
+  def test_importance(self):
+    new_ratings = NewRatings(self.index, AssessmentKind.IMPORTANCE,
+                             {'High-Class': (b'High_Project_articles', 300)})
+    new_ratings.add(0, b'Alpha', b'High-Class', self.dt, position=0)
+
+    _, rating = next(new_ratings.ratings())
+    self.assertEqual(b'High-Class', rating.r_importance)
+    self.assertEqual(b'2019-01-01T12:30:00Z', rating.r_importance_timestamp)
+    self.assertEqual(b'B-Class', rating.r_quality)
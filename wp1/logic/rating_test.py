@@ -1,7 +1,10 @@
+import unittest
+
 from wp1.base_db_test import BaseWpOneDbTest
 from wp1.constants import AssessmentKind
 from wp1.logic import rating as logic_rating
 from wp1.models.wp10.log import Log
+from wp1.models.wp10.project import Project
 from wp1.models.wp10.rating import Rating
 
 
@@ -410,3 +413,356 @@ class GetProjectRatingByTypeTest(BaseWpOneDbTest):
       self.assertEqual(b'A-Class', r[0].r_quality)
       self.assertEqual(b'Project 0', r[0].r_project)
       self.assertEqual(b'Project 1', r[1].r_project)
+
+
+def _get_all_ratings(wp10db):
+  with wp10db.cursor() as cursor:
+    cursor.execute('SELECT * FROM ' + Rating.table_name +
+                   ' ORDER BY r_article')  # nosec
+    return [Rating(**db_rating) for db_rating in cursor.fetchall()]
+
+
+class InsertOrUpdateManyTest(BaseWpOneDbTest):
+
+  def _make_ratings(self, quality=b'B-Class', importance=b'Mid-Class'):
+    return [
+        Rating(r_project=b'Test Project',
+               r_namespace=0,
+               r_article=b'Article %s' % str(i).encode('utf-8'),
+               r_quality=quality,
+               r_quality_timestamp=b'2018-04-01T12:30:00Z',
+               r_importance=importance,
+               r_importance_timestamp=b'2018-05-01T13:45:10Z') for i in range(5)
+    ]
+
+  def test_inserts_new(self):
+    ratings = self._make_ratings()
+    count = logic_rating.insert_or_update_many(self.wp10db, ratings,
+                                               AssessmentKind.BOTH)
+    self.assertEqual(5, count)
+    self.assertEqual(ratings, _get_all_ratings(self.wp10db))
+
+  def test_updates_quality_only(self):
+    logic_rating.insert_or_update_many(self.wp10db, self._make_ratings(),
+                                       AssessmentKind.BOTH)
+
+    logic_rating.insert_or_update_many(
+        self.wp10db,
+        self._make_ratings(quality=b'GA-Class', importance=b'Top-Class'),
+        AssessmentKind.QUALITY)
+
+    for rating in _get_all_ratings(self.wp10db):
+      self.assertEqual(b'GA-Class', rating.r_quality)
+      self.assertEqual(b'Mid-Class', rating.r_importance)
+
+  def test_updates_importance_only(self):
+    logic_rating.insert_or_update_many(self.wp10db, self._make_ratings(),
+                                       AssessmentKind.BOTH)
+
+    logic_rating.insert_or_update_many(
+        self.wp10db,
+        self._make_ratings(quality=b'GA-Class', importance=b'Top-Class'),
+        AssessmentKind.IMPORTANCE)
+
+    for rating in _get_all_ratings(self.wp10db):
+      self.assertEqual(b'B-Class', rating.r_quality)
+      self.assertEqual(b'Top-Class', rating.r_importance)
+
+  def test_inserts_page_id(self):
+    ratings = self._make_ratings()
+    for i, rating in enumerate(ratings):
+      rating.r_page_id = 100 + i
+
+    logic_rating.insert_or_update_many(self.wp10db, ratings,
+                                       AssessmentKind.QUALITY)
+
+    self.assertEqual([100, 101, 102, 103, 104],
+                     [r.r_page_id for r in _get_all_ratings(self.wp10db)])
+
+  def test_keeps_page_id_of_existing(self):
+    ratings = self._make_ratings()
+    for rating in ratings:
+      rating.r_page_id = 100
+    logic_rating.insert_or_update_many(self.wp10db, ratings,
+                                       AssessmentKind.BOTH)
+
+    for rating in ratings:
+      rating.r_page_id = 200
+    logic_rating.insert_or_update_many(self.wp10db, ratings,
+                                       AssessmentKind.QUALITY)
+
+    self.assertEqual([100] * 5,
+                     [r.r_page_id for r in _get_all_ratings(self.wp10db)])
+
+  def test_empty(self):
+    count = logic_rating.insert_or_update_many(self.wp10db, [],
+                                               AssessmentKind.QUALITY)
+    self.assertEqual(0, count)
+
+  def test_bad_kind(self):
+    with self.assertRaises(ValueError):
+      logic_rating.insert_or_update_many(self.wp10db, self._make_ratings(),
+                                         'foo')
+
+
+class RatingWriterTest(BaseWpOneDbTest):
+
+  def _make_rating(self, i):
+    return Rating(r_project=b'Test Project',
+                  r_namespace=0,
+                  r_article=b'Article %s' % str(i).encode('utf-8'),
+                  r_quality=b'B-Class',
+                  r_quality_timestamp=b'2018-04-01T12:30:00Z')
+
+  def test_buffers_until_flush(self):
+    writer = logic_rating.RatingWriter(self.wp10db, batch_size=10)
+    for i in range(3):
+      writer.add(self._make_rating(i), AssessmentKind.QUALITY)
+
+    self.assertEqual(0, len(_get_all_ratings(self.wp10db)))
+
+    writer.flush()
+    self.assertEqual(3, len(_get_all_ratings(self.wp10db)))
+    self.assertEqual(3, writer.rows_written)
+
+  def test_writes_full_batches(self):
+    writer = logic_rating.RatingWriter(self.wp10db, batch_size=2)
+    for i in range(5):
+      writer.add(self._make_rating(i), AssessmentKind.QUALITY)
+
+    self.assertEqual(4, len(_get_all_ratings(self.wp10db)))
+
+    writer.flush()
+    self.assertEqual(5, len(_get_all_ratings(self.wp10db)))
+
+  def test_copies_rating_on_add(self):
+    writer = logic_rating.RatingWriter(self.wp10db)
+    rating = self._make_rating(0)
+    writer.add(rating, AssessmentKind.QUALITY)
+    rating.r_quality = b'FA-Class'
+    writer.flush()
+
+    self.assertEqual(b'B-Class', _get_all_ratings(self.wp10db)[0].r_quality)
+
+  def test_bad_kind(self):
+    writer = logic_rating.RatingWriter(self.wp10db)
+    with self.assertRaises(ValueError):
+      writer.add(self._make_rating(0), 'foo')
+
+  def test_new_rating_other_kind_not_a_class(self):
+    writer = logic_rating.RatingWriter(self.wp10db)
+    writer.add(self._make_rating(0), AssessmentKind.QUALITY)
+    writer.flush()
+
+    rating = _get_all_ratings(self.wp10db)[0]
+    self.assertEqual(b'NotA-Class', rating.r_importance)
+    self.assertEqual(b'2018-04-01T12:30:00Z', rating.r_importance_timestamp)
+
+  def test_existing_rating_keeps_other_kind(self):
+    rating = self._make_rating(0)
+    rating.r_importance = b'Top-Class'
+    rating.r_importance_timestamp = b'2018-05-01T13:45:10Z'
+    logic_rating.insert_or_update_many(self.wp10db, [rating],
+                                       AssessmentKind.BOTH)
+
+    writer = logic_rating.RatingWriter(self.wp10db)
+    writer.add(self._make_rating(0), AssessmentKind.QUALITY)
+    writer.flush()
+
+    self.assertEqual(b'Top-Class',
+                     _get_all_ratings(self.wp10db)[0].r_importance)
+
+  def test_delete(self):
+    writer = logic_rating.RatingWriter(self.wp10db)
+    for i in range(3):
+      writer.add(self._make_rating(i), AssessmentKind.QUALITY)
+    writer.flush()
+
+    writer.delete(self._make_rating(1))
+    self.assertEqual(3, len(_get_all_ratings(self.wp10db)))
+
+    writer.flush()
+    self.assertEqual([b'Article 0', b'Article 2'],
+                     sorted(r.r_article for r in _get_all_ratings(self.wp10db)))
+    self.assertEqual(1, writer.rows_deleted)
+
+  def test_delete_after_pending_upsert(self):
+    writer = logic_rating.RatingWriter(self.wp10db)
+    writer.add(self._make_rating(0), AssessmentKind.QUALITY)
+    writer.delete(self._make_rating(0))
+    writer.flush()
+
+    self.assertEqual(0, len(_get_all_ratings(self.wp10db)))
+
+
+class RatingCountsTest(unittest.TestCase):
+
+  def _rating(self, quality=None, importance=None):
+    return Rating(r_project=b'Test Project',
+                  r_namespace=0,
+                  r_article=b'Article',
+                  r_quality=quality,
+                  r_importance=importance)
+
+  def test_new_row_counted_once(self):
+    counts = logic_rating.RatingCounts()
+    rating = self._rating(quality=b'B-Class', importance=b'Top-Class')
+    counts.add(rating, AssessmentKind.QUALITY, None, new_row=True)
+    counts.add(rating, AssessmentKind.IMPORTANCE, None, new_row=True)
+
+    self.assertEqual((1, 1, 1),
+                     (counts.rows, counts.quality, counts.importance))
+
+  def test_unassessed_not_counted(self):
+    counts = logic_rating.RatingCounts()
+    counts.add(self._rating(quality=b'Unassessed-Class'),
+               AssessmentKind.QUALITY,
+               None,
+               new_row=True)
+
+    self.assertEqual((1, 0, 0),
+                     (counts.rows, counts.quality, counts.importance))
+
+  def test_changed_assessment(self):
+    counts = logic_rating.RatingCounts()
+    counts.add(self._rating(quality=b'Unassessed-Class'),
+               AssessmentKind.QUALITY, b'B-Class')
+    counts.add(self._rating(importance=b'Top-Class'), AssessmentKind.IMPORTANCE,
+               b'NotA-Class')
+
+    self.assertEqual((0, -1, 1),
+                     (counts.rows, counts.quality, counts.importance))
+
+  def test_remove(self):
+    counts = logic_rating.RatingCounts()
+    counts.remove(self._rating(quality=b'B-Class', importance=b'NotA-Class'))
+
+    self.assertEqual((-1, -1, 0),
+                     (counts.rows, counts.quality, counts.importance))
+
+  def test_cells_new_row(self):
+    counts = logic_rating.RatingCounts()
+    counts.add(self._rating(quality=b'B-Class'),
+               AssessmentKind.QUALITY,
+               None,
+               new_row=True)
+    counts.add(self._rating(importance=b'Top-Class'),
+               AssessmentKind.IMPORTANCE,
+               None,
+               new_row=True)
+
+    self.assertEqual({(b'Test Project', b'B-Class', b'Top-Class'): 1},
+                     dict((k, v) for k, v in counts.pop_cells().items() if v))
+
+  def test_cells_existing_row(self):
+    counts = logic_rating.RatingCounts()
+    counts.add(self._rating(quality=b'B-Class', importance=b'Low-Class'),
+               AssessmentKind.QUALITY, b'C-Class')
+    # The other kind of the rating is the stored one, the first change is
+    # remembered.
+    counts.add(self._rating(quality=b'C-Class', importance=b'Top-Class'),
+               AssessmentKind.IMPORTANCE, b'Low-Class')
+
+    self.assertEqual(
+        {
+            (b'Test Project', b'C-Class', b'Low-Class'): -1,
+            (b'Test Project', b'B-Class', b'Top-Class'): 1,
+        }, dict((k, v) for k, v in counts.pop_cells().items() if v))
+    self.assertEqual({}, counts.pop_cells())
+
+  def test_cells_remove(self):
+    counts = logic_rating.RatingCounts()
+    counts.remove(self._rating(quality=b'B-Class'))
+
+    self.assertEqual({(b'Test Project', b'B-Class', b'NotA-Class'): -1},
+                     counts.pop_cells())
+
+  def test_apply(self):
+    counts = logic_rating.RatingCounts()
+    counts.add(self._rating(quality=b'B-Class'),
+               AssessmentKind.QUALITY,
+               None,
+               new_row=True)
+    project = Project(p_project=b'Test Project',
+                      p_timestamp=b'20180101000000',
+                      p_count=10,
+                      p_qcount=5,
+                      p_icount=3)
+    counts.apply(project)
+
+    self.assertEqual((11, 6, 3),
+                     (project.p_count, project.p_qcount, project.p_icount))
+
+
+class PageIdWriterTest(BaseWpOneDbTest):
+
+  def test_updates_existing_rating(self):
+    logic_rating.insert_or_update(
+        self.wp10db,
+        Rating(r_project=b'Test Project',
+               r_namespace=0,
+               r_article=b'Article',
+               r_quality=b'B-Class',
+               r_quality_timestamp=b'2018-04-01T12:30:00Z'),
+        AssessmentKind.QUALITY)
+
+    writer = logic_rating.PageIdWriter(self.wp10db)
+    writer.add(b'Test Project', 0, b'Article', 123)
+    writer.flush()
+
+    ratings = _get_all_ratings(self.wp10db)
+    self.assertEqual(1, len(ratings))
+    self.assertEqual(123, ratings[0].r_page_id)
+    self.assertEqual(b'B-Class', ratings[0].r_quality)
+
+  def test_keeps_last_id_per_article(self):
+    logic_rating.insert_or_update_many(self.wp10db, [
+        Rating(r_project=b'Test Project', r_namespace=0, r_article=b'Article')
+    ], AssessmentKind.BOTH)
+
+    writer = logic_rating.PageIdWriter(self.wp10db)
+    writer.add(b'Test Project', 0, b'Article', 123)
+    writer.add(b'Test Project', 0, b'Article', 456)
+    writer.flush()
+
+    ratings = _get_all_ratings(self.wp10db)
+    self.assertEqual([456], [rating.r_page_id for rating in ratings])
+    self.assertEqual(1, writer.rows_written)
+
+  def test_does_not_create_ratings(self):
+    writer = logic_rating.PageIdWriter(self.wp10db)
+    for i in range(3):
+      writer.add(b'Test Project', 0, b'Article %d' % i, i + 1)
+    writer.flush()
+
+    self.assertEqual([], _get_all_ratings(self.wp10db))
+
+
+class IterProjectRatingsTest(BaseWpOneDbTest):
+
+  def setUp(self):
+    super().setUp()
+    self.keys = [(0, b'Alpha'), (0, b'Beta'), (0, b'Delta'), (0, b'Gamma'),
+                 (1, b'Alpha'), (14, b'Alpha'), (14, b'Zeta')]
+    ratings = [
+        Rating(r_project=b'Project', r_namespace=ns, r_article=article)
+        for ns, article in reversed(self.keys)
+    ]
+    ratings.append(
+        Rating(r_project=b'Other Project', r_namespace=0, r_article=b'Beta'))
+    logic_rating.insert_or_update_many(self.wp10db, ratings,
+                                       AssessmentKind.BOTH)
+
+  def test_ordered(self):
+    actual = [
+        (r.r_namespace, r.r_article)
+        for r in logic_rating.iter_project_ratings(self.wp10db, b'Project')
+    ]
+    self.assertEqual(self.keys, actual)
+
+  def test_chunked(self):
+    for chunk_size in (1, 2, 3, 7, 100):
+      actual = [(r.r_namespace, r.r_article)
+                for r in logic_rating.iter_project_ratings(
+                    self.wp10db, b'Project', chunk_size=chunk_size)]
+      self.assertEqual(self.keys, actual)
@@ -0,0 +1,72 @@
+import logging
+import time
+
+from wp1.constants import MAX_ARTICLES_BEFORE_COMMIT, MAX_SECS_BEFORE_COMMIT
+from wp1.logic import global_articles as logic_global_articles, log as logic_log, project_stats as logic_project_stats, rating as logic_rating
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateTransaction:
+  """Groups the writes of a project update into batched commits.
+
+  Callers report each processed article with row_done(). The transaction
+  commits once batch_size articles have been processed or max_secs have passed
+  since the last commit, whichever comes first. Before every commit the
+  buffered rating, page id and log writers are flushed, so nothing that was
+  added is left out of the commit. The changes to the counts of the project
+  are tracked in counts, a RatingCounts, and its changes to project_stats are
+  written along with the ratings.
+
+  The global_articles rows of the changed articles are shared with other
+  projects, so they are only updated after the commit, in short transactions
+  of their own, to keep the ratings of the project from being locked along
+  with them.
+  """
+
+  def __init__(self,
+               wp10db,
+               batch_size=MAX_ARTICLES_BEFORE_COMMIT,
+               max_secs=MAX_SECS_BEFORE_COMMIT,
+               counts=None):
+    self.wp10db = wp10db
+    self.batch_size = batch_size
+    self.max_secs = max_secs
+    self.ratings = logic_rating.RatingWriter(wp10db)
+    self.page_ids = logic_rating.PageIdWriter(wp10db)
+    self.global_articles = logic_global_articles.GlobalArticleWriter(wp10db)
+    self.logs = logic_log.LogWriter(wp10db)
+    # Only its project_stats changes are written by commit(), the other
+    # counts are used once the update is done.
+    self.counts = logic_rating.RatingCounts() if counts is None else counts
+    self.commits = 0
+    self.rows = 0
+    self._rows_since_commit = 0
+    self._last_commit_time = time.monotonic()
+
+  def row_done(self, n=1):
+    self.rows += n
+    self._rows_since_commit += n
+    if (self._rows_since_commit >= self.batch_size or
+        time.monotonic() - self._last_commit_time >= self.max_secs):
+      self.commit()
+
+  def commit(self):
+    self.wp10db.ping()
+    self.ratings.flush()
+    logic_project_stats.update_many(self.wp10db, self.counts.pop_cells())
+    self.page_ids.flush()
+    self.logs.flush()
+    self.wp10db.commit()
+    self.global_articles.flush()
+
+    self.commits += 1
+    self._rows_since_commit = 0
+    self._last_commit_time = time.monotonic()
+
+  def log_stats(self, project_name):
+    logger.info('Processed %s rows for %s in %s commits (batch size %s)',
+                self.rows, project_name.decode('utf-8'), self.commits,
+                self.batch_size)
+    self.ratings.log_stats(project_name)
+    self.global_articles.log_stats(project_name)
@@ -0,0 +1,63 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from wp1.logic import transaction as logic_transaction
+
+
+class UpdateTransactionTest(unittest.TestCase):
+
+  def setUp(self):
+    self.wp10db = MagicMock()
+
+  def test_commits_after_batch_size(self):
+    transaction = logic_transaction.UpdateTransaction(self.wp10db,
+                                                      batch_size=3,
+                                                      max_secs=1000)
+    for _ in range(7):
+      transaction.row_done()
+
+    self.assertEqual(2, self.wp10db.commit.call_count)
+    self.assertEqual(2, transaction.commits)
+    self.assertEqual(7, transaction.rows)
+
+  @patch('wp1.logic.transaction.time.monotonic')
+  def test_commits_after_max_secs(self, patched_monotonic):
+    patched_monotonic.return_value = 100
+    transaction = logic_transaction.UpdateTransaction(self.wp10db,
+                                                      batch_size=1000,
+                                                      max_secs=10)
+    transaction.row_done()
+    self.wp10db.commit.assert_not_called()
+
+    patched_monotonic.return_value = 111
+    transaction.row_done()
+    self.wp10db.commit.assert_called_once()
+
+  def test_counter_resets_after_commit(self):
+    transaction = logic_transaction.UpdateTransaction(self.wp10db,
+                                                      batch_size=2,
+                                                      max_secs=1000)
+    transaction.row_done()
+    transaction.commit()
+    transaction.row_done()
+
+    self.assertEqual(1, self.wp10db.commit.call_count)
+
+  @patch('wp1.logic.transaction.logic_project_stats.update_many')
+  def test_flushes_writers_around_commit(self, patched_update_many):
+    calls = []
+    self.wp10db.commit.side_effect = lambda: calls.append('commit')
+    transaction = logic_transaction.UpdateTransaction(self.wp10db)
+    transaction.ratings.flush = lambda: calls.append('ratings')
+    patched_update_many.side_effect = lambda *args: calls.append('project_stats'
+                                                                )
+    transaction.global_articles.flush = lambda: calls.append('global_articles')
+    transaction.page_ids.flush = lambda: calls.append('page_ids')
+    transaction.logs.flush = lambda: calls.append('logs')
+
+    transaction.commit()
+
+    self.assertEqual([
+        'ratings', 'project_stats', 'page_ids', 'logs', 'commit',
+        'global_articles'
+    ], calls)
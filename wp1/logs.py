@@ -205,8 +205,6 @@ def update_log_page_for_project(project_name):
     log_map = calculate_logs_to_update(wikidb, wp10db, project_name)
     edits = generate_log_edits(wikidb, wp10db, project_name, log_map)
 
-    p = api.get_page(log_page_name(project_name))
-
     header = ('{{Log}}\n'
               '<noinclude>[[Category:%s articles by quality]]</noinclude>\n' %
               project_name.decode('utf-8').replace('_', ' '))
@@ -228,7 +226,8 @@ def update_log_page_for_project(project_name):
                     'large to upload.')
 
     logger.info('Updating logs for %s', project_name)
-    api.save_page(p, update, 'Update logs for past 7 days')
+    api.save_page_if_changed(log_page_name(project_name), update,
+                             'Update logs for past 7 days')
   finally:
     if wikidb:
       wikidb.close()
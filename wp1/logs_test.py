@@ -570,7 +570,10 @@ class LogsTest(BaseCombinedDbTest):
   def test_upload_log_page_for_project(self, patched_api, patched_wp10,
                                        patched_wiki):
     logs.update_log_page_for_project(b'Catholicism')
-    call = patched_api.save_page.call_args[0]
+    call = patched_api.save_page_if_changed.call_args[0]
+    self.assertEqual(
+        'Wikipedia:Version_1.0_Editorial_Team/Catholicism_articles_by_quality_log',
+        call[0])
     self.assertEqual('Update logs for past 7 days', call[2])
 
   @patch('wp1.logs.wiki_connect')
@@ -588,7 +591,7 @@ class LogsTest(BaseCombinedDbTest):
     no_logs_msg = ("'''There were no logs for this project from December 21, "
                    "2018 - December 28, 2018.'''")
     logs.update_log_page_for_project(project_name)
-    call = patched_api.save_page.call_args[0]
+    call = patched_api.save_page_if_changed.call_args[0]
     self.assertEqual(header + no_logs_msg, call[1])
 
   @patch('wp1.logs.wiki_connect')
@@ -605,7 +608,7 @@ class LogsTest(BaseCombinedDbTest):
     text = 'a' * 1000 * 1024
     patched_generate.return_value = [text, text, text]
     logs.update_log_page_for_project(project_name)
-    call = patched_api.save_page.call_args[0]
+    call = patched_api.save_page_if_changed.call_args[0]
     self.assertEqual('%s%s\n%s' % (header, text, text), call[1])
 
   @patch('wp1.logs.wiki_connect')
@@ -624,5 +627,5 @@ class LogsTest(BaseCombinedDbTest):
     text = 'a' * 3000 * 1024
     patched_generate.return_value = [text, text, text]
     logs.update_log_page_for_project(b'Catholicism')
-    call = patched_api.save_page.call_args[0]
+    call = patched_api.save_page_if_changed.call_args[0]
     self.assertEqual(header + sorry_msg, call[1])
@@ -1,26 +1,76 @@
-import datetime
+from datetime import datetime
 
-from sqlalchemy import Column
-from sqlalchemy.dialects.mysql import BIGINT, BINARY, BLOB, INTEGER
+import attr
 
-from wp1.wiki_db import Base
+from wp1.constants import TS_FORMAT_WP10
 
 
-class Log(Base):
-  __tablename__ = 'logging'
+def _unserialize(data, pos):
+  """Decodes the PHP serialized value at data[pos:].
 
-  id = Column('log_id', INTEGER(10, unsigned=True), primary_key=True)
-  namespace = Column('log_namespace', BIGINT(11))
-  type = Column('log_type', BINARY(32))
-  title = Column('log_title', BINARY(255))
-  timestamp = Column('log_timestamp', BINARY(14))
-  params = Column('log_params', BLOB)
+  Only the types that MediaWiki writes to log_params are supported. Returns
+  the value and the position after it.
+  """
+  kind = data[pos:pos + 1]
+  if kind == b'N':
+    return None, pos + 2
+  if kind in (b'i', b'b', b'd'):
+    end = data.index(b';', pos)
+    raw = data[pos + 2:end]
+    if kind == b'i':
+      value = int(raw)
+    elif kind == b'b':
+      value = raw == b'1'
+    else:
+      value = float(raw)
+    return value, end + 1
+  if kind == b's':
+    colon = data.index(b':', pos + 2)
+    length = int(data[pos + 2:colon])
+    start = colon + 2
+    return data[start:start + length], start + length + 2
+  if kind == b'a':
+    colon = data.index(b':', pos + 2)
+    count = int(data[pos + 2:colon])
+    pos = colon + 2
+    value = {}
+    for _ in range(count):
+      key, pos = _unserialize(data, pos)
+      value[key], pos = _unserialize(data, pos)
+    return value, pos + 1
+  raise ValueError('Unsupported serialized type at %s: %r' % (pos, kind))
 
-  def __repr__(self):
-    return "<Log(namespace=%r, title=%r, timestamp=%r, type=%r)>" % (
-        self.namespace, self.title, self.timestamp, self.type)
 
+@attr.s
+class Log:
+  """A row of the wiki logging table.
+
+  Only the fields that are needed to follow page moves are included.
+  """
+  table_name = 'logging'
+
+  log_namespace = attr.ib()
+  log_title = attr.ib()
+  log_timestamp = attr.ib()
+  log_type = attr.ib(default=None)
+  log_params = attr.ib(default=None)
+
+  # The timestamp parsed into a datetime.datetime object.
   @property
   def timestamp_dt(self):
-    return datetime.strptime(self.quality_timestamp.decode('utf-8'),
-                             '%Y%m%dT%H%M%S')
+    return datetime.strptime(self.log_timestamp.decode('utf-8'), TS_FORMAT_WP10)
+
+  @property
+  def move_target(self):
+    """The full title, with namespace prefix, that a move entry moved to.
+
+    Current entries store a PHP serialized array in log_params, while older
+    ones store the target on the first line. None if there is no target.
+    """
+    if not self.log_params:
+      return None
+
+    if self.log_params.startswith(b'a:'):
+      params, _ = _unserialize(self.log_params, 0)
+      return params.get(b'4::target') or None
+    return self.log_params.split(b'\n', 1)[0] or None
@@ -0,0 +1,36 @@
+from datetime import datetime
+import unittest
+
+from wp1.models.wiki.log import Log
+
+
+class ModelsWikiLogTest(unittest.TestCase):
+
+  def _log(self, log_params):
+    return Log(log_namespace=0,
+               log_title=b'Moved_Article',
+               log_timestamp=b'20110428123000',
+               log_type=b'move',
+               log_params=log_params)
+
+  def test_timestamp_dt(self):
+    self.assertEqual(datetime(2011, 4, 28, 12, 30),
+                     self._log(None).timestamp_dt)
+
+  def test_move_target_serialized(self):
+    log = self._log(b'a:2:{s:9:"4::target";s:19:"Talk:Caf\xc3\xa9 moved to";'
+                    b's:10:"5::noredir";s:1:"0";}')
+    self.assertEqual(b'Talk:Caf\xc3\xa9 moved to', log.move_target)
+
+  def test_move_target_serialized_other_types(self):
+    log = self._log(b'a:3:{s:10:"5::noredir";b:1;i:7;N;'
+                    b's:9:"4::target";s:8:"Moved to";}')
+    self.assertEqual(b'Moved to', log.move_target)
+
+  def test_move_target_legacy(self):
+    self.assertEqual(b'Moved to', self._log(b'Moved to\n1').move_target)
+
+  def test_move_target_missing(self):
+    self.assertIsNone(self._log(b'').move_target)
+    self.assertIsNone(
+        self._log(b'a:1:{s:10:"5::noredir";s:1:"0";}').move_target)
@@ -22,6 +22,7 @@ class Page:
   page_title = attr.ib()
   cl_sortkey = attr.ib(default=None)
   cl_timestamp = attr.ib(default=None)
+  cl_to = attr.ib(default=None)
 
   @property
   def base_title(self):
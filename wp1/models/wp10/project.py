@@ -19,6 +19,8 @@ class Project:
   p_icount = attr.ib(default=None)
   p_upload_timestamp = attr.ib(default=None)
   p_scope = attr.ib(default=0)
+  p_fingerprint = attr.ib(default=None)
+  p_full_timestamp = attr.ib(default=None)
 
   @property
   def timestamp_dt(self):
@@ -27,6 +29,14 @@ class Project:
       return datetime(1970, 1, 1)
     return datetime.strptime(self.p_timestamp.decode('utf-8'), TS_FORMAT_WP10)
 
+  @property
+  def full_timestamp_dt(self):
+    '''The time of the last full update, or None if there was none.'''
+    if self.p_full_timestamp is None:
+      return None
+    return datetime.strptime(self.p_full_timestamp.decode('utf-8'),
+                             TS_FORMAT_WP10)
+
   def to_web_dict(self):
     return {
         'name': self.p_project.decode('utf-8').replace('_', ' '),
@@ -22,6 +22,9 @@ class Rating:
   r_quality_timestamp = attr.ib(default=None)
   r_importance = attr.ib(default=None)
   r_importance_timestamp = attr.ib(default=None)
+  # The page_id of the talk page of the article, None for ratings that were
+  # written before it was recorded.
+  r_page_id = attr.ib(default=None)
 
   # The timestamp parsed into a datetime.datetime object.
   @property
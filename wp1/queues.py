@@ -1,9 +1,11 @@
 from datetime import timedelta
+import hashlib
 import logging
 
 from rq import Queue
 import rq.exceptions
 from rq.job import Job
+from rq.registry import DeferredJobRegistry
 
 from wp1 import constants
 from wp1.environment import Environment
@@ -38,22 +40,30 @@ def _get_materializer_queue(redis):
 
 
 def enqueue_all_projects(redis):
-  update_q, upload_q = _get_queues(redis)
+  """Enqueues the update of every project that isn't already in flight.
 
-  if (update_q.count > 0 or upload_q.count > 0):
-    logger.error('Queues are not empty. Refusing to add more work.')
-    return
+  Projects whose update from a previous run is still queued or running are
+  skipped, so a run that didn't finish delays its projects, not the others.
+  """
+  update_q, upload_q = _get_queues(redis)
 
   wikidb = wiki_connect()
-  for project_name in logic_project.project_names_to_update(wikidb):
-    enqueue_project(project_name, update_q, upload_q)
+  enqueue_multiple_projects(redis,
+                            logic_project.project_names_to_update(wikidb),
+                            queues=(update_q, upload_q))
 
 
-def enqueue_multiple_projects(redis, project_names):
-  update_q, upload_q = _get_queues(redis)
+def enqueue_multiple_projects(redis, project_names, queues=None):
+  update_q, upload_q = queues or _get_queues(redis)
 
+  enqueued = skipped = 0
   for project_name in project_names:
-    enqueue_project(project_name, update_q, upload_q)
+    if enqueue_project(project_name, update_q, upload_q, redis=redis) is None:
+      skipped += 1
+    else:
+      enqueued += 1
+  logger.info('Enqueued %s projects, skipped %s that were in flight', enqueued,
+              skipped)
 
 
 def enqueue_single_project(redis, project_name, manual=False):
@@ -62,11 +72,60 @@ def enqueue_single_project(redis, project_name, manual=False):
   if manual:
     logic_project.clear_project_progress(redis, project_name)
 
-  enqueue_project(project_name,
-                  update_q,
-                  upload_q,
-                  redis=redis,
-                  track_progress=manual)
+  job = enqueue_project(project_name,
+                        update_q,
+                        upload_q,
+                        redis=redis,
+                        track_progress=manual)
+  if job is None and manual:
+    _attach_manual_update(redis, project_name, update_q, upload_q)
+
+
+def _attach_manual_update(redis, project_name, manual_update_q,
+                          manual_upload_q):
+  """Serves a manual update with the in-flight update job of a project.
+
+  A job that is still queued is tracked as the project's update job. If it is
+  waiting in the nightly queue, it is moved to the manual queue and made to
+  track its progress, like the jobs of manual updates, and its uploads are
+  moved to the manual upload queue, so that they don't wait behind the
+  nightly uploads once it is done. A job that already
+  tracks its progress is tracked as is. A running job that doesn't track
+  its progress can't report it, so a manual update is enqueued once it ends,
+  see logic_project.request_manual_follow_up. Until then, the running job is
+  reported as the project's update job.
+  """
+  job = _get_in_flight_job(redis, project_name)
+  if job is None:
+    return
+
+  set_project_update_job_id(redis, project_name, job.id)
+  if job.get_status() == 'queued':
+    logger.info('Attaching manual update of %s to job %s', project_name, job.id)
+    if job.origin != manual_update_q.name:
+      Queue(job.origin, connection=redis).remove(job)
+      job.kwargs = dict(job.kwargs, track_progress=True)
+      manual_update_q.enqueue_job(job)
+      _move_dependents(redis, job, manual_upload_q)
+  elif not job.kwargs.get('track_progress'):
+    logger.info('Job %s of %s is running, enqueuing manual update after it',
+                job.id, project_name)
+    logic_project.request_manual_follow_up(redis, project_name)
+
+
+def _move_dependents(redis, job, queue):
+  """Makes the jobs that wait for job be enqueued to queue when it's done."""
+  for dependent_id in job.dependent_ids:
+    try:
+      dependent = Job.fetch(dependent_id, connection=redis)
+    except rq.exceptions.NoSuchJobError:
+      continue
+    if dependent.get_status() != 'deferred' or dependent.origin == queue.name:
+      continue
+    DeferredJobRegistry(dependent.origin, connection=redis).remove(dependent)
+    dependent.origin = queue.name
+    dependent.save()
+    DeferredJobRegistry(queue.name, connection=redis).add(dependent)
 
 
 def _manual_key(project_name):
@@ -113,6 +172,60 @@ def get_project_queue_status(redis, project_name):
   return {'status': status}
 
 
+def _cycle(manual=False):
+  """Returns the name of the current update cycle.
+
+  Projects are updated at most once per hour: the scheduler waits much longer
+  between updates, and at least an hour after a failed one, and manual updates
+  are limited to one per hour, see mark_project_manual_update_time. So the
+  jobs of a cycle, failed ones included, are not replaced within it.
+  """
+  if manual:
+    return utcnow().strftime('manual-%Y%m%d%H')
+  return utcnow().strftime('%Y%m%d%H')
+
+
+def _job_id(kind, project_name, cycle):
+  """Returns the deterministic ID of a job of a project in a cycle.
+
+  Project names are hashed, since job IDs can only contain letters, digits,
+  dashes and underscores.
+  """
+  return '%s-%s-%s' % (kind, cycle, hashlib.sha1(project_name).hexdigest())
+
+
+def _get_in_flight_job(redis, project_name):
+  """Returns the queued or running update job of a project, if any."""
+  key = _update_job_status_key(project_name)
+  job_id = redis.hget(key, 'job_id')
+  if job_id is None:
+    return None
+
+  try:
+    job = Job.fetch(job_id.decode('utf-8'), connection=redis)
+  except rq.exceptions.NoSuchJobError:
+    return None
+  if job.get_status() not in ('queued', 'started', 'deferred'):
+    return None
+  return job
+
+
+def _claim_project(redis, project_name):
+  """Marks the project in flight, unless its update job is in flight.
+
+  Returns True if the caller should enqueue an update of the project. A
+  project stays in flight after its job was lost, for example when its
+  worker was killed, so that is checked too.
+  """
+  if logic_project.mark_project_in_flight(redis, project_name):
+    return True
+  if _get_in_flight_job(redis, project_name) is not None:
+    return False
+  logger.warning('Update job of in-flight project %s is gone, re-enqueuing',
+                 project_name)
+  return True
+
+
 def set_project_update_job_id(redis, project_name, job_id):
   if redis is None:
     logger.error(
@@ -128,10 +241,27 @@ def enqueue_project(project_name,
                     upload_q,
                     redis=None,
                     track_progress=False):
+  """Enqueues the update of a project, and the uploads that depend on it.
+
+  With redis, this is idempotent: the project is skipped if its update is
+  already in flight, and the jobs get IDs that are deterministic for the
+  project and the current cycle. Returns the update job, or None if the
+  project was skipped.
+  """
+  job_ids = {}
+  if redis is not None:
+    if not _claim_project(redis, project_name):
+      logger.info('Skipping update %s, already in flight', project_name)
+      return None
+    cycle = _cycle(manual=track_progress)
+    job_ids = dict((kind, _job_id(kind, project_name, cycle))
+                   for kind in ('update', 'upload-table', 'upload-logs'))
+
   logger.info('Enqueuing update %s', project_name)
   update_job = update_q.enqueue(logic_project.update_project_by_name,
                                 project_name,
                                 track_progress=track_progress,
+                                job_id=job_ids.get('update'),
                                 job_timeout=constants.JOB_TIMEOUT,
                                 failure_ttl=constants.JOB_FAILURE_TTL)
   set_project_update_job_id(redis, project_name, update_job.id)
@@ -140,17 +270,20 @@ def enqueue_project(project_name,
     upload_q.enqueue(tables.upload_project_table,
                      project_name,
                      depends_on=update_job,
+                     job_id=job_ids.get('upload-table'),
                      job_timeout=constants.JOB_TIMEOUT,
                      failure_ttl=constants.JOB_FAILURE_TTL)
     logger.info('Enqueuing log upload (dependent) %s', project_name)
     upload_q.enqueue(logs.update_log_page_for_project,
                      project_name,
                      depends_on=update_job,
+                     job_id=job_ids.get('upload-logs'),
                      job_timeout=constants.JOB_TIMEOUT,
                      failure_ttl=constants.JOB_FAILURE_TTL)
   else:
     logger.warning('Skipping enqueuing the upload job because environment is '
                    'not PRODUCTION')
+  return update_job
 
 
 def enqueue_materialize(redis, builder_cls, builder_id, content_type):
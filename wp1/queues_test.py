@@ -1,10 +1,16 @@
+from datetime import datetime
+import hashlib
 import unittest
 from unittest.mock import patch, MagicMock
 
+from rq.job import Job
+from rq.registry import DeferredJobRegistry
+
 from wp1.base_redis_test import BaseRedisTest
 from wp1 import constants
 from wp1.environment import Environment
 from wp1 import queues
+from wp1.logic import project as logic_project
 from wp1.selection.models.simple_builder import SimpleBuilder
 
 
@@ -21,6 +27,7 @@ class QueuesTest(BaseRedisTest):
     update_q.enqueue.assert_called_once_with(
         patched_project_fn,
         b'Water',
+        job_id=None,
         job_timeout=constants.JOB_TIMEOUT,
         failure_ttl=constants.JOB_FAILURE_TTL,
         track_progress=False)
@@ -44,17 +51,20 @@ class QueuesTest(BaseRedisTest):
     update_q.enqueue.assert_called_once_with(
         patched_project_fn,
         project_name,
+        job_id=None,
         job_timeout=constants.JOB_TIMEOUT,
         failure_ttl=constants.JOB_FAILURE_TTL,
         track_progress=False)
     upload_q.enqueue.assert_any_call(patched_tables_fn,
                                      project_name,
                                      depends_on=update_job,
+                                     job_id=None,
                                      job_timeout=constants.JOB_TIMEOUT,
                                      failure_ttl=constants.JOB_FAILURE_TTL)
     upload_q.enqueue.assert_any_call(patched_log_fn,
                                      project_name,
                                      depends_on=update_job,
+                                     job_id=None,
                                      job_timeout=constants.JOB_TIMEOUT,
                                      failure_ttl=constants.JOB_FAILURE_TTL)
 
@@ -88,7 +98,10 @@ class QueuesTest(BaseRedisTest):
     queues.enqueue_multiple_projects(self.redis, projects)
 
     for project_name in projects:
-      patched_enqueue_project.assert_any_call(project_name, update_q, upload_q)
+      patched_enqueue_project.assert_any_call(project_name,
+                                              update_q,
+                                              upload_q,
+                                              redis=self.redis)
 
   @patch('wp1.queues.ENV', Environment.DEVELOPMENT)
   @patch('wp1.queues.logic_project.project_names_to_update')
@@ -102,15 +115,187 @@ class QueuesTest(BaseRedisTest):
 
     update_q = MagicMock()
     upload_q = MagicMock()
-    update_q.count = 0
-    upload_q.count = 0
+    update_q.count = 10
+    upload_q.count = 20
 
     patched_queue.side_effect = lambda name, connection=None: update_q if name == 'update' else upload_q
 
     queues.enqueue_all_projects(self.redis)
 
     for project_name in projects:
-      patched_enqueue_project.assert_any_call(project_name, update_q, upload_q)
+      patched_enqueue_project.assert_any_call(project_name,
+                                              update_q,
+                                              upload_q,
+                                              redis=self.redis)
+
+  @patch('wp1.queues.ENV', Environment.PRODUCTION)
+  @patch('wp1.queues.utcnow', return_value=datetime(2018, 12, 25, 5, 55, 55))
+  def test_enqueue_project_job_ids(self, patched_now):
+    update_q, upload_q = queues._get_queues(self.redis)
+
+    update_job = queues.enqueue_project(b'Water',
+                                        update_q,
+                                        upload_q,
+                                        redis=self.redis)
+
+    digest = hashlib.sha1(b'Water').hexdigest()
+    self.assertEqual('update-2018122505-%s' % digest, update_job.id)
+    self.assertEqual(
+        sorted([
+            'upload-table-2018122505-%s' % digest,
+            'upload-logs-2018122505-%s' % digest
+        ]), sorted(upload_q.deferred_job_registry.get_job_ids()))
+    self.assertTrue(
+        self.redis.sismember(logic_project.PROJECTS_IN_FLIGHT_KEY, b'Water'))
+
+  @patch('wp1.queues.ENV', Environment.DEVELOPMENT)
+  def test_enqueue_project_skips_in_flight(self):
+    update_q, upload_q = queues._get_queues(self.redis)
+
+    first = queues.enqueue_project(b'Water',
+                                   update_q,
+                                   upload_q,
+                                   redis=self.redis)
+    second = queues.enqueue_project(b'Water',
+                                    update_q,
+                                    upload_q,
+                                    redis=self.redis)
+
+    self.assertIsNotNone(first)
+    self.assertIsNone(second)
+    self.assertEqual(1, update_q.count)
+
+  @patch('wp1.queues.ENV', Environment.DEVELOPMENT)
+  def test_enqueue_project_after_job_ended(self):
+    update_q, upload_q = queues._get_queues(self.redis)
+
+    queues.enqueue_project(b'Water', update_q, upload_q, redis=self.redis)
+    logic_project.clear_project_in_flight(self.redis, b'Water')
+    update_q.empty()
+    actual = queues.enqueue_project(b'Water',
+                                    update_q,
+                                    upload_q,
+                                    redis=self.redis)
+
+    self.assertIsNotNone(actual)
+    self.assertEqual(1, update_q.count)
+
+  @patch('wp1.queues.ENV', Environment.DEVELOPMENT)
+  def test_enqueue_project_lost_job(self):
+    update_q, upload_q = queues._get_queues(self.redis)
+    logic_project.mark_project_in_flight(self.redis, b'Water')
+
+    actual = queues.enqueue_project(b'Water',
+                                    update_q,
+                                    upload_q,
+                                    redis=self.redis)
+
+    self.assertIsNotNone(actual)
+    self.assertEqual(1, update_q.count)
+
+  @patch('wp1.queues.ENV', Environment.DEVELOPMENT)
+  def test_enqueue_multiple_projects_only_missing(self):
+    update_q, upload_q = queues._get_queues(self.redis)
+    queues.enqueue_project(b'Air', update_q, upload_q, redis=self.redis)
+
+    queues.enqueue_multiple_projects(self.redis, (b'Water', b'Air', b'Fire'))
+
+    self.assertEqual(3, update_q.count)
+
+  @patch('wp1.queues.ENV', Environment.DEVELOPMENT)
+  def test_enqueue_single_project_manual_attaches(self):
+    update_q, upload_q = queues._get_queues(self.redis)
+    manual_update_q, _ = queues._get_queues(self.redis, manual=True)
+    nightly_job = queues.enqueue_project(b'Water',
+                                         update_q,
+                                         upload_q,
+                                         redis=self.redis)
+
+    queues.enqueue_single_project(self.redis, b'Water', manual=True)
+
+    self.assertEqual(0, update_q.count)
+    self.assertEqual([nightly_job.id], manual_update_q.get_job_ids())
+    job = Job.fetch(nightly_job.id, connection=self.redis)
+    self.assertTrue(job.kwargs['track_progress'])
+    self.assertEqual(
+        nightly_job.id.encode('utf-8'),
+        self.redis.hget(queues._update_job_status_key(b'Water'), 'job_id'))
+
+  @patch('wp1.queues.ENV', Environment.PRODUCTION)
+  def test_enqueue_single_project_manual_moves_uploads(self):
+    update_q, upload_q = queues._get_queues(self.redis)
+    manual_update_q, manual_upload_q = queues._get_queues(self.redis,
+                                                          manual=True)
+    nightly_job = queues.enqueue_project(b'Water',
+                                         update_q,
+                                         upload_q,
+                                         redis=self.redis)
+
+    queues.enqueue_single_project(self.redis, b'Water', manual=True)
+
+    dependent_ids = nightly_job.dependent_ids
+    self.assertEqual(2, len(dependent_ids))
+    for dependent_id in dependent_ids:
+      dependent = Job.fetch(dependent_id, connection=self.redis)
+      self.assertEqual('manual-upload', dependent.origin)
+    self.assertEqual(
+        sorted(dependent_ids),
+        sorted(
+            DeferredJobRegistry('manual-upload',
+                                connection=self.redis).get_job_ids()))
+    self.assertEqual([],
+                     DeferredJobRegistry('upload',
+                                         connection=self.redis).get_job_ids())
+
+    job = Job.fetch(nightly_job.id, connection=self.redis)
+    job.set_status('finished')
+    manual_update_q.enqueue_dependents(job)
+
+    self.assertEqual(0, upload_q.count)
+    self.assertEqual(sorted(dependent_ids),
+                     sorted(manual_upload_q.get_job_ids()))
+
+  def test_enqueue_single_project_manual_while_running(self):
+    update_q, upload_q = queues._get_queues(self.redis)
+    manual_update_q, _ = queues._get_queues(self.redis, manual=True)
+    nightly_job = queues.enqueue_project(b'Water',
+                                         update_q,
+                                         upload_q,
+                                         redis=self.redis)
+    nightly_job.set_status('started')
+
+    queues.enqueue_single_project(self.redis, b'Water', manual=True)
+
+    self.assertEqual(0, manual_update_q.count)
+    job = Job.fetch(nightly_job.id, connection=self.redis)
+    self.assertFalse(job.kwargs['track_progress'])
+    self.assertTrue(logic_project.pop_manual_follow_up(self.redis, b'Water'))
+
+  @patch('wp1.queues.ENV', Environment.DEVELOPMENT)
+  def test_enqueue_single_project_manual_while_manual_running(self):
+    manual_update_q, _ = queues._get_queues(self.redis, manual=True)
+    queues.enqueue_single_project(self.redis, b'Water', manual=True)
+    manual_job = Job.fetch(manual_update_q.get_job_ids()[0],
+                           connection=self.redis)
+    manual_update_q.remove(manual_job)
+    manual_job.set_status('started')
+
+    queues.enqueue_single_project(self.redis, b'Water', manual=True)
+
+    self.assertEqual(0, manual_update_q.count)
+    self.assertFalse(logic_project.pop_manual_follow_up(self.redis, b'Water'))
+    self.assertEqual(
+        manual_job.id.encode('utf-8'),
+        self.redis.hget(queues._update_job_status_key(b'Water'), 'job_id'))
+
+  @patch('wp1.queues.ENV', Environment.DEVELOPMENT)
+  def test_enqueue_single_project_manual_twice(self):
+    manual_update_q, _ = queues._get_queues(self.redis, manual=True)
+
+    queues.enqueue_single_project(self.redis, b'Water', manual=True)
+    queues.enqueue_single_project(self.redis, b'Water', manual=True)
+
+    self.assertEqual(1, manual_update_q.count)
 
   def test_next_update_time_empty(self):
     actual = queues.next_update_time(self.redis, b'Some_Project')
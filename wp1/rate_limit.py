@@ -0,0 +1,88 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Refills the bucket in KEYS[1] for the time since it was last used, at
+# ARGV[1] tokens per second up to ARGV[2] tokens, then takes ARGV[4] tokens
+# from it at time ARGV[3]. Returns 0 if they were taken, otherwise the number
+# of seconds until there are enough of them, as a string because Lua numbers
+# are truncated to integers in replies.
+_TAKE_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+  tokens = burst
+  ts = now
+end
+if now > ts then
+  tokens = math.min(burst, tokens + (now - ts) * rate)
+  ts = now
+end
+
+local wait = 0
+if tokens >= requested then
+  tokens = tokens - requested
+else
+  wait = (requested - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(ts))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+'''
+
+
+class TokenBucket:
+  """A token bucket in Redis, shared by every process that uses its name.
+
+  The bucket holds up to burst tokens and is refilled at rate tokens per
+  second. It is updated by a single Lua script, so concurrent processes never
+  take the same tokens. The time is the one of the calling process, so the
+  processes that share a bucket must have synchronized clocks.
+  """
+
+  def __init__(self, redis, name, rate, burst):
+    if rate <= 0 or burst < 1:
+      raise ValueError('Invalid rate (%s) or burst (%s) for bucket %s' %
+                       (rate, burst, name))
+    self.redis = redis
+    self.key = 'rate_limit:%s' % name
+    self.rate = rate
+    self.burst = burst
+    self._take = redis.register_script(_TAKE_SCRIPT)
+
+  def try_acquire(self, tokens=1):
+    """Takes tokens if there are enough of them.
+
+    Returns 0 if they were taken, otherwise the number of seconds to wait
+    until there should be enough of them.
+    """
+    return float(
+        self._take(keys=[self.key],
+                   args=[self.rate, self.burst,
+                         time.time(), tokens]))
+
+  def acquire(self, tokens=1):
+    """Waits until tokens can be taken, then takes them.
+
+    Returns the number of seconds that were waited.
+    """
+    if tokens > self.burst:
+      raise ValueError('Cannot take %s tokens from %s, it only holds %s' %
+                       (tokens, self.key, self.burst))
+
+    waited = 0.0
+    while True:
+      wait = self.try_acquire(tokens)
+      if wait <= 0:
+        if waited > 0:
+          logger.debug('Waited %.2fs for %s', waited, self.key)
+        return waited
+      time.sleep(wait)
+      waited += wait
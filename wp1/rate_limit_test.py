@@ -0,0 +1,80 @@
+from unittest.mock import patch
+
+from wp1.base_redis_test import BaseRedisTest
+from wp1.rate_limit import TokenBucket
+
+
+@patch('wp1.rate_limit.time.time')
+class TokenBucketTest(BaseRedisTest):
+
+  def setUp(self):
+    super().setUp()
+    self.bucket = TokenBucket(self.redis, 'test', rate=2, burst=3)
+
+  def test_starts_full(self, patched_time):
+    patched_time.return_value = 1000
+    for _ in range(3):
+      self.assertEqual(0, self.bucket.try_acquire())
+    self.assertEqual(0.5, self.bucket.try_acquire())
+
+  def test_refills(self, patched_time):
+    patched_time.return_value = 1000
+    for _ in range(3):
+      self.bucket.try_acquire()
+
+    patched_time.return_value = 1001
+    self.assertEqual(0, self.bucket.try_acquire())
+    self.assertEqual(0, self.bucket.try_acquire())
+    self.assertEqual(0.5, self.bucket.try_acquire())
+
+  def test_refills_up_to_burst(self, patched_time):
+    patched_time.return_value = 1000
+    self.bucket.try_acquire()
+
+    patched_time.return_value = 2000
+    self.assertEqual(0, self.bucket.try_acquire(3))
+    self.assertEqual(0.5, self.bucket.try_acquire())
+
+  def test_shared_by_name(self, patched_time):
+    patched_time.return_value = 1000
+    other = TokenBucket(self.redis, 'test', rate=2, burst=3)
+    self.bucket.try_acquire(2)
+
+    self.assertEqual(0, other.try_acquire())
+    self.assertEqual(0.5, self.bucket.try_acquire())
+
+  def test_other_name(self, patched_time):
+    patched_time.return_value = 1000
+    other = TokenBucket(self.redis, 'other', rate=2, burst=3)
+    self.bucket.try_acquire(3)
+
+    self.assertEqual(0, other.try_acquire())
+
+  def test_expires(self, patched_time):
+    patched_time.return_value = 1000
+    self.bucket.try_acquire()
+
+    ttl = self.redis.pttl('rate_limit:test')
+    self.assertTrue(0 < ttl <= 2500)
+
+  @patch('wp1.rate_limit.time.sleep')
+  def test_acquire_waits(self, patched_sleep, patched_time):
+    patched_time.return_value = 1000
+    self.bucket.acquire(3)
+
+    def fake_sleep(secs):
+      patched_time.return_value += secs
+
+    patched_sleep.side_effect = fake_sleep
+    waited = self.bucket.acquire()
+
+    self.assertEqual(0.5, waited)
+    patched_sleep.assert_called_once_with(0.5)
+
+  def test_acquire_more_than_burst(self, patched_time):
+    with self.assertRaises(ValueError):
+      self.bucket.acquire(4)
+
+  def test_invalid_rate(self, patched_time):
+    with self.assertRaises(ValueError):
+      TokenBucket(self.redis, 'test', rate=0, burst=1)
@@ -0,0 +1,163 @@
+import logging
+import time
+
+from wp1 import queues
+from wp1.constants import (SCHEDULER_INTERVAL_SECS, SCHEDULER_MAX_MEGA_PROJECTS,
+                           SCHEDULER_MAX_OVERDUE_SECS,
+                           SCHEDULER_MEGA_PROJECT_ARTICLES,
+                           SCHEDULER_MEGA_PROJECT_SECS,
+                           SCHEDULER_MIN_ESTIMATE_SECS,
+                           SCHEDULER_MIN_STALENESS_SECS, SCHEDULER_QUEUE_TARGET,
+                           SCHEDULER_REFRESH_SECS, SCHEDULER_SECS_PER_ARTICLE)
+import wp1.logic.project as logic_project
+from wp1.models.wp10.project import Project
+from wp1.timestamp import utcnow
+from wp1.wiki_db import connect as wiki_connect
+from wp1.wp10_db import connect as wp10_connect
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_secs(project, durations):
+  """Returns the number of seconds that an update of the project should take.
+
+  That is the average of its past updates, or an estimate from its number of
+  articles if it has none.
+  """
+  secs = durations.get(project.p_project)
+  if secs is None:
+    secs = (project.p_count or 0) * SCHEDULER_SECS_PER_ARTICLE
+  return max(secs, SCHEDULER_MIN_ESTIMATE_SECS)
+
+
+def is_mega_project(project, durations):
+  return ((project.p_count or 0) >= SCHEDULER_MEGA_PROJECT_ARTICLES or
+          estimate_secs(project, durations) >= SCHEDULER_MEGA_PROJECT_SECS)
+
+
+def staleness_secs(project, now):
+  return (now - project.timestamp_dt).total_seconds()
+
+
+def rank_projects(projects, durations, now):
+  """Returns the projects that are due for an update, most urgent first.
+
+  Projects are due once their last update is SCHEDULER_MIN_STALENESS_SECS
+  old. They are ordered by their staleness per second of update, so that
+  small projects don't wait behind large ones, except that projects overdue
+  by more than SCHEDULER_MAX_OVERDUE_SECS go first, stalest first, so that
+  large projects are not starved.
+  """
+  due = []
+  for project in projects:
+    staleness = staleness_secs(project, now)
+    if staleness < SCHEDULER_MIN_STALENESS_SECS:
+      continue
+    overdue = staleness - SCHEDULER_MIN_STALENESS_SECS
+    if overdue > SCHEDULER_MAX_OVERDUE_SECS:
+      key = (0, -staleness)
+    else:
+      key = (1, -staleness / estimate_secs(project, durations))
+    due.append((key, project))
+  due.sort(key=lambda item: item[0])
+  return [project for _, project in due]
+
+
+def get_projects(wp10db, project_names):
+  """Returns the Project of each of the names, from the projects table.
+
+  Projects that were never updated get a Project without a timestamp, which
+  makes them the stalest.
+  """
+  by_name = dict((project.p_project, project)
+                 for project in logic_project.list_all_projects(wp10db))
+  return [
+      by_name.get(project_name, Project(p_project=project_name,
+                                        p_timestamp=None))
+      for project_name in project_names
+  ]
+
+
+def freshness_percentile(projects, now, percentile):
+  """Returns the staleness, in seconds, that percentile% of projects are under.
+  """
+  if not projects:
+    return 0
+  stalenesses = sorted(staleness_secs(project, now) for project in projects)
+  index = min(len(stalenesses) - 1, int(len(stalenesses) * percentile / 100.0))
+  return stalenesses[index]
+
+
+def schedule(redis, wp10db, project_names, update_q, upload_q, now=None):
+  """Tops the update queue up with the most urgent projects.
+
+  Adds up to SCHEDULER_QUEUE_TARGET minus the number of jobs already waiting,
+  skipping projects that are in flight, projects whose last update failed
+  until their backoff ends, see logic_project.record_update_failure, and mega
+  projects once SCHEDULER_MAX_MEGA_PROJECTS of them are in flight. Returns
+  the names of the projects that were enqueued.
+  """
+  if now is None:
+    now = utcnow()
+  free = SCHEDULER_QUEUE_TARGET - update_q.count
+  if free <= 0:
+    return []
+
+  projects = get_projects(wp10db, project_names)
+  durations = logic_project.get_update_durations(redis)
+  in_flight = redis.smembers(logic_project.PROJECTS_IN_FLIGHT_KEY)
+  backoffs = logic_project.get_update_backoffs(redis)
+  megas_in_flight = sum(
+      1 for project in projects
+      if project.p_project in in_flight and is_mega_project(project, durations))
+
+  enqueued = []
+  for project in rank_projects(projects, durations, now):
+    if len(enqueued) >= free:
+      break
+    if project.p_project in in_flight:
+      continue
+    backoff_until = backoffs.get(project.p_project)
+    if backoff_until is not None and backoff_until > now:
+      continue
+    mega = is_mega_project(project, durations)
+    if mega and megas_in_flight >= SCHEDULER_MAX_MEGA_PROJECTS:
+      continue
+    if queues.enqueue_project(
+        project.p_project, update_q, upload_q, redis=redis) is None:
+      continue
+    if mega:
+      megas_in_flight += 1
+    enqueued.append(project.p_project)
+
+  if enqueued:
+    logger.info(
+        'Enqueued %s projects, %s mega projects in flight, staleness p50 '
+        '%.1fh p95 %.1fh', len(enqueued), megas_in_flight,
+        freshness_percentile(projects, now, 50) / 3600,
+        freshness_percentile(projects, now, 95) / 3600)
+  return enqueued
+
+
+def run(redis):
+  """Schedules project updates continuously, until interrupted."""
+  update_q, upload_q = queues._get_queues(redis)
+  project_names = []
+  refreshed_at = None
+  while True:
+    if refreshed_at is None or (time.monotonic() - refreshed_at >
+                                SCHEDULER_REFRESH_SECS):
+      wikidb = wiki_connect()
+      try:
+        project_names = list(logic_project.project_names_to_update(wikidb))
+      finally:
+        wikidb.close()
+      refreshed_at = time.monotonic()
+      logger.info('Read %s projects to schedule', len(project_names))
+
+    wp10db = wp10_connect()
+    try:
+      schedule(redis, wp10db, project_names, update_q, upload_q)
+    finally:
+      wp10db.close()
+    time.sleep(SCHEDULER_INTERVAL_SECS)
@@ -0,0 +1,217 @@
+from datetime import datetime, timedelta
+import unittest
+from unittest.mock import MagicMock, patch
+
+from wp1.base_redis_test import BaseRedisTest
+from wp1.constants import (SCHEDULER_MAX_MEGA_PROJECTS,
+                           SCHEDULER_MEGA_PROJECT_ARTICLES,
+                           SCHEDULER_MIN_ESTIMATE_SECS, SCHEDULER_QUEUE_TARGET,
+                           SCHEDULER_SECS_PER_ARTICLE, TS_FORMAT_WP10,
+                           UPDATE_FAILURE_BACKOFF_SECS)
+from wp1.environment import Environment
+from wp1.logic import project as logic_project
+from wp1.models.wp10.project import Project
+from wp1 import queues
+from wp1 import scheduler
+
+NOW = datetime(2018, 12, 25, 5, 55, 55)
+
+
+def _project(name, hours_ago, count=100):
+  ts = (NOW - timedelta(hours=hours_ago)).strftime(TS_FORMAT_WP10)
+  return Project(p_project=name, p_timestamp=ts.encode('utf-8'), p_count=count)
+
+
+class EstimateTest(unittest.TestCase):
+
+  def test_estimate_from_duration(self):
+    project = _project(b'Water', 24)
+    self.assertEqual(
+        120, scheduler.estimate_secs(project, {
+            b'Water': 120,
+            b'Air': 5
+        }))
+
+  def test_estimate_from_count(self):
+    project = _project(b'Water', 24, count=100000)
+    self.assertEqual(100000 * SCHEDULER_SECS_PER_ARTICLE,
+                     scheduler.estimate_secs(project, {}))
+
+  def test_estimate_minimum(self):
+    project = _project(b'Water', 24, count=None)
+    self.assertEqual(SCHEDULER_MIN_ESTIMATE_SECS,
+                     scheduler.estimate_secs(project, {}))
+
+  def test_is_mega_project(self):
+    self.assertTrue(
+        scheduler.is_mega_project(
+            _project(b'Water', 24, count=SCHEDULER_MEGA_PROJECT_ARTICLES), {}))
+    self.assertTrue(
+        scheduler.is_mega_project(_project(b'Water', 24), {b'Water': 3600}))
+    self.assertFalse(scheduler.is_mega_project(_project(b'Water', 24), {}))
+
+
+class RankProjectsTest(unittest.TestCase):
+
+  def _rank(self, projects, durations=None):
+    return [
+        project.p_project
+        for project in scheduler.rank_projects(projects, durations or {}, NOW)
+    ]
+
+  def test_skips_fresh_projects(self):
+    self.assertEqual([b'Stale'],
+                     self._rank([_project(b'Fresh', 1),
+                                 _project(b'Stale', 22)]))
+
+  def test_small_projects_first(self):
+    self.assertEqual([b'Small', b'Large'],
+                     self._rank([
+                         _project(b'Large', 22, count=50000),
+                         _project(b'Small', 21, count=100),
+                     ]))
+
+  def test_uses_durations(self):
+    self.assertEqual([b'Fast', b'Slow'],
+                     self._rank([_project(b'Slow', 22),
+                                 _project(b'Fast', 22)], {
+                                     b'Slow': 600,
+                                     b'Fast': 20
+                                 }))
+
+  def test_overdue_projects_first(self):
+    self.assertEqual([b'Never', b'Overdue', b'Small'],
+                     self._rank([
+                         _project(b'Small', 21, count=100),
+                         _project(b'Overdue', 40, count=500000),
+                         Project(p_project=b'Never', p_timestamp=None),
+                     ]))
+
+
+class FreshnessTest(unittest.TestCase):
+
+  def test_freshness_percentile(self):
+    projects = [_project(b'P%d' % i, i) for i in range(1, 21)]
+    self.assertEqual(11 * 3600,
+                     scheduler.freshness_percentile(projects, NOW, 50))
+    self.assertEqual(20 * 3600,
+                     scheduler.freshness_percentile(projects, NOW, 95))
+
+  def test_freshness_percentile_empty(self):
+    self.assertEqual(0, scheduler.freshness_percentile([], NOW, 95))
+
+
+@patch('wp1.queues.ENV', Environment.DEVELOPMENT)
+@patch('wp1.scheduler.logic_project.list_all_projects')
+class ScheduleTest(BaseRedisTest):
+
+  def setUp(self):
+    super().setUp()
+    self.update_q, self.upload_q = queues._get_queues(self.redis)
+
+  def _schedule(self, project_names):
+    return scheduler.schedule(self.redis,
+                              None,
+                              project_names,
+                              self.update_q,
+                              self.upload_q,
+                              now=NOW)
+
+  def test_enqueues_due_projects(self, patched_list):
+    patched_list.return_value = [_project(b'Fresh', 1), _project(b'Stale', 22)]
+
+    actual = self._schedule([b'Fresh', b'Stale', b'New'])
+
+    self.assertEqual([b'New', b'Stale'], actual)
+    self.assertEqual(2, self.update_q.count)
+
+  def test_skips_in_flight_projects(self, patched_list):
+    patched_list.return_value = [_project(b'Stale', 22)]
+
+    self._schedule([b'Stale'])
+    actual = self._schedule([b'Stale'])
+
+    self.assertEqual([], actual)
+    self.assertEqual(1, self.update_q.count)
+
+  def test_tops_up_to_target(self, patched_list):
+    names = [b'P%d' % i for i in range(SCHEDULER_QUEUE_TARGET + 5)]
+    patched_list.return_value = [_project(name, 22) for name in names]
+
+    first = self._schedule(names)
+    second = self._schedule(names)
+
+    self.assertEqual(SCHEDULER_QUEUE_TARGET, len(first))
+    self.assertEqual([], second)
+    self.assertEqual(SCHEDULER_QUEUE_TARGET, self.update_q.count)
+
+  def test_caps_mega_projects(self, patched_list):
+    names = [b'Mega%d' % i for i in range(SCHEDULER_MAX_MEGA_PROJECTS + 1)]
+    patched_list.return_value = [
+        _project(name, 40, count=SCHEDULER_MEGA_PROJECT_ARTICLES)
+        for name in names
+    ] + [_project(b'Small', 22)]
+
+    actual = self._schedule(names + [b'Small'])
+
+    self.assertEqual(names[:SCHEDULER_MAX_MEGA_PROJECTS] + [b'Small'], actual)
+
+  def test_mega_projects_after_one_ends(self, patched_list):
+    names = [b'Mega%d' % i for i in range(SCHEDULER_MAX_MEGA_PROJECTS + 1)]
+    patched_list.return_value = [
+        _project(name, 40, count=SCHEDULER_MEGA_PROJECT_ARTICLES)
+        for name in names
+    ]
+    self._schedule(names)
+
+    logic_project.clear_project_in_flight(self.redis, names[0])
+    actual = self._schedule(names)
+
+    self.assertEqual([names[0]], actual)
+
+  @patch('wp1.logic.project.utcnow', return_value=NOW)
+  @patch('wp1.logic.project.wiki_connect', MagicMock())
+  @patch('wp1.logic.project.wp10_connect', MagicMock())
+  @patch('wp1.logic.project.get_project_by_name', MagicMock())
+  @patch('wp1.logic.project.update_project',
+         side_effect=Exception('Update failed'))
+  @patch('wp1.logic.project.redis_connect')
+  def _fail_update(self, project_name, patched_redis_connect,
+                   patched_update_project, patched_utcnow):
+    patched_redis_connect.return_value = self.redis
+    self.update_q.empty()
+    with self.assertRaises(Exception):
+      logic_project.update_project_by_name(project_name)
+
+  def test_skips_failed_projects(self, patched_list):
+    patched_list.return_value = [_project(b'Stale', 22)]
+    self._schedule([b'Stale'])
+    self._fail_update(b'Stale')
+
+    actual = scheduler.schedule(self.redis,
+                                None, [b'Stale'],
+                                self.update_q,
+                                self.upload_q,
+                                now=NOW + timedelta(seconds=30))
+
+    self.assertEqual([], actual)
+    self.assertEqual(0, self.update_q.count)
+
+  @patch('wp1.queues.utcnow')
+  def test_failed_projects_after_backoff(self, patched_utcnow, patched_list):
+    patched_list.return_value = [_project(b'Stale', 22)]
+    patched_utcnow.return_value = NOW
+    self._schedule([b'Stale'])
+    failed_job_id = self.update_q.get_job_ids()[0]
+    self._fail_update(b'Stale')
+
+    later = NOW + timedelta(seconds=UPDATE_FAILURE_BACKOFF_SECS)
+    patched_utcnow.return_value = later
+    actual = scheduler.schedule(self.redis,
+                                None, [b'Stale'],
+                                self.update_q,
+                                self.upload_q,
+                                now=later)
+
+    self.assertEqual([b'Stale'], actual)
+    self.assertNotEqual(failed_job_id, self.update_q.get_job_ids()[0])
@@ -9,6 +9,7 @@ from redis import Redis
 from wp1 import api
 from wp1.conf import get_conf
 from wp1.constants import LIST_URL, LIST_V2_URL, WIKI_BASE
+from wp1.logic import global_articles as logic_global_articles, project_stats as logic_project_stats
 from wp1.models.wp10.category import Category
 from wp1.models.wp10.rating import Rating
 from wp1.templates import env as jinja_env
@@ -90,32 +91,31 @@ def get_global_categories():
 
 
 def get_global_stats(wp10db):
+  """Returns the number of global articles by quality and importance.
+
+  The counts are read from global_stats, which the updates of global_articles
+  maintain. Until it is first filled, the global articles are counted
+  instead.
+  """
   wp10db.ping()
-  with wp10db.cursor() as cursor:
-    cursor.execute('''
-        SELECT count(distinct a_article) AS n,
-               grq.gr_rating AS q, gri.gr_rating AS i
-        FROM global_articles
-          JOIN global_rankings AS grq
-            ON grq.gr_type = 'quality' AND grq.gr_ranking = a_quality
-          JOIN global_rankings AS gri
-            ON gri.gr_type = 'importance' AND gri.gr_ranking = a_importance
-        GROUP BY grq.gr_rating, gri.gr_rating
-    ''')
-    return cursor.fetchall()
+  stats = logic_global_articles.get_global_stats(wp10db)
+  if not stats:
+    stats = logic_global_articles.count_global_stats(wp10db)
+  return stats
 
 
 def get_project_stats(wp10db, project_name):
+  """Returns the number of ratings of a project by quality and importance.
+
+  The counts are read from project_stats, which project updates maintain.
+  Projects that have no stored counts, because they weren't updated since it
+  was added, have their ratings counted instead.
+  """
   wp10db.ping()
-  with wp10db.cursor() as cursor:
-    cursor.execute(
-        '''
-        SELECT count(r_article) AS n, r_quality AS q, r_importance AS i,
-               r_project AS project
-        FROM ratings
-        WHERE r_project = %s GROUP BY r_quality, r_importance, r_project
-    ''', (project_name,))
-    return cursor.fetchall()
+  stats = logic_project_stats.get_project_stats(wp10db, project_name)
+  if not stats:
+    stats = logic_project_stats.count_project_stats(wp10db, project_name)
+  return stats
 
 
 def db_project_categories(wp10db, project_name):
@@ -400,10 +400,10 @@ def upload_project_table(project_name):
     wikicode = create_wikicode(table_data)
     page_name = ('User:WP 1.0 bot/Tables/Project/%s' %
                  project_name.decode('utf-8'))
-    page = api.get_page(page_name)
     logger.info('Uploading wikicode to Wikipedia: %s',
                 project_name.decode('utf-8'))
-    api.save_page(page, wikicode, 'Copying assessment table to wiki.')
+    api.save_page_if_changed(page_name, wikicode,
+                             'Copying assessment table to wiki.')
   finally:
     if wp10db is not None:
       wp10db.close()
@@ -419,8 +419,8 @@ def upload_global_table():
     wikicode = create_wikicode(table_data)
     page_name = 'User:WP 1.0 bot/Tables/OverallArticles'
     logger.info('Uploading wikicode to Wikipedia: global table')
-    page = api.get_page(page_name)
-    api.save_page(page, wikicode, 'Copying assessment table to wiki.')
+    api.save_page_if_changed(page_name, wikicode,
+                             'Copying assessment table to wiki.')
   finally:
     if wp10db is not None:
       wp10db.close()
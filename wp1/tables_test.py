@@ -4,11 +4,12 @@ import unittest
 from unittest.mock import patch, MagicMock
 
 import attr
+import mwclient
 
 from wp1 import tables
 from wp1 import templates
 from wp1.base_db_test import BaseWpOneDbTest
-from wp1.constants import AssessmentKind, CATEGORY_NS_INT, GLOBAL_TIMESTAMP_WIKI, TS_FORMAT
+from wp1.constants import AssessmentKind, CATEGORY_NS_INT, EDIT_MAX_ATTEMPTS, GLOBAL_TIMESTAMP_WIKI, TS_FORMAT
 from wp1.models.wp10.category import Category
 from wp1.models.wp10.rating import Rating
 
@@ -435,6 +436,17 @@ class TablesDbTest(BaseWpOneDbTest):
     actual = [tuple(x.items()) for x in actual]
     self.assertEqual(expected, actual)
 
+  def test_get_global_stats_stored(self):
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('''
+          INSERT INTO global_stats (gs_quality, gs_importance, gs_count)
+          VALUES ('500', '400', 7), ('100', '100', 0)
+      ''')
+    self.wp10db.commit()
+
+    actual = tables.get_global_stats(self.wp10db)
+    self.assertEqual([{'n': 7, 'q': b'FA-Class', 'i': b'Top-Class'}], actual)
+
   def test_get_project_stats(self):
     expected = [{
         'n': 3,
@@ -482,6 +494,23 @@ class TablesDbTest(BaseWpOneDbTest):
     actual = [tuple(x.items()) for x in actual]
     self.assertEqual(sorted(expected), sorted(actual))
 
+  def test_get_project_stats_stored(self):
+    with self.wp10db.cursor() as cursor:
+      cursor.execute('''
+          INSERT INTO project_stats
+            (ps_project, ps_quality, ps_importance, ps_count)
+          VALUES ('Test Project', 'FA-Class', 'Top-Class', 7)
+      ''')
+    self.wp10db.commit()
+
+    actual = tables.get_project_stats(self.wp10db, b'Test Project')
+    self.assertEqual([{
+        'n': 7,
+        'q': b'FA-Class',
+        'i': b'Top-Class',
+        'project': b'Test Project'
+    }], actual)
+
   def test_db_project_categories(self):
     actual = tables.db_project_categories(self.wp10db, b'Catholicism')
     expected = sorted(self.project_categories, key=lambda x: x['c_ranking'])
@@ -757,6 +786,8 @@ class TablesDbTest(BaseWpOneDbTest):
       tables.upload_project_table(b'Catholicism')
     finally:
       self.wp10db.close = orig_close
+    call = patched_site.save_page_if_changed.call_args[0]
+    self.assertEqual('User:WP 1.0 bot/Tables/Project/Catholicism', call[0])
 
   @patch('wp1.tables.api')
   @patch('wp1.tables.wp10_connect')
@@ -770,6 +801,27 @@ class TablesDbTest(BaseWpOneDbTest):
       self.wp10db.close = orig_close
 
 
+class UploadTableTest(unittest.TestCase):
+
+  @patch('wp1.tables.wp10_connect')
+  @patch('wp1.tables.generate_project_table_data')
+  @patch('wp1.tables.create_wikicode', return_value='<code>')
+  @patch('wp1.api.get_edit_hashes', return_value=None)
+  @patch('wp1.api.get_edit_throttle')
+  @patch('wp1.api.get_page')
+  @patch('wp1.api.site')
+  def test_upload_project_table_edit_fails(self, patched_site, patched_get_page,
+                                           patched_throttle, patched_hashes,
+                                           patched_wikicode, patched_generate,
+                                           patched_connect):
+    page = patched_get_page.return_value
+    page.save.side_effect = mwclient.errors.MaximumRetriesExceeded()
+
+    with self.assertRaises(mwclient.errors.MaximumRetriesExceeded):
+      tables.upload_project_table(b'Catholicism')
+    self.assertEqual(EDIT_MAX_ATTEMPTS, page.save.call_count)
+
+
 class TestMakeWikiLink(unittest.TestCase):
 
   def test_creates_link(self):
@@ -5,8 +5,10 @@ DROP TABLE IF EXISTS `moves`;
 DROP TABLE IF EXISTS `projects`;
 DROP TABLE IF EXISTS `namespacename`;
 DROP TABLE IF EXISTS `releases`;
+DROP TABLE IF EXISTS `project_stats`;
 DROP TABLE IF EXISTS `global_articles`;
 DROP TABLE IF EXISTS `global_rankings`;
+DROP TABLE IF EXISTS `global_stats`;
 DROP TABLE IF EXISTS `users`;
 DROP TABLE IF EXISTS `builders`;
 DROP TABLE IF EXISTS `selections`;
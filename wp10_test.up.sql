@@ -7,6 +7,7 @@ CREATE TABLE `ratings` (
   `r_importance` varbinary(63) DEFAULT NULL,
   `r_importance_timestamp` binary(20) DEFAULT NULL,
   `r_score` int(8) unsigned  NOT NULL DEFAULT '0',
+  `r_page_id` int(8) unsigned DEFAULT NULL,
   PRIMARY KEY (`r_project`,`r_namespace`,`r_article`)
 );
 
@@ -52,6 +53,8 @@ CREATE TABLE `projects` (
   `p_icount` int(10) unsigned DEFAULT '0',
   `p_scope` int(10) unsigned NOT NULL DEFAULT '0',
   `p_upload_timestamp` binary(14) DEFAULT NULL,
+  `p_fingerprint` varbinary(40) DEFAULT NULL,
+  `p_full_timestamp` binary(14) DEFAULT NULL,
   PRIMARY KEY (`p_project`)
 );
 
@@ -72,6 +75,14 @@ CREATE TABLE `releases` (
   PRIMARY KEY (`rel_article`)
 );
 
+CREATE TABLE `project_stats` (
+  `ps_project` varbinary(63) NOT NULL,
+  `ps_quality` varbinary(63) NOT NULL,
+  `ps_importance` varbinary(63) NOT NULL,
+  `ps_count` int(10) NOT NULL DEFAULT '0',
+  PRIMARY KEY (`ps_project`,`ps_quality`,`ps_importance`)
+);
+
 CREATE TABLE `global_articles` (
   `a_article` varbinary(255) NOT NULL,
   `a_quality` varbinary(63) NOT NULL,
@@ -80,6 +91,13 @@ CREATE TABLE `global_articles` (
   PRIMARY KEY (`a_article`)
 );
 
+CREATE TABLE `global_stats` (
+  `gs_quality` varbinary(63) NOT NULL,
+  `gs_importance` varbinary(63) NOT NULL,
+  `gs_count` int(10) NOT NULL DEFAULT '0',
+  PRIMARY KEY (`gs_quality`,`gs_importance`)
+);
+
 CREATE TABLE `global_rankings` (
   `gr_type` varbinary(16) NOT NULL,
   `gr_rating` varbinary(63) NOT NULL,